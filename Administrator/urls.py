@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import DeleteUserView,GetUserByIdView,GetAllUsersView,GetUserByUsernameView,EditUserView,ToggleLoyaltyPointsView,ToggleCuponsView
+from .views import DeleteUserView,GetUserByIdView,GetAllUsersView,GetUserByUsernameView,EditUserView,ToggleLoyaltyPointsView,ToggleCuponsView,OrderStageStatsView
 
 urlpatterns = [
     path('deleteUser/',DeleteUserView.as_view(),name='delete_user'),
@@ -8,5 +8,6 @@ urlpatterns = [
     path('getUserByUsername/<str:username>/',GetUserByUsernameView.as_view(),name='getuserbyusername'),
     path('editUserById/<int:user_id>/',EditUserView.as_view(),name= 'edituserbyid'),
     path('changeRestaurantPoints/<int:restaurante_id>',ToggleLoyaltyPointsView.as_view(),name='changeRestaurantePoints'),
-    path('changeRestaurantCupons/<int:restaurante_id>',ToggleCuponsView.as_view(),name='changeRestauranteCupons')
+    path('changeRestaurantCupons/<int:restaurante_id>',ToggleCuponsView.as_view(),name='changeRestauranteCupons'),
+    path('orderStageStats/',OrderStageStatsView.as_view(),name='orderstagestats')
 ]
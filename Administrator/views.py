@@ -9,6 +9,10 @@ from RestauranteData.models import Restaurante
 from Authentication.serializers import RegisterSerializer,EditUserSerializer
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from datetime import timedelta
+from django.utils import timezone
+from Pedidos.models import LatenciaEtapa
+from Pedidos.latencias import inicio_de_hora
 
 class DeleteUserView(APIView):
     """
@@ -331,4 +335,67 @@ class ToggleCuponsView(APIView):
             {"message": f"Cupones {'activados' if restaurante.cupons else 'desactivados'}.", 
              "cupons": restaurante.cupons},
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+class OrderStageStatsView(APIView):
+    """
+    Vista con los percentiles por hora del tiempo que los pedidos pasan en cada estado.
+    """
+    @swagger_auto_schema(
+        operation_description="Devuelve p50/p90/p99 (segundos) e histograma por hora y por estado del pedido, según el último resumen de resumir_latencias.",
+        manual_parameters=[
+            openapi.Parameter('horas', openapi.IN_QUERY, description="Horas hacia atrás a devolver (por defecto 24, máximo 720).", type=openapi.TYPE_INTEGER)
+        ],
+        responses={
+            200: openapi.Response(
+                description="Estadísticas por etapa",
+                examples={
+                    "application/json": {
+                        "horas": [
+                            {"hora": "2024-12-03T10:00:00Z", "etapa": "Cocina", "cantidad": 42, "p50": 540.0, "p90": 1020.0, "p99": 1500.0,
+                             "histograma": {"300": 5, "600": 20, "900": 10, "1200": 5, "1800": 2}}
+                        ],
+                        "etapas": [
+                            {"etapa": "Cocina", "cantidad": 42, "histograma": {"300": 5, "600": 20, "900": 10, "1200": 5, "1800": 2}}
+                        ]
+                    }
+                }
+            ),
+            400: openapi.Response('El parámetro horas debe ser un entero entre 1 y 720.'),
+        }
+    )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            horas = int(request.query_params.get('horas', 24))
+        except ValueError:
+            horas = 0
+        if not 1 <= horas <= 720:
+            return Response({"error": "El parámetro horas debe ser un entero entre 1 y 720."}, status=status.HTTP_400_BAD_REQUEST)
+
+        desde = inicio_de_hora(timezone.now()) - timedelta(hours=horas - 1)
+        filas = LatenciaEtapa.objects.filter(hora__gte=desde).order_by('hora', 'etapa')
+
+        # Totales por etapa sumando los histogramas de cada hora
+        etapas = {}
+        for fila in filas:
+            total = etapas.setdefault(fila.etapa, {"etapa": fila.get_etapa_display(), "cantidad": 0, "histograma": {}})
+            total["cantidad"] += fila.cantidad
+            for tramo, cantidad in fila.histograma.items():
+                total["histograma"][tramo] = total["histograma"].get(tramo, 0) + cantidad
+
+        return Response({
+            "horas": [
+                {
+                    "hora": fila.hora,
+                    "etapa": fila.get_etapa_display(),
+                    "cantidad": fila.cantidad,
+                    "p50": fila.p50,
+                    "p90": fila.p90,
+                    "p99": fila.p99,
+                    "histograma": fila.histograma,
+                }
+                for fila in filas
+            ],
+            "etapas": [etapas[etapa] for etapa in sorted(etapas)],
+        }, status=status.HTTP_200_OK)
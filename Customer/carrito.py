@@ -0,0 +1,356 @@
+#Customer/carrito.py
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When, Window
+from django.db.models.functions import Cast
+from django.utils import timezone
+from RestauranteData.models import FoodItem
+from .models import Cart, CartItem
+
+# Carrito vivo de cada cliente en modo cache: {food_item_id: cantidad}
+CARRITO_KEY = 'carrito:{}'
+# Marca de que el carrito en cache cambió desde la última vez que se guardó en la base
+SUCIO_KEY = 'carrito:{}:sucio'
+# Bloqueo del carrito en cache: lo toman los cambios del cliente, el checkout y guardar_carritos
+BLOQUEO_KEY = 'carrito:{}:bloqueo'
+# Marca de que hay un checkout del carrito sin confirmar: guardar_carritos no lo escribe en la base
+CHECKOUT_KEY = 'carrito:{}:checkout'
+# Precios y totales del carrito en Decimal con centavos, como Pedido.Total
+CENTAVO = Decimal('0.01')
+DINERO = DecimalField(max_digits=12, decimal_places=2)
+# Vida máxima del bloqueo si el proceso que lo tomó se cae sin soltarlo
+BLOQUEO_SEGUNDOS = 10
+# Vida máxima de la marca de checkout si la transacción del pedido se revierte
+CHECKOUT_SEGUNDOS = 60
+
+
+def _combinar(actuales, cambios):
+    # Cantidad final de cada item tocado; 0 significa que sale del carrito
+    finales = {}
+    for food_item_id, cantidad, es_delta in cambios:
+        base = finales.get(food_item_id, actuales.get(food_item_id, 0)) if es_delta else 0
+        finales[food_item_id] = max(base + cantidad, 0)
+    return finales
+
+
+class CarritoDB:
+    """Carrito guardado directamente en Cart/CartItem: cada cambio es una escritura en la base."""
+
+    def __init__(self, customer):
+        self.customer = customer
+
+    def _cart_id(self):
+        # Lanza Cart.DoesNotExist si el cliente no tiene carrito
+        return Cart.objects.values_list('id', flat=True).get(customer=self.customer)
+
+    def agregar(self, food_item_id, cantidad):
+        cart_item, created = CartItem.objects.get_or_create(
+            cart_id=self._cart_id(), food_item_id=food_item_id, defaults={'quantity': cantidad}
+        )
+        if not created:
+            CartItem.objects.filter(id=cart_item.id).update(quantity=F('quantity') + cantidad, updated_at=timezone.now())
+
+    def cantidades(self):
+        return dict(CartItem.objects.filter(cart__customer=self.customer).values_list('food_item_id', 'quantity'))
+
+    def quitar(self, food_item_id):
+        """Saca el item del carrito; devuelve False si no estaba."""
+        borrados, _ = CartItem.objects.filter(cart__customer=self.customer, food_item_id=food_item_id).delete()
+        return bool(borrados)
+
+    def aplicar_cambios(self, cambios):
+        """
+        Aplica varios cambios de una vez. cambios: lista de (food_item_id, cantidad, es_delta);
+        con es_delta la cantidad se suma a la actual, si no la reemplaza. Los items que quedan
+        en 0 o menos se sacan. Devuelve {food_item_id: cantidad final}.
+
+        Son cuatro consultas sin importar cuántos cambios haya: bloqueo del carrito, lectura
+        de las cantidades actuales, un upsert y un DELETE.
+        """
+        food_item_ids = {food_item_id for food_item_id, _, _ in cambios}
+        with transaction.atomic():
+            # El bloqueo del carrito ordena los cambios simultáneos del mismo cliente
+            cart_id = Cart.objects.select_for_update().values_list('id', flat=True).get(customer=self.customer)
+            actuales = dict(
+                CartItem.objects.filter(cart_id=cart_id, food_item_id__in=food_item_ids).values_list('food_item_id', 'quantity')
+            )
+            finales = _combinar(actuales, cambios)
+
+            CartItem.objects.bulk_create(
+                [CartItem(cart_id=cart_id, food_item_id=food_item_id, quantity=cantidad)
+                 for food_item_id, cantidad in finales.items() if cantidad],
+                update_conflicts=True,
+                unique_fields=['cart', 'food_item'],
+                update_fields=['quantity', 'updated_at'],
+            )
+            sin_cantidad = [food_item_id for food_item_id, cantidad in finales.items() if not cantidad]
+            if sin_cantidad:
+                CartItem.objects.filter(cart_id=cart_id, food_item_id__in=sin_cantidad).delete()
+        return finales
+
+    def lineas(self):
+        """
+        CartItems del carrito con su FoodItem ya cargado, en una consulta. Cada uno trae
+        total_linea (cantidad * precio) y total_carrito (suma de todas las líneas) calculados
+        en la base, en Decimal con dos decimales.
+        """
+        # unitPrice es float: se pasa a centavos antes de multiplicar para no arrastrar el error
+        total_linea = F('quantity') * Cast('food_item__unitPrice', DecimalField(max_digits=10, decimal_places=2))
+        return list(
+            CartItem.objects.filter(cart__customer=self.customer)
+                            .select_related('food_item')
+                            .annotate(
+                                total_linea=ExpressionWrapper(total_linea, output_field=DINERO),
+                                total_carrito=Window(Sum(total_linea, output_field=DINERO)),
+                            )
+                            .order_by('id')
+        )
+
+    def vaciar(self, lineas):
+        """
+        Saca del carrito lo comprado en `lineas` (las que devolvió lineas()) después del
+        checkout; usar dentro de la transacción del pedido. Se resta la cantidad comprada de
+        cada CartItem leído, así lo que el cliente agregó después de la lectura queda.
+        Son tres consultas sin importar cuántas líneas haya.
+        """
+        compradas = {linea.id: linea.quantity for linea in lineas}
+        if not compradas:
+            return
+        # El mismo bloqueo que aplicar_cambios: un lote simultáneo no reescribe lo comprado
+        Cart.objects.select_for_update().filter(customer=self.customer).values_list('id', flat=True).first()
+        items = CartItem.objects.filter(id__in=compradas)
+        items.update(quantity=F('quantity') - Case(
+            *[When(id=cart_item_id, then=Value(cantidad)) for cart_item_id, cantidad in compradas.items()],
+            output_field=IntegerField(),
+        ))
+        items.filter(quantity__lte=0).delete()
+
+    def guardar(self):
+        """En este modo el carrito ya está en la base."""
+
+
+def _tomar_bloqueo(customer_id):
+    """Intenta tomar el bloqueo del carrito con un add atómico; devuelve el token o None si otro lo tiene."""
+    token = uuid.uuid4().hex
+    if cache.add(BLOQUEO_KEY.format(customer_id), token, BLOQUEO_SEGUNDOS):
+        return token
+    return None
+
+
+def _soltar_bloqueo(customer_id, token):
+    key = BLOQUEO_KEY.format(customer_id)
+    # Si venció y otro lo tomó, no se borra el suyo
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+@contextmanager
+def bloqueo_carrito(customer_id):
+    """Espera el bloqueo del carrito (a lo sumo BLOQUEO_SEGUNDOS, cuando vence solo) y lo suelta al salir."""
+    token = _tomar_bloqueo(customer_id)
+    while token is None:
+        time.sleep(0.01)
+        token = _tomar_bloqueo(customer_id)
+    try:
+        yield
+    finally:
+        _soltar_bloqueo(customer_id, token)
+
+
+class CarritoCache(CarritoDB):
+    """
+    Carrito vivo en la cache como un dict {food_item_id: cantidad}. Agregar o quitar no
+    escribe en la base: Cart/CartItem se actualizan en el checkout o con `guardar_carritos`.
+    Si la cache no tiene el carrito se lee una vez desde CartItem.
+
+    Cada cambio lee y reescribe el dict con el bloqueo del carrito tomado (bloqueo_carrito),
+    así dos cambios simultáneos del mismo cliente no se pisan.
+    """
+
+    def _key(self):
+        return CARRITO_KEY.format(self.customer.id)
+
+    def cantidades(self):
+        cantidades = cache.get(self._key())
+        if cantidades is None:
+            cantidades = super().cantidades()
+            # add: si otro proceso ya cargó o cambió el carrito no se lo pisa
+            cache.add(self._key(), cantidades, settings.CART_CACHE_TIMEOUT)
+        return cantidades
+
+    def _escribir(self, cantidades):
+        cache.set_many({
+            self._key(): cantidades,
+            SUCIO_KEY.format(self.customer.id): True,
+        }, settings.CART_CACHE_TIMEOUT)
+
+    def agregar(self, food_item_id, cantidad):
+        with bloqueo_carrito(self.customer.id):
+            cantidades = self.cantidades()
+            cantidades[food_item_id] = cantidades.get(food_item_id, 0) + cantidad
+            self._escribir(cantidades)
+
+    def quitar(self, food_item_id):
+        with bloqueo_carrito(self.customer.id):
+            cantidades = self.cantidades()
+            if cantidades.pop(food_item_id, None) is None:
+                return False
+            self._escribir(cantidades)
+            return True
+
+    def aplicar_cambios(self, cambios):
+        with bloqueo_carrito(self.customer.id):
+            cantidades = self.cantidades()
+            finales = _combinar(cantidades, cambios)
+            for food_item_id, cantidad in finales.items():
+                if cantidad:
+                    cantidades[food_item_id] = cantidad
+                else:
+                    cantidades.pop(food_item_id, None)
+            self._escribir(cantidades)
+        return finales
+
+    def lineas(self):
+        # CartItems sin guardar, con la misma forma que los de la base
+        cantidades = self.cantidades()
+        food_items = FoodItem.objects.in_bulk(list(cantidades))
+        lineas = [
+            CartItem(food_item=food_items[food_item_id], quantity=cantidad)
+            for food_item_id, cantidad in cantidades.items() if food_item_id in food_items
+        ]
+        # Los totales se calculan aquí porque las líneas no salen de la base, igual que en CarritoDB
+        total_carrito = Decimal('0.00')
+        for linea in lineas:
+            linea.total_linea = linea.quantity * Decimal(str(linea.food_item.unitPrice)).quantize(CENTAVO)
+            total_carrito += linea.total_linea
+        for linea in lineas:
+            linea.total_carrito = total_carrito
+        return lineas
+
+    def _restar_compradas(self, cantidades, compradas):
+        for food_item_id, cantidad in compradas.items():
+            restante = cantidades.get(food_item_id, 0) - cantidad
+            if restante > 0:
+                cantidades[food_item_id] = restante
+            else:
+                cantidades.pop(food_item_id, None)
+        return cantidades
+
+    def vaciar(self, lineas):
+        """
+        Saca del carrito lo comprado en `lineas`; usar dentro de la transacción del pedido.
+
+        Con el bloqueo tomado marca el carrito en checkout (guardar_carritos lo saltea hasta
+        que el pedido confirme o la marca venza) y escribe en CartItem el carrito sin lo
+        comprado, en la misma transacción. La cache se actualiza recién cuando el pedido
+        confirma, restando lo comprado de lo que haya en ese momento: lo agregado mientras
+        tanto queda. Si el pedido se revierte, la cache no se tocó.
+        """
+        compradas = {}
+        for linea in lineas:
+            compradas[linea.food_item_id] = compradas.get(linea.food_item_id, 0) + linea.quantity
+        customer_id = self.customer.id
+
+        with bloqueo_carrito(customer_id):
+            cache.set(CHECKOUT_KEY.format(customer_id), True, CHECKOUT_SEGUNDOS)
+            escribir_en_base({customer_id: self._restar_compradas(dict(self.cantidades()), compradas)})
+
+        def confirmar():
+            with bloqueo_carrito(customer_id):
+                cantidades = cache.get(self._key())
+                if cantidades is not None:
+                    self._escribir(self._restar_compradas(cantidades, compradas))
+                cache.delete(CHECKOUT_KEY.format(customer_id))
+        transaction.on_commit(confirmar)
+
+    def guardar(self):
+        _guardar_en_base([self.customer.id])
+
+
+def escribir_en_base(carritos):
+    """Reemplaza los CartItem de cada cliente ({customer_id: {food_item_id: cantidad}}) en una transacción."""
+    food_item_ids = set(FoodItem.objects.filter(
+        id__in={food_item_id for cantidades in carritos.values() for food_item_id in cantidades}
+    ).values_list('id', flat=True))
+
+    with transaction.atomic():
+        cart_ids = dict(Cart.objects.filter(customer_id__in=carritos).values_list('customer_id', 'id'))
+        faltantes = [Cart(customer_id=customer_id) for customer_id in carritos if customer_id not in cart_ids]
+        for cart in Cart.objects.bulk_create(faltantes):
+            cart_ids[cart.customer_id] = cart.id
+
+        CartItem.objects.filter(cart_id__in=cart_ids.values()).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_ids[customer_id], food_item_id=food_item_id, quantity=cantidad)
+            for customer_id, cantidades in carritos.items()
+            for food_item_id, cantidad in cantidades.items() if food_item_id in food_item_ids
+        ])
+
+
+def _guardar_en_base(customer_ids):
+    """
+    Escribe en la base el carrito en cache de cada cliente. Solo los que se pudieron bloquear
+    y no tienen un checkout sin confirmar: mientras el bloqueo está tomado ningún cambio ni
+    checkout los toca, así no se escribe un carrito viejo encima de lo que dejó un pedido.
+    Los salteados quedan marcados como sucios para la próxima vuelta.
+    """
+    bloqueos = {}
+    try:
+        for customer_id in customer_ids:
+            token = _tomar_bloqueo(customer_id)
+            if token is not None:
+                bloqueos[customer_id] = token
+        en_checkout = cache.get_many([CHECKOUT_KEY.format(customer_id) for customer_id in bloqueos])
+        listos = [customer_id for customer_id in bloqueos if CHECKOUT_KEY.format(customer_id) not in en_checkout]
+        if not listos:
+            return 0
+
+        # La marca se borra antes de escribir: un cambio posterior vuelve a marcar el carrito
+        cache.delete_many([SUCIO_KEY.format(customer_id) for customer_id in listos])
+        carritos = {
+            int(key.split(':')[1]): cantidades
+            for key, cantidades in cache.get_many([CARRITO_KEY.format(customer_id) for customer_id in listos]).items()
+        }
+        if carritos:
+            escribir_en_base(carritos)
+        return len(carritos)
+    finally:
+        for customer_id, token in bloqueos.items():
+            _soltar_bloqueo(customer_id, token)
+
+
+def guardar_carritos(tamano_lote=500):
+    """
+    Guarda en Cart/CartItem los carritos de la cache que cambiaron desde la última vez.
+    Recorre los clientes con carrito en lotes y usa get_many, así que no depende de poder
+    listar las claves de la cache. Los carritos bloqueados o en checkout se guardan en una
+    vuelta posterior. Devuelve cuántos carritos se guardaron.
+    """
+    guardados = 0
+    customer_ids = Cart.objects.order_by('customer_id').values_list('customer_id', flat=True)
+    ultimo = 0
+    while True:
+        lote = list(customer_ids.filter(customer_id__gt=ultimo)[:tamano_lote])
+        if not lote:
+            return guardados
+        ultimo = lote[-1]
+
+        sucios = [int(key.split(':')[1]) for key in cache.get_many([SUCIO_KEY.format(customer_id) for customer_id in lote])]
+        if sucios:
+            guardados += _guardar_en_base(sucios)
+
+
+BACKENDS = {
+    'db': CarritoDB,
+    'cache': CarritoCache,
+}
+
+
+def carrito_de(customer):
+    """Carrito del cliente con el backend configurado en CART_BACKEND ('db' o 'cache')."""
+    return BACKENDS[settings.CART_BACKEND](customer)
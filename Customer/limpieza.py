@@ -0,0 +1,68 @@
+#Customer/limpieza.py
+import time
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from Pedidos.models import IdempotencyKey
+from RestauranteData.Food_Item import FoodItemTombstone
+from .models import CartItem, Coupon, LoyaltyPoint
+from .puntos import vencer_puntos
+
+
+def borrar_en_tramos(queryset, tamano_tramo=1000, pausa=0):
+    """
+    Borra las filas del queryset en tramos de a lo sumo `tamano_tramo` filas, cada uno un
+    DELETE ... WHERE pk >= desde AND pk < hasta en su propia transacción, así ningún tramo
+    mantiene bloqueos mucho tiempo. Los límites de cada tramo salen de la PK de las filas
+    que cumplen el filtro, por lo que los huecos en los ids no generan vueltas vacías.
+
+    pausa: segundos de espera entre tramos para dejar pasar al resto del tráfico.
+    Devuelve la cantidad de filas borradas.
+    """
+    filas = queryset.order_by('pk').values_list('pk', flat=True)
+    borrados = 0
+    desde = filas.first()
+    while desde is not None:
+        # La PK de la fila número tamano_tramo marca el comienzo del próximo tramo
+        hasta = filas.filter(pk__gte=desde)[tamano_tramo:tamano_tramo + 1].first()
+        tramo = queryset.filter(pk__gte=desde)
+        if hasta is not None:
+            tramo = tramo.filter(pk__lt=hasta)
+
+        with transaction.atomic():
+            _, por_modelo = tramo.delete()
+        borrados += por_modelo.get(queryset.model._meta.label, 0)
+
+        desde = hasta
+        if desde is not None and pausa:
+            time.sleep(pausa)
+    return borrados
+
+
+def expirados():
+    """Querysets de lo que ya se puede borrar, por nombre."""
+    ahora = timezone.now()
+    return {
+        'cupones': Coupon.objects.filter(expires_at__lte=ahora),
+        # Solo lotes vencidos que el barrido ya dejó en 0; el historial queda en MovimientoPuntos
+        'puntos': LoyaltyPoint.objects.filter(expires_at__lte=ahora, remaining=0),
+        'carritos': CartItem.objects.filter(updated_at__lte=ahora - settings.CART_ITEM_TTL),
+        'borrados_menu': FoodItemTombstone.objects.filter(deleted_at__lte=ahora - settings.MENU_TOMBSTONE_TTL),
+        'idempotencia': IdempotencyKey.objects.filter(expires_at__lte=ahora),
+    }
+
+
+def limpiar_expirados(tamano_tramo=1000, pausa=0):
+    """
+    Vence los puntos pendientes y borra cupones expirados, lotes de puntos vencidos, items
+    de carritos abandonados, los borrados del menú más viejos que MENU_TOMBSTONE_TTL y las
+    Idempotency-Key vencidas. Devuelve [(nombre, filas borradas, segundos)].
+    """
+    vencer_puntos()
+
+    resultados = []
+    for nombre, queryset in expirados().items():
+        inicio = time.monotonic()
+        borrados = borrar_en_tramos(queryset, tamano_tramo, pausa)
+        resultados.append((nombre, borrados, time.monotonic() - inicio))
+    return resultados
@@ -0,0 +1,18 @@
+#Customer/management/commands/guardar_carritos.py
+from django.core.management.base import BaseCommand, CommandError
+from Customer.carrito import guardar_carritos
+
+
+class Command(BaseCommand):
+    help = "Guarda en Cart/CartItem los carritos que cambiaron en la cache (CART_BACKEND = 'cache'). Pensado para correr periódicamente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500,
+                            help="Clientes que se revisan por cada lectura de la cache (por defecto 500).")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser mayor o igual a 1.")
+
+        guardados = guardar_carritos(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Se guardaron {guardados} carritos."))
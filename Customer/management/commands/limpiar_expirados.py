@@ -0,0 +1,34 @@
+#Customer/management/commands/limpiar_expirados.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from Customer.limpieza import limpiar_expirados
+
+
+class Command(BaseCommand):
+    help = "Borra en tramos por rango de PK los cupones expirados, los lotes de puntos vencidos, los items de carritos abandonados, los borrados viejos del menú y las Idempotency-Key vencidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tramo', type=int, default=1000,
+                            help="Filas máximas por DELETE (por defecto 1000).")
+        parser.add_argument('--pausa', type=float, default=0,
+                            help="Segundos de espera entre tramos (por defecto 0).")
+        parser.add_argument('--cada', type=int, default=None,
+                            help="Repetir la limpieza cada N segundos en vez de correr una sola vez.")
+
+    def handle(self, *args, **options):
+        if options['tramo'] < 1:
+            raise CommandError("--tramo debe ser mayor o igual a 1.")
+        if options['pausa'] < 0:
+            raise CommandError("--pausa no puede ser negativa.")
+        if options['cada'] is not None and options['cada'] < 1:
+            raise CommandError("--cada debe ser mayor o igual a 1.")
+
+        while True:
+            for nombre, borrados, segundos in limpiar_expirados(options['tramo'], options['pausa']):
+                por_segundo = borrados / segundos if segundos else 0
+                self.stdout.write(f"{nombre}: {borrados} filas en {segundos:.2f} s ({por_segundo:.0f} filas/s)")
+            self.stdout.write(self.style.SUCCESS("Limpieza terminada."))
+
+            if options['cada'] is None:
+                return
+            time.sleep(options['cada'])
@@ -0,0 +1,18 @@
+#Customer/management/commands/vencer_puntos.py
+from django.core.management.base import BaseCommand, CommandError
+from Customer.puntos import vencer_puntos
+
+
+class Command(BaseCommand):
+    help = "Vence los puntos de lealtad de los lotes expirados y los descuenta del saldo de cada cliente. Pensado para correr periódicamente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500,
+                            help="Clientes que se procesan por transacción (por defecto 500).")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser mayor o igual a 1.")
+
+        clientes, puntos = vencer_puntos(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Vencieron {puntos} puntos de {clientes} clientes."))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unir_duplicados(apps, schema_editor):
+    # Las líneas repetidas de un mismo plato se suman en la más antigua antes de crear la restricción
+    CartItem = apps.get_model('Customer', 'CartItem')
+    duplicados = CartItem.objects.values('cart_id', 'food_item_id')\
+                                 .annotate(lineas=Count('id'), total=Sum('quantity'), primera=Min('id'))\
+                                 .filter(lineas__gt=1)
+    for grupo in duplicados:
+        CartItem.objects.filter(id=grupo['primera']).update(quantity=grupo['total'])
+        CartItem.objects.filter(cart_id=grupo['cart_id'], food_item_id=grupo['food_item_id'])\
+                        .exclude(id=grupo['primera']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Customer', '0008_customer_customer_addres'),
+        ('RestauranteData', '0010_fooditem_stock_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(unir_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'food_item'), name='cartitem_unico'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:07
+
+import Customer.models
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def armar_saldos(apps, schema_editor):
+    # Cada fila existente pasa a ser un lote: vence 60 días después de creada y, si sigue
+    # vigente, conserva sus puntos. El saldo de cada cliente es la suma de lo que queda.
+    LoyaltyPoint = apps.get_model('Customer', 'LoyaltyPoint')
+    Customer = apps.get_model('Customer', 'Customer')
+    LoyaltyPoint.objects.update(expires_at=F('created_at') + timedelta(days=60))
+    LoyaltyPoint.objects.filter(expires_at__gt=django.utils.timezone.now(), points__gt=0).update(remaining=F('points'))
+
+    saldos = LoyaltyPoint.objects.filter(customer_id=OuterRef('pk')).order_by()\
+                                 .values('customer_id').annotate(total=Sum('remaining')).values('total')
+    Customer.objects.update(loyalty_balance=Coalesce(Subquery(saldos), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Customer', '0009_cartitem_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoPuntos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.PositiveSmallIntegerField(choices=[(1, 'Canje'), (2, 'Vencimiento')])),
+                ('points', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='loyalty_balance',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='loyaltypoint',
+            name='expires_at',
+            field=models.DateTimeField(default=Customer.models.default_expiracion_puntos),
+        ),
+        migrations.AddField(
+            model_name='loyaltypoint',
+            name='remaining',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(armar_saldos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='loyaltypoint',
+            index=models.Index(fields=['customer', 'expires_at'], name='puntos_cliente_vence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loyaltypoint',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['expires_at'], name='puntos_por_vencer_idx'),
+        ),
+        migrations.AddField(
+            model_name='movimientopuntos',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_puntos', to='Customer.customer'),
+        ),
+    ]
@@ -13,6 +13,7 @@ class Customer(models.Model):
     phone = models.IntegerField(default=0)
     comprasRealizadas = models.IntegerField(default=0)
     customer_addres = models.CharField(max_length=255,null=True,blank=True)
+    loyalty_balance = models.IntegerField(default=0)  # Suma de LoyaltyPoint.remaining, mantenida por Customer.puntos
     
     def __str__(self):
         return self.user.username
@@ -25,14 +26,52 @@ class CartItem (models.Model):
     cart = models.ForeignKey(Cart,on_delete=models.CASCADE)
     food_item = models.ForeignKey(FoodItem,on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)  # Último cambio; los carritos abandonados se limpian con limpiar_expirados
 
+    class Meta:
+        constraints = [
+            # Una sola línea por plato en cada carrito; permite el upsert de updateCartBatch
+            models.UniqueConstraint(fields=['cart', 'food_item'], name='cartitem_unico'),
+        ]
+
+VIGENCIA_PUNTOS = timedelta(days=60)  # Los puntos expiran a los 2 meses
+
+def default_expiracion_puntos():
+    return now() + VIGENCIA_PUNTOS
+
+#cada fila es un lote de puntos ganados; los canjes consumen los lotes más antiguos primero
 class LoyaltyPoint(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loyalty_points')
-    points = models.IntegerField(default=0)  # Puntos acumulados
+    points = models.IntegerField(default=0)  # Puntos acreditados en este lote
+    remaining = models.IntegerField(default=0)  # Puntos del lote que todavía no se canjearon ni vencieron
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=default_expiracion_puntos)
+
+    class Meta:
+        indexes = [
+            # Lotes vivos de un cliente en orden FIFO y lotes vencidos para el barrido
+            models.Index(fields=['customer', 'expires_at'], name='puntos_cliente_vence_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(remaining__gt=0), name='puntos_por_vencer_idx'),
+        ]
 
     def is_expired(self):
-        return now() > self.created_at + timedelta(days=60)  # Expira a los 2 meses
+        return now() > self.expires_at
+
+
+#historial de puntos que salieron de los lotes (canjes y vencimientos)
+class MovimientoPuntos(models.Model):
+    class Tipo(models.IntegerChoices):
+        CANJE = 1, 'Canje'
+        VENCIMIENTO = 2, 'Vencimiento'
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='movimientos_puntos')
+    tipo = models.PositiveSmallIntegerField(choices=Tipo.choices)
+    points = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.points} puntos de {self.customer_id}"
+
 
 def default_expiration_date():
     """Calcula la fecha de expiración por defecto para los cupones."""
@@ -0,0 +1,145 @@
+#Customer/puntos.py
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+from .models import Customer, LoyaltyPoint, MovimientoPuntos
+
+# Lotes que se leen por vuelta al consumir puntos FIFO
+LOTES_POR_LECTURA = 50
+
+
+class PuntosInsuficientes(Exception):
+    """El saldo del cliente no alcanza para el canje. No se descontó nada."""
+
+    def __init__(self, disponibles, pedidos):
+        self.disponibles = disponibles
+        self.pedidos = pedidos
+        super().__init__(f'El cliente tiene {disponibles} puntos y se pidieron {pedidos}.')
+
+
+def acreditar_puntos(customer_id, puntos):
+    """
+    Agrega un lote de puntos que vence en VIGENCIA_PUNTOS y suma el saldo del cliente
+    con F(), en la misma transacción. Devuelve el saldo nuevo.
+    """
+    if puntos <= 0:
+        raise ValueError("La cantidad de puntos debe ser un entero positivo.")
+
+    with transaction.atomic():
+        LoyaltyPoint.objects.create(customer_id=customer_id, points=puntos, remaining=puntos)
+        Customer.objects.filter(id=customer_id).update(loyalty_balance=F('loyalty_balance') + puntos)
+        return Customer.objects.values_list('loyalty_balance', flat=True).get(id=customer_id)
+
+
+def canjear_puntos(customer_id, puntos):
+    """
+    Descuenta puntos del saldo con un UPDATE condicional (loyalty_balance >= puntos) y los
+    consume de los lotes vigentes que vencen primero. Antes se bloquea al cliente (el mismo
+    orden que vencer_puntos) y se vencen sus lotes expirados que el barrido todavía no
+    limpió, así esos puntos ya no cuentan en el saldo ni se pueden canjear.
+
+    Lanza PuntosInsuficientes si el saldo no alcanza. Usar dentro de la transacción del llamador.
+    """
+    if puntos <= 0:
+        return
+
+    with transaction.atomic(savepoint=False):
+        ahora = timezone.now()
+        Customer.objects.select_for_update().filter(id=customer_id).values_list('id', flat=True).first()
+        _vencer_lotes([customer_id], ahora)
+
+        if not Customer.objects.filter(id=customer_id, loyalty_balance__gte=puntos)\
+                               .update(loyalty_balance=F('loyalty_balance') - puntos):
+            disponibles = Customer.objects.filter(id=customer_id).values_list('loyalty_balance', flat=True).first()
+            raise PuntosInsuficientes(disponibles or 0, puntos)
+
+        lotes = LoyaltyPoint.objects.filter(customer_id=customer_id, remaining__gt=0, expires_at__gt=ahora)\
+                                    .order_by('expires_at', 'id')
+        restante = puntos
+        while restante:
+            consumidos = []
+            for lote in lotes[:LOTES_POR_LECTURA]:
+                descuento = min(lote.remaining, restante)
+                lote.remaining -= descuento
+                restante -= descuento
+                consumidos.append(lote)
+                if not restante:
+                    break
+            if not consumidos:
+                # No debería pasar: el saldo es la suma de los lotes vigentes
+                break
+            LoyaltyPoint.objects.bulk_update(consumidos, ['remaining'])
+
+        MovimientoPuntos.objects.create(customer_id=customer_id, tipo=MovimientoPuntos.Tipo.CANJE, points=puntos)
+
+
+def saldo_vigente(customer):
+    """
+    Saldo del cliente sin los puntos de lotes ya expirados que vencer_puntos todavía no
+    barrió. Es una sola consulta sobre el índice de expires_at; no escribe nada.
+    """
+    vencidos = LoyaltyPoint.objects.filter(customer_id=customer.id, expires_at__lte=timezone.now(), remaining__gt=0)\
+                                   .aggregate(total=Sum('remaining'))['total']
+    return customer.loyalty_balance - (vencidos or 0)
+
+
+def borrar_puntos(customer_id):
+    """Elimina todos los lotes del cliente y deja su saldo en 0."""
+    with transaction.atomic():
+        Customer.objects.filter(id=customer_id).update(loyalty_balance=0)
+        LoyaltyPoint.objects.filter(customer_id=customer_id).delete()
+
+
+def _vencer_lotes(customer_ids, ahora):
+    """
+    Pone en 0 los lotes expirados de los clientes, resta el total de cada saldo con un UPDATE
+    y registra un MovimientoPuntos por cliente. Los clientes ya tienen que estar bloqueados.
+    Devuelve {customer_id: puntos vencidos}.
+    """
+    lotes = LoyaltyPoint.objects.filter(customer_id__in=customer_ids, expires_at__lte=ahora, remaining__gt=0)
+    por_cliente = dict(lotes.order_by().values_list('customer_id').annotate(total=Sum('remaining')))
+    if not por_cliente:
+        return por_cliente
+    lotes.update(remaining=0)
+
+    Customer.objects.filter(id__in=por_cliente).update(
+        loyalty_balance=F('loyalty_balance') - Case(
+            *[When(id=customer_id, then=Value(total)) for customer_id, total in por_cliente.items()],
+            output_field=IntegerField(),
+        )
+    )
+    MovimientoPuntos.objects.bulk_create([
+        MovimientoPuntos(customer_id=customer_id, tipo=MovimientoPuntos.Tipo.VENCIMIENTO, points=total, created_at=ahora)
+        for customer_id, total in por_cliente.items()
+    ])
+    return por_cliente
+
+
+def vencer_puntos(tamano_lote=500):
+    """
+    Vence los puntos que quedan en lotes expirados, de a `tamano_lote` clientes por
+    transacción. En cada tanda se bloquean primero los clientes (el mismo orden que usa
+    canjear_puntos) y se vencen sus lotes con _vencer_lotes.
+
+    Lo corre `limpiar_expirados` (proceso `limpieza` del Procfile). Hasta que pasa, el saldo
+    materializado incluye los puntos vencidos: para mostrarlo se lee con saldo_vigente.
+
+    Devuelve (clientes afectados, puntos vencidos).
+    """
+    clientes = 0
+    vencidos_total = 0
+    while True:
+        ahora = timezone.now()
+        vencidos = LoyaltyPoint.objects.filter(expires_at__lte=ahora, remaining__gt=0)
+        customer_ids = list(
+            vencidos.order_by('customer_id').values_list('customer_id', flat=True).distinct()[:tamano_lote]
+        )
+        if not customer_ids:
+            return clientes, vencidos_total
+
+        with transaction.atomic():
+            list(Customer.objects.select_for_update().filter(id__in=customer_ids).order_by('id').values_list('id', flat=True))
+            por_cliente = _vencer_lotes(customer_ids, ahora)
+
+        clientes += len(por_cliente)
+        vencidos_total += sum(por_cliente.values())
@@ -1,6 +1,7 @@
 # Customer/serializers.py
 from rest_framework import serializers
 from .models import CartItem,LoyaltyPoint,Coupon,Customer
+from .puntos import saldo_vigente
 from RestauranteData.models import FoodItem
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -16,7 +17,7 @@ class CartItemSerializer(serializers.ModelSerializer):
 class LoyaltyPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoyaltyPoint
-        fields = ['points', 'created_at']
+        fields = ['points', 'remaining', 'created_at', 'expires_at']
 
 class CouponSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,9 +34,11 @@ class CustomerProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Customer
-        fields = ['id', 'customer_addres', 'comprasRealizadas', 'loyalty_points', 'coupons', 'first_name', 'last_name', 'email', 'phone']
+        fields = ['id', 'customer_addres', 'comprasRealizadas', 'loyalty_balance', 'loyalty_points', 'coupons', 'first_name', 'last_name', 'email', 'phone']
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data['customer_id'] = instance.id
+        # Sin los puntos vencidos que el barrido todavía no limpió
+        data['loyalty_balance'] = saldo_vigente(instance)
         return data
@@ -1,3 +1,245 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Authentication.models import BaseUser
+from Pedidos.models import IdempotencyKey
+from RestauranteData.Food_Item import FoodItemTombstone
+from RestauranteData.models import FoodItem, Restaurante
+from .carrito import CHECKOUT_KEY, CarritoCache, CarritoDB, guardar_carritos
+from .limpieza import borrar_en_tramos, limpiar_expirados
+from .models import Cart, CartItem, Coupon, Customer, LoyaltyPoint, MovimientoPuntos
+from .puntos import PuntosInsuficientes, acreditar_puntos, canjear_puntos, saldo_vigente, vencer_puntos
 
 # Create your tests here.
+class ClienteMixin:
+
+    def crear_cliente(self, username):
+        user = BaseUser.objects.create_user(username=username, email=f'{username}@example.com', password='clave')
+        return Customer.objects.create(user=user, restaurante=Restaurante.objects.first(), phone=12345678, customer_addres='Calle 1')
+
+
+class CarritoCacheTests(ClienteMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = self.crear_cliente('cliente')
+        Cart.objects.create(customer=self.customer)
+        self.muzza, self.fugazza = FoodItem.objects.bulk_create([
+            FoodItem(name=nombre, description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=5)
+            for nombre in ('muzza', 'fugazza')
+        ])
+
+    def guardados(self):
+        return dict(CartItem.objects.filter(cart__customer=self.customer).values_list('food_item_id', 'quantity'))
+
+    def test_checkout_saca_lo_comprado_y_deja_lo_agregado_despues(self):
+        carrito = CarritoCache(self.customer)
+        carrito.agregar(self.muzza.id, 2)
+        lineas = carrito.lineas()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                carrito.vaciar(lineas)
+                # Llega mientras el pedido todavía no confirmó
+                carrito.agregar(self.fugazza.id, 1)
+
+        self.assertEqual(carrito.cantidades(), {self.fugazza.id: 1})
+        guardar_carritos()
+        self.assertEqual(self.guardados(), {self.fugazza.id: 1})
+
+    def test_guardar_carritos_no_reescribe_un_carrito_en_checkout(self):
+        carrito = CarritoCache(self.customer)
+        carrito.agregar(self.muzza.id, 2)
+        lineas = carrito.lineas()
+
+        with self.captureOnCommitCallbacks(execute=False) as confirmaciones:
+            with transaction.atomic():
+                carrito.vaciar(lineas)
+        # El pedido se escribió pero la cache todavía tiene el carrito de antes del checkout
+        self.assertEqual(guardar_carritos(), 0)
+        self.assertEqual(self.guardados(), {})
+
+        for confirmar in confirmaciones:
+            confirmar()
+        self.assertIsNone(cache.get(CHECKOUT_KEY.format(self.customer.id)))
+        guardar_carritos()
+        self.assertEqual(self.guardados(), {})
+
+    def test_los_dos_backends_calculan_los_totales_en_decimal(self):
+        FoodItem.objects.filter(id=self.muzza.id).update(unitPrice=10.10)
+        CartItem.objects.create(cart=self.customer.cart, food_item=self.muzza, quantity=3)
+
+        for carrito in (CarritoDB(self.customer), CarritoCache(self.customer)):
+            linea, = carrito.lineas()
+            self.assertEqual((linea.total_linea, linea.total_carrito), (Decimal('30.30'), Decimal('30.30')))
+
+    def test_update_cart_batch_inserta_actualiza_y_elimina_en_una_llamada(self):
+        napo, = FoodItem.objects.bulk_create([
+            FoodItem(name='napo', description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=5)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.customer.cart, food_item=self.muzza, quantity=2),
+            CartItem(cart=self.customer.cart, food_item=self.fugazza, quantity=1),
+        ])
+        client = APIClient()
+        client.force_authenticate(self.customer.user)
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = client.post('/customer/updateCartBatch/', {'items': [
+                {'food_item_id': napo.id, 'quantity': 3},
+                {'food_item_id': self.muzza.id, 'delta': 2},
+                {'food_item_id': self.fugazza.id, 'quantity': 0},
+            ]}, format='json')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            {item['food_item_id']: item['quantity'] for item in respuesta.data['items']},
+            {napo.id: 3, self.muzza.id: 4, self.fugazza.id: 0}
+        )
+        self.assertEqual(self.guardados(), {napo.id: 3, self.muzza.id: 4})
+
+        # Con dos cambios se hacen las mismas consultas que con tres
+        with CaptureQueriesContext(connection) as menos:
+            client.post('/customer/updateCartBatch/', {'items': [
+                {'food_item_id': napo.id, 'delta': -1},
+                {'food_item_id': self.muzza.id, 'quantity': 0},
+            ]}, format='json')
+        self.assertEqual(len(menos), len(consultas))
+        self.assertEqual(self.guardados(), {napo.id: 2})
+
+
+class PuntosTests(ClienteMixin, TestCase):
+
+    def setUp(self):
+        self.customer = self.crear_cliente('cliente')
+
+    def saldo(self):
+        return Customer.objects.values_list('loyalty_balance', flat=True).get(id=self.customer.id)
+
+    def lote(self, puntos, vence_en):
+        lote = LoyaltyPoint.objects.create(
+            customer=self.customer, points=puntos, remaining=puntos, expires_at=timezone.now() + vence_en
+        )
+        Customer.objects.filter(id=self.customer.id).update(loyalty_balance=self.saldo() + puntos)
+        return lote
+
+    def restantes(self, *lotes):
+        return [LoyaltyPoint.objects.values_list('remaining', flat=True).get(id=lote.id) for lote in lotes]
+
+    def test_canje_consume_primero_los_lotes_que_vencen_antes(self):
+        tarde = self.lote(20, timedelta(days=50))
+        pronto = self.lote(10, timedelta(days=5))
+
+        with transaction.atomic():
+            canjear_puntos(self.customer.id, 15)
+
+        self.assertEqual(self.saldo(), 15)
+        self.assertEqual(self.restantes(pronto, tarde), [0, 15])
+        self.assertTrue(MovimientoPuntos.objects.filter(customer=self.customer, tipo=MovimientoPuntos.Tipo.CANJE, points=15).exists())
+
+    def test_saldo_insuficiente_no_descuenta_nada(self):
+        lote = self.lote(10, timedelta(days=5))
+
+        with self.assertRaises(PuntosInsuficientes) as error:
+            with transaction.atomic():
+                canjear_puntos(self.customer.id, 11)
+
+        self.assertEqual((error.exception.disponibles, error.exception.pedidos), (10, 11))
+        self.assertEqual(self.saldo(), 10)
+        self.assertEqual(self.restantes(lote), [10])
+
+    def test_los_puntos_vencidos_sin_barrer_no_se_canjean(self):
+        vencido = self.lote(10, -timedelta(days=1))
+        vigente = self.lote(5, timedelta(days=5))
+
+        with self.assertRaises(PuntosInsuficientes) as error:
+            with transaction.atomic():
+                canjear_puntos(self.customer.id, 10)
+        self.assertEqual(error.exception.disponibles, 5)
+
+        with transaction.atomic():
+            canjear_puntos(self.customer.id, 5)
+        self.assertEqual(self.saldo(), 0)
+        self.assertEqual(self.restantes(vencido, vigente), [0, 0])
+        self.assertEqual(
+            list(MovimientoPuntos.objects.filter(customer=self.customer).order_by('id').values_list('tipo', 'points')),
+            [(MovimientoPuntos.Tipo.VENCIMIENTO, 10), (MovimientoPuntos.Tipo.CANJE, 5)]
+        )
+
+    def test_acreditar_y_vencer_mantienen_el_saldo(self):
+        self.assertEqual(acreditar_puntos(self.customer.id, 8), 8)
+        self.lote(10, -timedelta(days=1))
+
+        self.assertEqual(vencer_puntos(), (1, 10))
+        self.assertEqual(self.saldo(), 8)
+        self.assertEqual(vencer_puntos(), (0, 0))
+
+    def test_el_saldo_mostrado_no_cuenta_los_vencidos_sin_barrer(self):
+        self.lote(10, -timedelta(days=1))
+        self.lote(5, timedelta(days=5))
+        Cart.objects.create(customer=self.customer)
+        self.customer.refresh_from_db()
+        client = APIClient()
+        client.force_authenticate(self.customer.user)
+
+        self.assertEqual(saldo_vigente(self.customer), 5)
+        self.assertEqual(client.get('/customer/getCartItems/').data['total_points'], 5)
+        self.assertEqual(client.get('/customer/viewProfile/').data['loyalty_balance'], 5)
+        # Leer no vence nada: eso lo sigue haciendo el barrido
+        self.assertEqual(self.saldo(), 15)
+
+
+class LimpiezaTests(ClienteMixin, TestCase):
+
+    def setUp(self):
+        self.customer = self.crear_cliente('cliente')
+        self.ahora = timezone.now()
+
+    def test_borra_en_tramos_solo_lo_que_cumple_el_filtro(self):
+        Coupon.objects.bulk_create(
+            [Coupon(customer=self.customer, expires_at=self.ahora - timedelta(days=1)) for _ in range(5)]
+            + [Coupon(customer=self.customer, expires_at=self.ahora + timedelta(days=1)) for _ in range(2)]
+        )
+        vencidos = Coupon.objects.filter(expires_at__lte=self.ahora)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(borrar_en_tramos(vencidos, tamano_tramo=2), 5)
+
+        self.assertEqual(Coupon.objects.count(), 2)
+        # Tres tramos (2, 2 y 1 filas), cada uno con un solo DELETE
+        self.assertEqual(sum(consulta['sql'].startswith('DELETE') for consulta in consultas.captured_queries), 3)
+
+    def test_limpiar_expirados_borra_cada_tipo_vencido(self):
+        viejo = self.ahora - timedelta(days=365)
+        cart = Cart.objects.create(customer=self.customer)
+        muzza, fugazza = FoodItem.objects.bulk_create([
+            FoodItem(name=nombre, description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=5)
+            for nombre in ('muzza', 'fugazza')
+        ])
+        Coupon.objects.create(customer=self.customer, expires_at=viejo)
+        vigente = Coupon.objects.create(customer=self.customer)
+        # El lote vencido con puntos se vence primero y después se borra
+        LoyaltyPoint.objects.create(customer=self.customer, points=10, remaining=10, expires_at=viejo)
+        Customer.objects.filter(id=self.customer.id).update(loyalty_balance=10)
+        abandonado = CartItem.objects.create(cart=cart, food_item=muzza)
+        CartItem.objects.filter(id=abandonado.id).update(updated_at=viejo)
+        activo = CartItem.objects.create(cart=cart, food_item=fugazza)
+        # deleted_at es auto_now_add: la fecha vieja se escribe con update
+        FoodItemTombstone.objects.create(food_item_id=99)
+        FoodItemTombstone.objects.update(deleted_at=viejo)
+        IdempotencyKey.objects.create(key='k', endpoint='e', request_hash='h', expires_at=viejo)
+
+        resultados = {nombre: borrados for nombre, borrados, _ in limpiar_expirados(tamano_tramo=10)}
+
+        self.assertEqual(resultados, {'cupones': 1, 'puntos': 1, 'carritos': 1, 'borrados_menu': 1, 'idempotencia': 1})
+        self.assertEqual(list(Coupon.objects.values_list('id', flat=True)), [vigente.id])
+        self.assertEqual(list(CartItem.objects.values_list('id', flat=True)), [activo.id])
+        self.assertFalse(LoyaltyPoint.objects.exists())
+        self.assertEqual(Customer.objects.values_list('loyalty_balance', flat=True).get(id=self.customer.id), 0)
+        self.assertFalse(FoodItemTombstone.objects.exists() or IdempotencyKey.objects.exists())
+
@@ -4,8 +4,13 @@ from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from .models import Cart, CartItem, Customer,LoyaltyPoint,Coupon
 from .serializers import CartItemSerializer,CustomerProfileSerializer
+from .carrito import carrito_de
+from .puntos import acreditar_puntos, borrar_puntos, saldo_vigente
 from RestauranteData.models import FoodItem
+from RestauranteData.stock import stock_disponible
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import Prefetch
+from django.utils.timezone import now
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -61,32 +66,23 @@ class AddToCartView(APIView):
          # Asegurarse de que quantity es un entero
         try:
             quantity = int(quantity)  # Convertir quantity a un entero
-        except ValueError:
+        except (TypeError, ValueError):
             return Response({"detail": "La cantidad debe ser un número entero válido."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verificar que el FoodItem existe
+        # Verificar que el FoodItem existe (el id queda como entero para la clave del carrito)
         try:
-            food_item = FoodItem.objects.get(id=food_item_id)
-        except FoodItem.DoesNotExist:
+            food_item_id = int(food_item_id)
+        except (TypeError, ValueError):
+            return Response({"detail": "El item de comida no existe."}, status=status.HTTP_400_BAD_REQUEST)
+        if not FoodItem.objects.filter(id=food_item_id).exists():
             return Response({"detail": "El item de comida no existe."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verificar que el cliente tiene un carrito
+        # Sumar la cantidad en el carrito (en la base o en la cache según CART_BACKEND)
         try:
-            cart = Cart.objects.get(customer=customer)
+            carrito_de(customer).agregar(food_item_id, quantity)
         except Cart.DoesNotExist:
             return Response({"detail": "El cliente no tiene un carrito."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verificar si ya existe un CartItem con este FoodItem
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, food_item=food_item)
-        if not created:
-            # Si ya existe, actualizar la cantidad
-            cart_item.quantity += quantity
-            cart_item.save()
-        else:
-            # Si no existe, establecer la cantidad inicial
-            cart_item.quantity = quantity
-            cart_item.save()
-
         return Response({"detail": "Item agregado al carrito exitosamente."}, status=status.HTTP_200_OK)
 
 class GetCartItemsView(APIView):
@@ -126,6 +122,7 @@ class GetCartItemsView(APIView):
                                 }
                             )
                         ),
+                        'cart_total': openapi.Schema(type=openapi.TYPE_NUMBER, format=openapi.FORMAT_FLOAT, description='Precio total del carrito'),
                         'total_points': openapi.Schema(type=openapi.TYPE_INTEGER, description='Puntos de lealtad disponibles'),
                         'available_coupons': openapi.Schema(
                             type=openapi.TYPE_ARRAY,
@@ -157,16 +154,13 @@ class GetCartItemsView(APIView):
         # Obtener el usuario actual desde el token
         user = request.user
         
-        try:
-            # Acceder al cliente y carrito
-            customer = user.customer
-            cart = Cart.objects.get(customer=customer)
-        except Cart.DoesNotExist:
-            return Response({"detail": "El cliente no tiene un carrito."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Obtener todos los items del carrito
-        cart_items = CartItem.objects.filter(cart=cart)
+        # Acceder al cliente y a los items de su carrito con sus FoodItems y totales, en una consulta
+        customer = user.customer
+        cart_items = carrito_de(customer).lineas()
         
+        # Stock de los items repartidos en varios contadores
+        stock_repartido = stock_disponible([cart_item.food_item_id for cart_item in cart_items if cart_item.food_item.stockShards])
+
         # Crear una lista de los datos del FoodItem para cada CartItem
         items_data = []
         for cart_item in cart_items:
@@ -176,30 +170,24 @@ class GetCartItemsView(APIView):
                 "description": food_item.description,
                 "category": food_item.category,
                 "unitPrice": food_item.unitPrice,
-                "stockRestaurant": food_item.stockRestaurant,
+                "stockRestaurant": stock_repartido.get(food_item.id, food_item.stockRestaurant),
                 "image": food_item.image.url if food_item.image else None,
                 "quantity": cart_item.quantity,
-                "totalPrice": cart_item.quantity * food_item.unitPrice
+                "totalPrice": cart_item.total_linea
             })
 
-        # Calcular puntos totales (excluyendo los expirados)
-        total_points = sum(
-            point.points for point in customer.loyalty_points.all() if not point.is_expired()
-        )
+        # El saldo de puntos está materializado en el cliente; se descuentan los vencidos que el barrido no limpió
+        total_points = saldo_vigente(customer)
 
-        # Obtener los cupones válidos (excluyendo los expirados)
-        coupons = [
-            {
-                "id": coupon.id,
-                "discount_amount": coupon.discount_amount,
-                "created_at": coupon.created_at,
-            }
-            for coupon in customer.coupons.all() if not coupon.is_expired()
-        ]
+        # Cupones válidos filtrados en la base por expires_at
+        coupons = list(
+            customer.coupons.filter(expires_at__gt=now()).order_by('id').values('id', 'discount_amount', 'created_at')
+        )
 
         # Respuesta extendida
         return Response({
             "cart_items": items_data,
+            "cart_total": cart_items[0].total_carrito if cart_items else 0,
             "total_points": total_points,
             "available_coupons": coupons,
         }, status=status.HTTP_200_OK)
@@ -249,30 +237,115 @@ class DeleteCartItemByFoodNameView(APIView):
         except AttributeError:
             return Response({"detail": "El usuario no tiene un perfil de cliente."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Intentar obtener el carrito del usuario
-        try:
-            cart = Cart.objects.get(customer=customer)
-        except Cart.DoesNotExist:
-            return Response({"detail": "El cliente no tiene un carrito."}, status=status.HTTP_400_BAD_REQUEST)
-
         # Intentar obtener el FoodItem por el nombre
-        try:
-            food_item = FoodItem.objects.get(name=food_item_name)
-        except FoodItem.DoesNotExist:
+        food_item_id = FoodItem.objects.filter(name=food_item_name).values_list('id', flat=True).first()
+        if food_item_id is None:
             return Response({"detail": "El item de comida con ese nombre no existe."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Intentar obtener el CartItem correspondiente al FoodItem en el carrito
-        try:
-            cart_item = CartItem.objects.get(cart=cart, food_item=food_item)
-        except CartItem.DoesNotExist:
+        # Eliminar el item del carrito
+        if not carrito_de(customer).quitar(food_item_id):
             return Response({"detail": "El item de carrito no existe."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Eliminar el CartItem
-        cart_item.delete()
-
         # Retornar una respuesta exitosa
         return Response({"detail": "El item de carrito ha sido eliminado."}, status=status.HTTP_204_NO_CONTENT)
 
+class UpdateCartBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Aplica varios cambios al carrito en una sola llamada. Cada item lleva 'quantity' (cantidad absoluta) o 'delta' (se suma a la actual). Los items que quedan en 0 se eliminan.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'items': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'food_item_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID del item de comida.'),
+                            'quantity': openapi.Schema(type=openapi.TYPE_INTEGER, description='Cantidad final en el carrito (0 lo elimina).'),
+                            'delta': openapi.Schema(type=openapi.TYPE_INTEGER, description='Cantidad a sumar o restar a la actual.')
+                        },
+                        required=['food_item_id']
+                    )
+                )
+            },
+            required=['items']
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Cambios aplicados. Devuelve la cantidad final de cada item modificado.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, description='Mensaje de éxito.'),
+                        'items': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    'food_item_id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                    'quantity': openapi.Schema(type=openapi.TYPE_INTEGER)
+                                }
+                            )
+                        )
+                    }
+                )
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Algún item es inválido o no existe. No se aplicó ningún cambio.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, description='Mensaje de error.')
+                    }
+                )
+            )
+        }
+    )
+
+    def post(self, request, *args, **kwargs):
+        try:
+            customer = request.user.customer
+        except Customer.DoesNotExist:
+            return Response({"detail": "El usuario no tiene un perfil de cliente."}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "Debe enviar una lista de items."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validar la forma de cada cambio antes de tocar la base
+        cambios = []
+        for item in items:
+            if not isinstance(item, dict) or ('quantity' in item) == ('delta' in item):
+                return Response({"detail": "Cada item debe tener food_item_id y solo uno de quantity o delta."}, status=status.HTTP_400_BAD_REQUEST)
+            es_delta = 'delta' in item
+            try:
+                food_item_id = int(item.get('food_item_id'))
+                cantidad = int(item['delta'] if es_delta else item['quantity'])
+            except (TypeError, ValueError):
+                return Response({"detail": "food_item_id, quantity y delta deben ser números enteros."}, status=status.HTTP_400_BAD_REQUEST)
+            if not es_delta and cantidad < 0:
+                return Response({"detail": "La cantidad no puede ser negativa."}, status=status.HTTP_400_BAD_REQUEST)
+            cambios.append((food_item_id, cantidad, es_delta))
+
+        # Todos los FoodItems se validan con una sola consulta
+        food_item_ids = {food_item_id for food_item_id, _, _ in cambios}
+        existentes = set(FoodItem.objects.filter(id__in=food_item_ids).values_list('id', flat=True))
+        if existentes != food_item_ids:
+            faltantes = ", ".join(str(food_item_id) for food_item_id in sorted(food_item_ids - existentes))
+            return Response({"detail": f"Los items de comida {faltantes} no existen."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            finales = carrito_de(customer).aplicar_cambios(cambios)
+        except Cart.DoesNotExist:
+            return Response({"detail": "El cliente no tiene un carrito."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "detail": "Carrito actualizado exitosamente.",
+            "items": [{"food_item_id": food_item_id, "quantity": cantidad} for food_item_id, cantidad in finales.items()]
+        }, status=status.HTTP_200_OK)
+
 class AddLoyaltyPointsView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -344,16 +417,12 @@ class AddLoyaltyPointsView(APIView):
         if not isinstance(points_to_add, int) or points_to_add <= 0:
             return Response({"error": "La cantidad de puntos debe ser un entero positivo"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verificar si el cliente ya tiene un registro de LoyaltyPoint
-        loyalty_point, created = LoyaltyPoint.objects.get_or_create(customer=customer, defaults={"points": 0})
-
-        # Si ya existía, suma los nuevos puntos al registro actual
-        loyalty_point.points += points_to_add
-        loyalty_point.save()
+        # Cada acreditación es un lote nuevo con su propio vencimiento
+        total_points = acreditar_puntos(customer.id, points_to_add)
 
         return Response({
             "message": "Puntos añadidos exitosamente",
-            "total_points": loyalty_point.points
+            "total_points": total_points
         }, status=status.HTTP_200_OK)
 
 class DeleteLoyaltyPointsView(APIView):
@@ -389,8 +458,8 @@ class DeleteLoyaltyPointsView(APIView):
         except Customer.DoesNotExist:
             return Response({"error": "Cliente no encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Eliminar todos los puntos asociados al cliente
-        customer.loyalty_points.all().delete()
+        # Eliminar todos los puntos asociados al cliente y su saldo
+        borrar_puntos(customer.id)
 
         return Response({
             "message": "Puntos eliminados exitosamente"
@@ -644,6 +713,13 @@ class CustomerProfileView(APIView):
         except AttributeError:
             return Response({"detail": "El usuario no tiene un perfil de cliente."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Solo los lotes de puntos y cupones vigentes, filtrados en la base
+        ahora = now()
+        customer = Customer.objects.select_related('user').prefetch_related(
+            Prefetch('loyalty_points', queryset=LoyaltyPoint.objects.filter(remaining__gt=0, expires_at__gt=ahora).order_by('expires_at')),
+            Prefetch('coupons', queryset=Coupon.objects.filter(expires_at__gt=ahora).order_by('expires_at')),
+        ).get(id=customer.id)
+
         # Serializar los datos del perfil del cliente
         serializer = CustomerProfileSerializer(customer)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,104 @@
+#Delivery_Person/geo.py
+import math
+import time
+from django.conf import settings
+from .presencia import posiciones_online
+
+KM_POR_GRADO = 111.32
+# Anillos de celdas que se recorren como máximo alrededor del punto buscado
+MAX_ANILLOS = 50
+
+
+def celda(lat, lon, tamano=None):
+    """Celda de la grilla (fila, columna) de tamano x tamano grados que contiene el punto."""
+    tamano = tamano or settings.DRIVER_GRID_CELL_DEGREES
+    return math.floor(lat / tamano), math.floor(lon / tamano)
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    # Haversine
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def _anillo(fila, columna, radio):
+    if radio == 0:
+        yield fila, columna
+        return
+    for df in range(-radio, radio + 1):
+        yield fila + df, columna - radio
+        yield fila + df, columna + radio
+    for dc in range(-radio + 1, radio):
+        yield fila - radio, columna + dc
+        yield fila + radio, columna + dc
+
+
+class GrillaRepartidores:
+    """
+    Índice espacial en memoria de las posiciones de los repartidores: cada celda de la grilla
+    guarda los ids que están dentro. Buscar los más cercanos recorre anillos de celdas desde el
+    punto hasta tener k candidatos que ninguna celda más lejana pueda mejorar.
+    """
+
+    def __init__(self, posiciones, tamano=None):
+        self.tamano = tamano or settings.DRIVER_GRID_CELL_DEGREES
+        self.posiciones = {}
+        self.celdas = {}
+        for repartidor_id, (lat, lon) in posiciones.items():
+            self.mover(repartidor_id, lat, lon)
+
+    def mover(self, repartidor_id, lat, lon):
+        self.quitar(repartidor_id)
+        self.posiciones[repartidor_id] = (lat, lon)
+        self.celdas.setdefault(celda(lat, lon, self.tamano), set()).add(repartidor_id)
+
+    def quitar(self, repartidor_id):
+        posicion = self.posiciones.pop(repartidor_id, None)
+        if posicion:
+            clave = celda(*posicion, self.tamano)
+            self.celdas[clave].discard(repartidor_id)
+            if not self.celdas[clave]:
+                del self.celdas[clave]
+
+    def mas_cercanos(self, lat, lon, k):
+        """Hasta k pares (distancia_km, repartidor_id), del más cercano al más lejano."""
+        fila, columna = celda(lat, lon, self.tamano)
+        # Cota inferior de lo que mide una celda en km a esta latitud (el lado más corto)
+        km_por_celda = self.tamano * KM_POR_GRADO * max(math.cos(math.radians(min(abs(lat) + self.tamano, 90))), 0.01)
+
+        encontrados = []
+        vistos = 0
+        for radio in range(MAX_ANILLOS + 1):
+            for clave in _anillo(fila, columna, radio):
+                for repartidor_id in self.celdas.get(clave, ()):
+                    encontrados.append((distancia_km(lat, lon, *self.posiciones[repartidor_id]), repartidor_id))
+                    vistos += 1
+            if vistos == len(self.posiciones):
+                break
+            if len(encontrados) >= k:
+                encontrados.sort()
+                # Todo lo que esté fuera de este anillo está a más de radio celdas
+                if encontrados[k - 1][0] <= radio * km_por_celda:
+                    break
+        encontrados.sort()
+        return encontrados[:k]
+
+
+_grilla = None
+_grilla_construida = 0.0
+
+
+def grilla_actual():
+    """
+    Grilla de este proceso. Se reconstruye desde los latidos de la cache cada
+    DRIVER_GRID_REFRESH segundos, así cada búsqueda no toca la cache ni la base. Solo
+    incluye a los repartidores con lugar (DISPATCH_DRIVER_CAPACITY), que son los únicos que
+    el despacho puede elegir.
+    """
+    global _grilla, _grilla_construida
+    ahora = time.monotonic()
+    if _grilla is None or ahora - _grilla_construida > settings.DRIVER_GRID_REFRESH:
+        _grilla = GrillaRepartidores(posiciones_online(settings.DISPATCH_DRIVER_CAPACITY))
+        _grilla_construida = ahora
+    return _grilla
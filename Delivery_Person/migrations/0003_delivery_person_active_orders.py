@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+EN_REPARTO = 4
+
+
+def calcular_carga(apps, schema_editor):
+    Delivery_Person = apps.get_model('Delivery_Person', 'Delivery_Person')
+    Pedido = apps.get_model('Pedidos', 'Pedido')
+    cargas = Pedido.objects.filter(status=EN_REPARTO, delivery_person__isnull=False)\
+                           .values_list('delivery_person_id')\
+                           .annotate(total=Count('id'))
+    for delivery_person_id, total in cargas:
+        Delivery_Person.objects.filter(id=delivery_person_id).update(active_orders=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Delivery_Person', '0002_delivery_person_is_online'),
+        ('Pedidos', '0008_pedido_status_enum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery_person',
+            name='active_orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='delivery_person',
+            index=models.Index(fields=['is_online', 'active_orders', 'id'], name='repartidor_carga_idx'),
+        ),
+        migrations.RunPython(calcular_carga, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,14 @@ from Authentication.models import BaseUser
 class Delivery_Person(models.Model):
     user = models.OneToOneField(BaseUser,on_delete=models.CASCADE)
     is_online = models.BooleanField(default=False)
+    # Pedidos en InDelivery asignados al repartidor; lo mantiene Pedidos.estados.transicionar
+    active_orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Elegir el repartidor online con menos carga es un recorrido corto de este índice
+            models.Index(fields=['is_online', 'active_orders', 'id'], name='repartidor_carga_idx'),
+        ]
     
     def __str__(self):
         return self.user.username
\ No newline at end of file
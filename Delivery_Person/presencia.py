@@ -0,0 +1,126 @@
+#Delivery_Person/presencia.py
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from .models import Delivery_Person
+
+# Último latido del repartidor ({'t', 'lat', 'lon'}); la clave vence sola si deja de enviarlos
+LATIDO_KEY = 'presencia:{}'
+# Repartidores que se leen por vuelta al recorrer el índice de carga
+TRAMO_CANDIDATOS = 50
+
+
+def registrar_latido(repartidor, lat=None, lon=None):
+    """
+    Marca al repartidor como presente por DRIVER_HEARTBEAT_TTL segundos, con su posición si la envió.
+    Solo escribe en la base cuando is_online cambia de False a True, así los latidos periódicos
+    no generan escrituras.
+    """
+    latido = {'t': time.time(), 'lat': lat, 'lon': lon}
+    cache.set(LATIDO_KEY.format(repartidor.id), latido, settings.DRIVER_HEARTBEAT_TTL)
+    if not repartidor.is_online:
+        Delivery_Person.objects.filter(id=repartidor.id).update(is_online=True)
+        repartidor.is_online = True
+
+
+def marcar_desconectado(repartidor):
+    cache.delete(LATIDO_KEY.format(repartidor.id))
+    if repartidor.is_online:
+        Delivery_Person.objects.filter(id=repartidor.id).update(is_online=False)
+        repartidor.is_online = False
+
+
+def esta_online(repartidor):
+    return repartidor.is_online and cache.get(LATIDO_KEY.format(repartidor.id)) is not None
+
+
+def _latidos_vigentes():
+    """
+    {repartidor_id: latido} de los repartidores con un latido vigente.
+
+    is_online en la base es un superconjunto: los que figuran online pero ya no tienen latido
+    se pasan a offline acá, en un solo UPDATE, la primera vez que alguien consulta la presencia.
+    """
+    candidatos = list(Delivery_Person.objects.filter(is_online=True).values_list('id', flat=True))
+    if not candidatos:
+        return {}
+
+    latidos = cache.get_many([LATIDO_KEY.format(repartidor_id) for repartidor_id in candidatos])
+    presentes = {
+        repartidor_id: latidos[LATIDO_KEY.format(repartidor_id)]
+        for repartidor_id in candidatos if LATIDO_KEY.format(repartidor_id) in latidos
+    }
+
+    vencidos = set(candidatos) - set(presentes)
+    if vencidos:
+        Delivery_Person.objects.filter(id__in=vencidos, is_online=True).update(is_online=False)
+    return presentes
+
+
+def repartidores_online():
+    """Ids de los repartidores con un latido vigente."""
+    return list(_latidos_vigentes())
+
+
+def _recorrer_por_carga(capacidad=None, tamano_tramo=TRAMO_CANDIDATOS):
+    """
+    Genera (repartidor_id, active_orders, latido) de los repartidores con latido vigente, de
+    menor a mayor carga. Recorre el índice (is_online, active_orders, id) en tramos de
+    `tamano_tramo` y solo consulta en la cache los latidos del tramo que lee, así quien deja
+    de consumir no paga por el resto. Los que figuran online sin latido se pasan a offline en
+    el camino, igual que en _latidos_vigentes.
+
+    capacidad: solo repartidores con active_orders < capacidad (None = sin límite).
+    """
+    online = Delivery_Person.objects.filter(is_online=True)
+    if capacidad is not None:
+        online = online.filter(active_orders__lt=capacidad)
+    online = online.order_by('active_orders', 'id').values_list('id', 'active_orders')
+
+    ultimo = None
+    while True:
+        tramo = online
+        if ultimo is not None:
+            repartidor_id, carga = ultimo
+            tramo = tramo.filter(Q(active_orders__gt=carga) | Q(active_orders=carga, id__gt=repartidor_id))
+        tramo = list(tramo[:tamano_tramo])
+        if not tramo:
+            return
+        ultimo = tramo[-1]
+
+        latidos = cache.get_many([LATIDO_KEY.format(repartidor_id) for repartidor_id, _ in tramo])
+        vencidos = [repartidor_id for repartidor_id, _ in tramo if LATIDO_KEY.format(repartidor_id) not in latidos]
+        if vencidos:
+            Delivery_Person.objects.filter(id__in=vencidos, is_online=True).update(is_online=False)
+        for repartidor_id, carga in tramo:
+            if LATIDO_KEY.format(repartidor_id) in latidos:
+                yield repartidor_id, carga, latidos[LATIDO_KEY.format(repartidor_id)]
+
+
+def repartidores_por_carga(limite, capacidad=None, tamano_tramo=TRAMO_CANDIDATOS):
+    """
+    [(repartidor_id, active_orders)] de hasta `limite` repartidores con latido vigente, de menor
+    a mayor carga, leyendo solo los tramos del índice de carga que hacen falta
+    (_recorrer_por_carga), así elegir repartidor no depende de cuántos haya online.
+    """
+    presentes = []
+    if limite < 1:
+        return presentes
+    for repartidor_id, carga, _ in _recorrer_por_carga(capacidad, tamano_tramo):
+        presentes.append((repartidor_id, carga))
+        if len(presentes) == limite:
+            break
+    return presentes
+
+
+def posiciones_online(capacidad=None):
+    """
+    {repartidor_id: (lat, lon)} de los repartidores presentes que informaron su posición y
+    tienen lugar (active_orders < capacidad), leídos del índice de carga en tramos.
+    """
+    return {
+        repartidor_id: (latido['lat'], latido['lon'])
+        for repartidor_id, _, latido in _recorrer_por_carga(capacidad)
+        if isinstance(latido, dict) and latido.get('lat') is not None
+    }
@@ -1,3 +1,29 @@
 from django.test import TestCase
+from .geo import GrillaRepartidores, celda
 
 # Create your tests here.
+class GrillaRepartidoresTests(TestCase):
+
+    def test_el_mas_cercano_puede_estar_en_la_celda_vecina(self):
+        grilla = GrillaRepartidores({
+            1: (0.0005, 0.0005),  # Misma celda que el punto, a ~1.4 km
+            2: (0.0105, 0.0095),  # Celda de al lado, a ~0.1 km
+        }, tamano=0.01)
+        self.assertNotEqual(celda(0.0095, 0.0095, 0.01), celda(0.0105, 0.0095, 0.01))
+
+        (distancia, repartidor_id), = grilla.mas_cercanos(0.0095, 0.0095, 1)
+        self.assertEqual(repartidor_id, 2)
+        self.assertLess(distancia, 0.2)
+
+    def test_devuelve_los_k_mas_cercanos_en_orden(self):
+        grilla = GrillaRepartidores({
+            1: (0.0105, 0.0095),
+            2: (0.0005, 0.0005),
+            3: (0.3, 0.3),
+        }, tamano=0.01)
+
+        self.assertEqual([repartidor_id for _, repartidor_id in grilla.mas_cercanos(0.0095, 0.0095, 2)], [1, 2])
+
+        grilla.mover(3, 0.0096, 0.0096)
+        grilla.quitar(1)
+        self.assertEqual([repartidor_id for _, repartidor_id in grilla.mas_cercanos(0.0095, 0.0095, 2)], [3, 2])
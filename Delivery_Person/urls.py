@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import ActualizarEstadoDeliveryPersonAPIView,VerPedidosPorRepartidorAPIView,CambiarEstadoPedidoAPIView,BorrarPedidoAPIView
+from .views import ActualizarEstadoDeliveryPersonAPIView,VerPedidosPorRepartidorAPIView,CambiarEstadoPedidoAPIView,BorrarPedidoAPIView,ReclamarSiguientePedidoAPIView,LatidoRepartidorAPIView
 
 urlpatterns = [
     path('changeIsOnline/',ActualizarEstadoDeliveryPersonAPIView.as_view(),name='changeonline'),
+    path('heartbeat/',LatidoRepartidorAPIView.as_view(),name='heartbeat'),
     path('viewOrders/',VerPedidosPorRepartidorAPIView.as_view(),name='vierorders'),
     path('changeOrderStatus/<int:pedido_id>/',CambiarEstadoPedidoAPIView.as_view(),name='changeorderstatus'),
-    path('deleteOrder/<int:pedido_id>',BorrarPedidoAPIView.as_view(),name='deletepedido')
+    path('deleteOrder/<int:pedido_id>',BorrarPedidoAPIView.as_view(),name='deletepedido'),
+    path('claimNext/',ReclamarSiguientePedidoAPIView.as_view(),name='claimnext')
 ]
@@ -2,12 +2,20 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Delivery_Person
+from .presencia import registrar_latido, marcar_desconectado, esta_online
 from rest_framework.exceptions import NotFound
-from Pedidos.models import Pedido
+from Pedidos.models import Pedido, EstadoPedido
+from Pedidos.direcciones import leer_coordenadas
+from Pedidos.estados import transicionar, TransicionInvalida, CANCELADO, ENTREGADO
+from django.db import transaction
+from django.db.models import F
 from Order_Manager.serializer import PedidoSerializerPersonalizado
+from Order_Dispatcher.despacho import reclamar_siguiente
+from django.conf import settings
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
-from Customer.models import Coupon,LoyaltyPoint,Customer
+from Customer.models import Coupon,Customer
+from Customer.puntos import acreditar_puntos
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -50,9 +58,11 @@ class ActualizarEstadoDeliveryPersonAPIView(APIView):
             except ValueError:
                 return Response({'message': 'El valor de is_online debe ser 1 (True) o 0 (False).'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Actualizar el estado is_online del repartidor
-            delivery_person.is_online = is_online
-            delivery_person.save()
+            # Actualizar la presencia del repartidor; online dura mientras siga enviando latidos
+            if is_online:
+                registrar_latido(delivery_person)
+            else:
+                marcar_desconectado(delivery_person)
 
             return Response({'message': 'Estado de is_online actualizado con éxito.'}, status=status.HTTP_200_OK)
 
@@ -60,12 +70,46 @@ class ActualizarEstadoDeliveryPersonAPIView(APIView):
             # Si no hay un repartidor asociado al usuario
             return Response({'message': 'El usuario no está asociado a un repartidor.'}, status=status.HTTP_404_NOT_FOUND)
 
+class LatidoRepartidorAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Registra un latido del repartidor autenticado. Mientras los envíe (cada 15 segundos) figura online; si deja de enviarlos pasa a offline solo.",
+        responses={
+            200: openapi.Response('Latido registrado', examples={"application/json": {"message": "Latido registrado.", "ttl": 45}}),
+            400: openapi.Response('Error: Coordenadas inválidas'),
+            404: openapi.Response('Error: El repartidor no está asociado al usuario o no existe')
+        },
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'lat': openapi.Schema(type=openapi.TYPE_NUMBER, description="Latitud actual (opcional, junto con lon)"),
+                'lon': openapi.Schema(type=openapi.TYPE_NUMBER, description="Longitud actual (opcional, junto con lat)"),
+            }
+        )
+    )
+
+    def post(self, request, *args, **kwargs):
+        try:
+            repartidor = request.user.delivery_person
+        except Delivery_Person.DoesNotExist:
+            return Response({'message': 'El usuario no está asociado a un repartidor.'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            lat, lon = leer_coordenadas(request.data.get('lat'), request.data.get('lon'))
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        registrar_latido(repartidor, lat, lon)
+        return Response({'message': 'Latido registrado.', 'ttl': settings.DRIVER_HEARTBEAT_TTL}, status=status.HTTP_200_OK)
+
 class VerPedidosPorRepartidorAPIView(APIView):
     authentication_classes=[JWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     @swagger_auto_schema(
-        operation_description="Obtiene los pedidos asociados al repartidor autenticado",
+        operation_description="Obtiene los pedidos asociados al repartidor autenticado, agrupados por viaje y en el orden de sus paradas",
         responses={
             200: openapi.Response('Lista de pedidos', 
                 examples={
@@ -79,6 +123,8 @@ class VerPedidosPorRepartidorAPIView(APIView):
                             "customer_name": "Juan Pérez",
                             "customer_email": "juan@example.com",
                             "customer_phone": "123456789",
+                            "viaje": 3,
+                            "orden_parada": 1,
                             "food_items": [
                                 {
                                     "food_item_name": "Pizza Margherita",
@@ -101,8 +147,10 @@ class VerPedidosPorRepartidorAPIView(APIView):
             # Asegurarse de que el usuario tiene un repartidor asociado
             repartidor = request.user.delivery_person  # Suponiendo que hay una relación de uno a uno
             
-            # Obtener los pedidos asociados a ese repartidor
-            pedidos = Pedido.objects.filter(delivery_person=repartidor)
+            # Obtener los pedidos asociados a ese repartidor: cada viaje junto, con sus paradas en orden
+            pedidos = Pedido.objects.filter(delivery_person=repartidor)\
+                                    .select_related('customer__user').prefetch_related('pedidofooditem_set')\
+                                    .order_by(F('viaje_id').asc(nulls_last=True), 'orden_parada', 'created_at')
             
             if not pedidos.exists():
                 return Response({'message': f'El repartidor {repartidor.user.username} no tiene pedidos asociados.'}, status=status.HTTP_404_NOT_FOUND)
@@ -119,7 +167,7 @@ class CambiarEstadoPedidoAPIView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    ESTADOS_VALIDOS = ['Cancelado','Entregado']
+    ESTADOS_VALIDOS = [CANCELADO, ENTREGADO]
 
     @swagger_auto_schema(
         operation_description="Cambia el estado de un pedido asociado al repartidor autenticado",
@@ -138,58 +186,52 @@ class CambiarEstadoPedidoAPIView(APIView):
     )
 
     def post(self, request, pedido_id, *args, **kwargs):
-        try:
-            # Obtener el pedido por el ID
-            pedido = Pedido.objects.get(id=pedido_id)
+        repartidor = request.user.delivery_person
 
-            # Verificar que el pedido esté asociado al repartidor autenticado
-            if pedido.delivery_person != request.user.delivery_person:
-                return Response({'message': 'No tiene permiso para cambiar el estado de este pedido.'}, status=status.HTTP_403_FORBIDDEN)
+        # Obtener el nuevo estado desde el cuerpo de la solicitud
+        nuevo_estado = EstadoPedido.desde_texto(request.data.get('status', None))
 
-            # Obtener el nuevo estado desde el cuerpo de la solicitud
-            nuevo_estado = request.data.get('status', None)
+        # Validar que el nuevo estado sea uno de los estados válidos
+        if nuevo_estado not in self.ESTADOS_VALIDOS:
+            return Response({'message': f'Estado inválido. Los estados válidos son: {", ".join(estado.label for estado in self.ESTADOS_VALIDOS)}.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Validar que el nuevo estado sea uno de los estados válidos
-            if nuevo_estado not in self.ESTADOS_VALIDOS:
-                return Response({'message': f'Estado inválido. Los estados válidos son: {", ".join(self.ESTADOS_VALIDOS)}.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Verificar si se está cambiando de InDelivery a Entregado
-            cambiar_a_entregado = pedido.status == 'InDelivery' and nuevo_estado == 'Entregado'
-
-            # Cambiar el estado del pedido
-            pedido.status = nuevo_estado
-            pedido.save()
-            print(pedido.status)
-
-            # Verificar si se cambió de InDelivery a Entregado y el pedido tiene un cliente
-            if cambiar_a_entregado and pedido.customer_id:
-                customer = pedido.customer
-                # Incrementar las compras realizadas
-                customer.comprasRealizadas += 1
-                customer.save()
-                print(customer.comprasRealizadas)
+        try:
+            with transaction.atomic():
+                # Cambiar el estado solo si el pedido es de este repartidor y su estado lo permite
+                transicionar(pedido_id, nuevo_estado, filtros={'delivery_person': repartidor})
+
+                # Entregado solo es alcanzable desde InDelivery
+                if nuevo_estado == ENTREGADO:
+                    customer_id = Pedido.objects.filter(id=pedido_id).values_list('customer_id', flat=True).first()
+                    if customer_id:
+                        self.premiar_cliente(customer_id)
+        except Pedido.DoesNotExist:
+            return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        except TransicionInvalida as e:
+            # Verificar que el pedido esté asociado al repartidor autenticado
+            if e.pedido['delivery_person_id'] != repartidor.id:
+                return Response({'message': 'No tiene permiso para cambiar el estado de este pedido.'}, status=status.HTTP_403_FORBIDDEN)
+            return Response({'message': e.mensaje}, status=status.HTTP_400_BAD_REQUEST)
 
-                # Crear un cupón si tiene más de 3 compras realizadas
-                if customer.comprasRealizadas % 3 == 0:
-                    Coupon.objects.create(customer=customer, discount_amount=10.00)
-                    print("cupon")
+        return Response({'message': f'Estado del pedido {pedido_id} actualizado a {nuevo_estado.label} con éxito.'}, status=status.HTTP_200_OK)
 
-                # Manejar los puntos de lealtad
-                loyalty_point, created = LoyaltyPoint.objects.get_or_create(customer=customer, defaults={'points': 0})
-                loyalty_point.points += 5
-                loyalty_point.save()
-                print(loyalty_point.points)
+    def premiar_cliente(self, customer_id):
+        # Incrementar las compras realizadas
+        Customer.objects.filter(id=customer_id).update(comprasRealizadas=F('comprasRealizadas') + 1)
+        customer = Customer.objects.get(id=customer_id)
 
-            return Response({'message': f'Estado del pedido {pedido_id} actualizado a {nuevo_estado} con éxito.'}, status=status.HTTP_200_OK)
+        # Crear un cupón cada 3 compras realizadas
+        if customer.comprasRealizadas % 3 == 0:
+            Coupon.objects.create(customer=customer, discount_amount=10.00)
 
-        except Pedido.DoesNotExist:
-            return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        # Acreditar un lote de puntos de lealtad
+        acreditar_puntos(customer.id, 5)
 
 class BorrarPedidoAPIView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    ESTADOS_ELIMINABLES = ['Cancelado', 'Entregado']
+    ESTADOS_ELIMINABLES = [CANCELADO, ENTREGADO]
 
     @swagger_auto_schema(
         operation_description="Elimina un pedido asociado al repartidor autenticado",
@@ -212,7 +254,7 @@ class BorrarPedidoAPIView(APIView):
 
             # Verificar que el estado del pedido sea "Cancelado" o "Entregado"
             if pedido.status not in self.ESTADOS_ELIMINABLES:
-                return Response({'message': f'No se puede eliminar el pedido porque su estado es {pedido.status}. Solo se pueden eliminar pedidos con estado Cancelado o Entregado.'}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({'message': f'No se puede eliminar el pedido porque su estado es {pedido.get_status_display()}. Solo se pueden eliminar pedidos con estado Cancelado o Entregado.'}, status=status.HTTP_400_BAD_REQUEST)
 
             # Eliminar el pedido
             pedido.delete()
@@ -221,3 +263,36 @@ class BorrarPedidoAPIView(APIView):
 
         except Pedido.DoesNotExist:
             return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
+
+class ReclamarSiguientePedidoAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="El repartidor autenticado toma el pedido listo más antiguo que no tenga repartidor y lo pasa a InDelivery",
+        responses={
+            200: openapi.Response('Pedido asignado al repartidor'),
+            400: openapi.Response('Error: El repartidor no está online o ya tiene su capacidad completa'),
+            404: openapi.Response('Error: No hay pedidos listos para reclamar o el usuario no es repartidor')
+        }
+    )
+
+    def post(self, request, *args, **kwargs):
+        try:
+            repartidor = request.user.delivery_person
+        except Delivery_Person.DoesNotExist:
+            return Response({'message': 'El usuario no está asociado a un repartidor.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not esta_online(repartidor):
+            return Response({'message': 'El repartidor debe estar online para reclamar pedidos.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        capacidad = settings.DISPATCH_DRIVER_CAPACITY
+        if capacidad is not None and repartidor.active_orders >= capacidad:
+            return Response({'message': f'El repartidor ya tiene {repartidor.active_orders} pedidos en reparto.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        pedido_id = reclamar_siguiente(repartidor)
+        if pedido_id is None:
+            return Response({'message': 'No hay pedidos listos para reclamar.'}, status=status.HTTP_404_NOT_FOUND)
+
+        pedido = Pedido.objects.select_related('customer__user').prefetch_related('pedidofooditem_set').get(id=pedido_id)
+        return Response(PedidoSerializerPersonalizado(pedido).data, status=status.HTTP_200_OK)
@@ -0,0 +1,142 @@
+# Menu_Manager/menu_cache.py
+import gzip
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from RestauranteData.Food_Item import FoodItem
+from .serializer import FoodItemSerializer
+
+# Clave con la versión actual del menú; cada cambio en los FoodItems la incrementa
+# y con eso todos los snapshots anteriores dejan de usarse.
+MENU_VERSION_KEY = 'menu:version'
+# Stock actual de todos los items, {'stock': {food_item_id: stock}, 'hash': ...}. No forma
+# parte del snapshot: se arma con una consulta, vive MENU_STOCK_TIMEOUT segundos y se borra
+# después de cada pedido, así el menú muestra el stock de ese momento sin rearmar el snapshot.
+MENU_STOCK_KEY = 'menu:stock'
+# Vida del JSON ya renderizado con un estado de stock; cambia con cada venta, así que es corta
+RENDER_TIMEOUT = 60
+
+
+def obtener_version_menu():
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        # Si la cache se reinició arrancamos desde un valor basado en el tiempo para
+        # no reutilizar números de versión de snapshots que todavía puedan existir.
+        cache.add(MENU_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(MENU_VERSION_KEY)
+    return version
+
+
+def invalidar_menu():
+    """
+    Incrementa la versión del menú. Llamar después de cualquier cambio en un FoodItem.
+
+    La versión vive en la cache: con LocMemCache cada worker tiene la suya y esto solo
+    invalida el menú del proceso que hizo el cambio. Con más de un proceso hace falta
+    REDIS_URL.
+    """
+    invalidar_stock_menu()
+    try:
+        return cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        obtener_version_menu()
+        return cache.incr(MENU_VERSION_KEY)
+
+
+def invalidar_stock_menu():
+    """Descarta el stock cacheado del menú. Llamar después de descontar o reponer stock."""
+    cache.delete(MENU_STOCK_KEY)
+
+
+def stock_menu():
+    """Stock actual de cada item, con el total de los shards en los repartidos, y su hash."""
+    stock = cache.get(MENU_STOCK_KEY)
+    if stock is None:
+        # Import local: RestauranteData.stock importa este módulo
+        from RestauranteData.stock import stock_disponible
+
+        filas = list(FoodItem.objects.values_list('id', 'stockRestaurant', 'stockShards'))
+        actual = {food_item_id: stock for food_item_id, stock, _ in filas}
+        actual.update(stock_disponible([food_item_id for food_item_id, _, shards in filas if shards]))
+        stock = {
+            'stock': actual,
+            'hash': hashlib.md5(repr(sorted(actual.items())).encode()).hexdigest()[:12],
+        }
+        cache.set(MENU_STOCK_KEY, stock, settings.MENU_STOCK_TIMEOUT)
+    return stock
+
+
+def _url_base(request):
+    # Las image_url son absolutas, así que el snapshot depende del host con el que se pidió
+    url = request.build_absolute_uri(request.path)
+    return url, hashlib.md5(url.encode()).hexdigest()[:12]
+
+
+def _serializar_menu(request, url, solo_activos):
+    food_items = FoodItem.objects.all()
+    if solo_activos:
+        food_items = food_items.filter(isActive=True)
+
+    data = FoodItemSerializer(food_items, many=True).data
+    for item in data:
+        item['image_url'] = request.build_absolute_uri(item['image']) if item['image'] else url
+    return [dict(item) for item in data]
+
+
+def _cargar_snapshot(request, url, solo_activos, version, stock, sufijo):
+    """
+    Devuelve el JSON ya renderizado del menú y su versión gzip, así que servirlo no requiere
+    DB ni serializer. Los items serializados se guardan por versión del menú; el JSON, por
+    versión y estado del stock, con stockRestaurant tomado de stock_menu.
+    """
+    key = f'menu:{version}:{stock["hash"]}:{sufijo}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        items_key = f'menu:{version}:items:{sufijo}'
+        items = cache.get(items_key)
+        if items is None:
+            items = _serializar_menu(request, url, solo_activos)
+            cache.set(items_key, items, settings.MENU_CACHE_TIMEOUT)
+        for item in items:
+            item['stockRestaurant'] = stock['stock'].get(item['id'], item['stockRestaurant'])
+
+        # Se renderiza igual que lo haría DRF para que el contenido no cambie
+        body = JSONRenderer().render(items)
+        snapshot = {'body': body, 'gzip': gzip.compress(body, mtime=0)}
+        cache.set(key, snapshot, RENDER_TIMEOUT)
+    return snapshot
+
+
+def respuesta_menu(request, solo_activos=False):
+    """Respuesta HTTP del menú con ETag fuerte; devuelve 304 si el cliente ya tiene la versión."""
+    version = obtener_version_menu()
+    stock = stock_menu()
+    alcance = 'activos' if solo_activos else 'todos'
+    url, url_hash = _url_base(request)
+
+    # El ETag sale de la versión y del hash del stock, así que un 304 solo cuesta leerlos de la cache
+    etag = f'"menu-{alcance}-{version}-{stock["hash"]}-{url_hash}"'
+    etag_gzip = f'"menu-{alcance}-{version}-{stock["hash"]}-{url_hash}-gz"'
+
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in if_none_match or etag in if_none_match or etag_gzip in if_none_match:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag_gzip if etag_gzip in if_none_match else etag
+    else:
+        snapshot = _cargar_snapshot(request, url, solo_activos, version, stock, f'{alcance}:{url_hash}')
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(snapshot['gzip'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+            response['ETag'] = etag_gzip
+        else:
+            response = HttpResponse(snapshot['body'], content_type='application/json')
+            response['ETag'] = etag
+
+    # Los clientes deben revalidar siempre; con el ETag la revalidación cuesta un 304
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
@@ -6,3 +6,8 @@ class FoodItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = FoodItem
         fields = ['id','name', 'description', 'category', 'unitPrice', 'stockRestaurant', 'image']
+
+class FoodItemChangeSerializer(FoodItemSerializer):
+    # En el feed de cambios también se informa si el item fue desactivado
+    class Meta(FoodItemSerializer.Meta):
+        fields = FoodItemSerializer.Meta.fields + ['isActive', 'updated_at']
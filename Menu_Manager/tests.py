@@ -1,3 +1,67 @@
+import gzip
+import json
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from RestauranteData.Food_Item import FoodItem
+from RestauranteData.stock import reservar_stock
 
 # Create your tests here.
+class MenuCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.muzza = FoodItem.objects.create(name='muzza', description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=5)
+
+    def menu(self, **headers):
+        return self.client.get('/menu_manager/getFoodItems/', headers=headers)
+
+    def stock(self, response):
+        return {item['id']: item['stockRestaurant'] for item in json.loads(response.content)}
+
+    def vender(self, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                reservar_stock([(self.muzza.id, cantidad)])
+
+    def test_una_venta_parcial_se_ve_en_el_menu(self):
+        self.assertEqual(self.stock(self.menu()), {self.muzza.id: 5})
+        self.vender(2)
+        self.assertEqual(self.stock(self.menu()), {self.muzza.id: 3})
+
+    def test_el_mismo_etag_devuelve_304(self):
+        primera = self.menu()
+        self.assertEqual(primera.status_code, 200)
+
+        segunda = self.menu(if_none_match=primera['ETag'])
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        self.assertEqual(segunda.content, b'')
+
+    def test_la_variante_gzip_tiene_su_propio_etag(self):
+        plano = self.menu()
+        comprimido = self.menu(accept_encoding='gzip')
+
+        self.assertEqual(comprimido['Content-Encoding'], 'gzip')
+        self.assertEqual(comprimido['ETag'], plano['ETag'][:-1] + '-gz"')
+        self.assertEqual(gzip.decompress(comprimido.content), plano.content)
+        self.assertEqual(self.menu(accept_encoding='gzip', if_none_match=comprimido['ETag']).status_code, 304)
+
+    def test_editar_un_item_cambia_el_etag(self):
+        etag = self.menu()['ETag']
+        self.client.put(f'/menu_manager/editFoodItem/{self.muzza.id}/', {'name': 'muzzarella'}, content_type='application/json')
+
+        respuesta = self.menu(if_none_match=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(json.loads(respuesta.content)[0]['name'], 'muzzarella')
+
+    def test_agotar_un_item_cambia_el_etag(self):
+        etag = self.menu()['ETag']
+        self.vender(5)
+
+        respuesta = self.menu(if_none_match=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(self.stock(respuesta), {self.muzza.id: 0})
+
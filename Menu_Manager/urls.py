@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import AddFoodItemToRestaurantView,GetAllFoodItemsView,GetOneFoodItemView,DeleteFoodItemView,EditFoodItemView,GetOneFoodItemByIdView
-from .views import GetActiveFoodItemsView,ChangeFoodItemStatusView
+from .views import GetActiveFoodItemsView,ChangeFoodItemStatusView,GetMenuChangesView,ChangeFoodItemStockShardsView
 
 urlpatterns = [
     path('add_food_item/', AddFoodItemToRestaurantView.as_view(), name='add_food_item_to_restaurant'),
@@ -10,5 +10,7 @@ urlpatterns = [
     path('editFoodItem/<int:food_item_id>/',EditFoodItemView.as_view(),name='editfooditem'),
     path('getFoodItemById/<int:food_item_id>/',GetOneFoodItemByIdView.as_view(),name='getFoodById'),
     path('getActiveFoodItems/',GetActiveFoodItemsView.as_view(),name='getactivefooditems'),
-    path('changeFoodItemStatus/<int:fooditem_id>/',ChangeFoodItemStatusView.as_view(),name='changefooditemsstatus')
+    path('changeFoodItemStatus/<int:fooditem_id>/',ChangeFoodItemStatusView.as_view(),name='changefooditemsstatus'),
+    path('changes/',GetMenuChangesView.as_view(),name='menuchanges'),
+    path('stockShards/<int:food_item_id>/',ChangeFoodItemStockShardsView.as_view(),name='stockshards')
 ]
@@ -2,9 +2,16 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from RestauranteData.Food_Item import FoodItem
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from RestauranteData.Food_Item import FoodItem, FoodItemStockShard, FoodItemTombstone
 from RestauranteData.models import Restaurante
-from .serializer import FoodItemSerializer
+from .serializer import FoodItemSerializer, FoodItemChangeSerializer
+from .menu_cache import respuesta_menu, invalidar_menu
+from RestauranteData.stock import completar_stock, repartir_stock, MAX_SHARDS
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
@@ -30,6 +37,7 @@ class AddFoodItemToRestaurantView(APIView):
                 # Asociar el FoodItem al restaurante con id 1
                 restaurante = Restaurante.objects.get(id=1)
                 restaurante.food_item.add(food_item)
+                invalidar_menu()
                 return Response({
                     "message": "Food item agregado al restaurante exitosamente",
                     "food_item_id": food_item.id
@@ -49,12 +57,8 @@ class GetAllFoodItemsView(APIView):
     )
 
     def get(self,request):
-        food_items = FoodItem.objects.all()
-
-        serializer = FoodItemSerializer(food_items,many=True)
-        for item in  serializer.data:
-            item['image_url'] = request.build_absolute_uri(item['image'])
-        return Response(serializer.data,status=status.HTTP_200_OK)
+        # El menú se sirve ya renderizado desde la cache de la versión actual (o un 304)
+        return respuesta_menu(request)
 
 class GetActiveFoodItemsView(APIView):
     @swagger_auto_schema(
@@ -64,11 +68,7 @@ class GetActiveFoodItemsView(APIView):
         }
     )
     def get(self, request):
-        food_items = FoodItem.objects.filter(isActive=True)
-        serializer = FoodItemSerializer(food_items, many=True)
-        for item in serializer.data:
-            item['image_url'] = request.build_absolute_uri(item['image'])
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return respuesta_menu(request, solo_activos=True)
 
 class DeleteFoodItemView(APIView):
 
@@ -83,7 +83,10 @@ class DeleteFoodItemView(APIView):
     def delete(self, request, food_item_id):
         try:
             food_item = FoodItem.objects.get(id=food_item_id)
-            food_item.delete()
+            with transaction.atomic():
+                food_item.delete()
+                FoodItemTombstone.objects.create(food_item_id=food_item_id)
+            invalidar_menu()
             return Response({"message": "Food item eliminado exitosamente"}, status=status.HTTP_204_NO_CONTENT)
         except FoodItem.DoesNotExist:
             return Response({"error": "Food item no encontrado"}, status=status.HTTP_404_NOT_FOUND)
@@ -115,6 +118,7 @@ class GetOneFoodItemView(APIView):
             serializer = FoodItemSerializer(food_item)
             food_item_data = serializer.data
             food_item_data['image_url'] = request.build_absolute_uri(food_item_data['image'])
+            completar_stock([food_item_data])
             return Response(food_item_data, status=status.HTTP_200_OK)
         except FoodItem.DoesNotExist:
             return Response({"error": "Food item no encontrado"}, status=status.HTTP_404_NOT_FOUND)
@@ -141,6 +145,10 @@ class EditFoodItemView(APIView):
         serializer = FoodItemSerializer(food_item, data=request.data, partial=True)  # partial=True permite actualizaciones parciales
         if serializer.is_valid():
             updated_food_item = serializer.save()
+            if updated_food_item.stockShards and 'stockRestaurant' in request.data:
+                # Reposición de un item repartido: el nuevo stock se distribuye entre sus shards
+                repartir_stock(updated_food_item.id, updated_food_item.stockShards, total=updated_food_item.stockRestaurant)
+            invalidar_menu()
             return Response({"message": "Food item actualizado exitosamente", "food_item_id": updated_food_item.id}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -160,6 +168,7 @@ class GetOneFoodItemByIdView(APIView):
             serializer = FoodItemSerializer(food_item)
             food_item_data = serializer.data
             food_item_data['image_url'] = request.build_absolute_uri(food_item_data['image'])
+            completar_stock([food_item_data])
             return Response(food_item_data, status=status.HTTP_200_OK)
         except FoodItem.DoesNotExist:
             return Response({"error": "Food item no encontrado"}, status=status.HTTP_404_NOT_FOUND)
@@ -192,10 +201,88 @@ class ChangeFoodItemStatusView(APIView):
 
             food_item.isActive = new_status
             food_item.save()
+            invalidar_menu()
 
             return Response({'message': f'El estado del FoodItem con id {fooditem_id} ha sido actualizado a {new_status} con éxito.'}, status=status.HTTP_200_OK)
         except FoodItem.DoesNotExist:
             return Response({'message': 'El FoodItem no existe.'}, status=status.HTTP_404_NOT_FOUND)
 
+class GetMenuChangesView(APIView):
+    # Margen para no perder cambios de transacciones que confirmaron después de tomar el cursor
+    MARGEN_CURSOR = timedelta(seconds=5)
+
+    @swagger_auto_schema(
+        operation_description="Obtener los items de comida creados, modificados, desactivados o borrados desde un cursor. Sin cursor devuelve el menú completo.",
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, description="Cursor devuelto por la llamada anterior", type=openapi.TYPE_STRING),
+        ],
+        responses={
+            200: openapi.Response(description="Cambios del menú", examples={'application/json': {"cursor": "1733224800000000", "updated": [], "deleted": [3]}}),
+            400: "Cursor inválido",
+            410: "Cursor más antiguo que los borrados guardados; volver a pedir sin since"
+        }
+    )
+
+    def get(self, request):
+        # El cursor es el instante (en microsegundos) en que se armó la respuesta anterior
+        cursor = timezone.now()
+        since = request.query_params.get('since')
+
+        food_items = FoodItem.objects.all()
+        deleted = []
+        if since:
+            try:
+                desde = datetime.fromtimestamp(int(since) / 1_000_000, tz=dt_timezone.utc) - self.MARGEN_CURSOR
+            except (ValueError, OverflowError, OSError):
+                return Response({"error": "Cursor inválido"}, status=status.HTTP_400_BAD_REQUEST)
+            if desde < cursor - settings.MENU_TOMBSTONE_TTL:
+                # Los borrados de ese período ya se purgaron: el cliente debe bajar el menú completo
+                return Response({"error": "Cursor vencido, sincronizar el menú completo"}, status=status.HTTP_410_GONE)
+            # Los items en modo repartido cambian de stock en sus shards sin tocar la fila del item
+            shards_cambiados = FoodItemStockShard.objects.filter(food_item=OuterRef('pk'), updated_at__gte=desde)
+            food_items = food_items.filter(Q(updated_at__gte=desde) | Exists(shards_cambiados))
+            deleted = list(
+                FoodItemTombstone.objects.filter(deleted_at__gte=desde).values_list('food_item_id', flat=True).distinct()
+            )
+
+        serializer = FoodItemChangeSerializer(food_items, many=True)
+        for item in serializer.data:
+            item['image_url'] = request.build_absolute_uri(item['image']) if item['image'] else None
+
+        return Response({
+            "cursor": str(int(cursor.timestamp() * 1_000_000)),
+            "updated": completar_stock(serializer.data),
+            "deleted": deleted,
+        }, status=status.HTTP_200_OK)
 
+class ChangeFoodItemStockShardsView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="Activar, cambiar o desactivar el stock repartido en varios contadores de un item muy pedido. 0 desactiva el modo repartido.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'shards': openapi.Schema(type=openapi.TYPE_INTEGER, description=f"Cantidad de contadores (0 a {MAX_SHARDS})")
+            }
+        ),
+        responses={
+            200: openapi.Response(description="Modo de stock actualizado exitosamente"),
+            404: "Food item no encontrado",
+            400: "Bad Request"
+        }
+    )
+
+    def post(self, request, food_item_id):
+        shards = request.data.get('shards', None)
+        if not isinstance(shards, int) or isinstance(shards, bool) or not 0 <= shards <= MAX_SHARDS:
+            return Response({'message': f'Debe proporcionar shards como un entero entre 0 y {MAX_SHARDS}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            total = repartir_stock(food_item_id, shards)
+        except FoodItem.DoesNotExist:
+            return Response({'message': 'El FoodItem no existe.'}, status=status.HTTP_404_NOT_FOUND)
 
+        return Response({
+            'message': f'El stock del FoodItem con id {food_item_id} ahora usa {shards} shards.',
+            'stockRestaurant': total
+        }, status=status.HTTP_200_OK)
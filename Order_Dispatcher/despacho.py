@@ -0,0 +1,153 @@
+#Order_Dispatcher/despacho.py
+import heapq
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from Delivery_Person.models import Delivery_Person
+from Delivery_Person.presencia import repartidores_por_carga
+from Delivery_Person.geo import grilla_actual
+from Pedidos.models import Pedido
+from Pedidos.estados import transicionar, transicionar_en_lote, TransicionInvalida, TRANSICIONES, LISTO, EN_REPARTO
+
+# Candidatos que se prueban por vuelta cuando la base no soporta SKIP LOCKED
+CANDIDATOS_POR_INTENTO = 5
+INTENTOS_RECLAMO = 5
+# Vueltas del despacho en lote si otro actor cambia algún pedido entre la lectura y el UPDATE
+INTENTOS_DESPACHO = 3
+
+
+def elegir_repartidor(pedido_id):
+    """
+    Repartidor para un pedido que pasa a InDelivery. Si el pedido tiene coordenadas se elige el
+    más cercano con lugar entre los DISPATCH_NEAREST_K de la grilla; si no, o si ninguno de ellos
+    tiene lugar, el repartidor presente con menos pedidos en reparto.
+
+    Antes de buscar se valida el pedido con la misma lectura de sus coordenadas: lanza
+    Pedido.DoesNotExist si no existe y TransicionInvalida si su estado no puede pasar a
+    InDelivery, así no se recorre la grilla por un pedido que se va a rechazar.
+    transicionar lo vuelve a verificar en el UPDATE.
+    """
+    capacidad = settings.DISPATCH_DRIVER_CAPACITY
+
+    pedido = Pedido.objects.filter(id=pedido_id).values('id', 'status', 'customer_id', 'delivery_person_id', 'lat', 'lon').first()
+    if pedido is None:
+        raise Pedido.DoesNotExist(f'El pedido {pedido_id} no existe.')
+    if EN_REPARTO not in TRANSICIONES.get(pedido['status'], ()):
+        raise TransicionInvalida(pedido, EN_REPARTO)
+
+    lat, lon = pedido['lat'], pedido['lon']
+    if lat is not None and lon is not None:
+        cercanos = grilla_actual().mas_cercanos(lat, lon, settings.DISPATCH_NEAREST_K)
+        if cercanos:
+            repartidores = Delivery_Person.objects.select_related('user').in_bulk([repartidor_id for _, repartidor_id in cercanos])
+            for _, repartidor_id in cercanos:
+                repartidor = repartidores.get(repartidor_id)
+                # La grilla puede tener unos segundos de atraso: se confirma con la fila
+                if repartidor and repartidor.is_online and (capacidad is None or repartidor.active_orders < capacidad):
+                    return repartidor
+
+    # El índice de carga se recorre en orden y solo se confirma el latido de los primeros
+    candidatos = repartidores_por_carga(1, capacidad)
+    if not candidatos:
+        return None
+    return Delivery_Person.objects.select_related('user').filter(id=candidatos[0][0]).first()
+
+
+def repartir(pedido_ids, repartidores, capacidad=None):
+    """
+    Asigna pedidos a repartidores balanceando la carga con un min-heap sobre active_orders.
+
+    pedido_ids: ids en orden de prioridad. repartidores: iterable de (id, active_orders).
+    capacidad: máximo de pedidos en reparto por repartidor (None = sin límite).
+    Devuelve {pedido_id: delivery_person_id}; los pedidos que no entran quedan fuera.
+    """
+    heap = [(carga, repartidor_id) for repartidor_id, carga in repartidores]
+    heapq.heapify(heap)
+
+    asignaciones = {}
+    for pedido_id in pedido_ids:
+        if not heap:
+            break
+        carga, repartidor_id = heap[0]
+        if capacidad is not None and carga >= capacidad:
+            # El menos cargado ya está lleno, así que todos lo están
+            break
+        asignaciones[pedido_id] = repartidor_id
+        heapq.heapreplace(heap, (carga + 1, repartidor_id))
+    return asignaciones
+
+
+def despachar_en_lote(capacidad=None):
+    """
+    Pasa a InDelivery todos los pedidos en Listo que entren en los repartidores con latido
+    vigente, los más antiguos primero. Los pedidos en Cocina se despachan cuando la cocina los
+    marca Listo. Las asignaciones se aplican con transicionar_en_lote: un UPDATE de pedidos que
+    vuelve a exigir status = Listo en el WHERE, uno de cargas y un INSERT de eventos sin
+    importar cuántos pedidos sean. Si otro actor cambió alguno entre la lectura y el UPDATE,
+    la vuelta se revierte completa y se repite.
+
+    Devuelve (asignaciones {pedido_id: delivery_person_id}, cantidad de pedidos sin asignar).
+    """
+    if capacidad is None:
+        capacidad = settings.DISPATCH_DRIVER_CAPACITY
+
+    for _ in range(INTENTOS_DESPACHO):
+        with transaction.atomic():
+            # Los pedidos que otro dispatcher está moviendo en este momento se saltean en vez de esperar
+            pedidos = Pedido.objects.filter(status=LISTO).order_by('created_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                pedidos = pedidos.select_for_update(skip_locked=True)
+            else:
+                pedidos = pedidos.select_for_update()
+            pedido_ids = list(pedidos.values_list('id', flat=True))
+
+            # Con N pedidos el min-heap usa a lo sumo los N repartidores menos cargados
+            repartidores = repartidores_por_carga(len(pedido_ids), capacidad)
+            asignaciones = repartir(pedido_ids, repartidores, capacidad)
+            if not asignaciones:
+                return {}, len(pedido_ids)
+
+            asignado = transicionar_en_lote(
+                asignaciones, EN_REPARTO, desde=[LISTO],
+                delivery_person_id=Case(
+                    *[When(id=pedido_id, then=Value(repartidor_id)) for pedido_id, repartidor_id in asignaciones.items()],
+                    output_field=IntegerField(),
+                ),
+            )
+            if asignado:
+                return asignaciones, len(pedido_ids) - len(asignaciones)
+    return {}, len(pedido_ids)
+
+
+def reclamar_siguiente(repartidor):
+    """
+    El repartidor toma el pedido Listo sin repartidor más antiguo y lo pasa a InDelivery.
+    Devuelve el id del pedido, o None si no hay ninguno disponible.
+
+    En PostgreSQL el candidato se bloquea con SELECT ... FOR UPDATE SKIP LOCKED, así varios
+    repartidores reclamando a la vez reciben pedidos distintos sin esperarse. Donde no hay
+    SKIP LOCKED (SQLite) se intenta con el UPDATE condicional de transicionar sobre los
+    candidatos más antiguos; si otro lo ganó antes se pasa al siguiente.
+    """
+    listos = Pedido.objects.filter(status=LISTO, delivery_person__isnull=True).order_by('created_at', 'id')
+    reclamar = dict(desde=[LISTO], filtros={'delivery_person__isnull': True}, delivery_person=repartidor)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pedido_id = listos.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+            if pedido_id is None:
+                return None
+            transicionar(pedido_id, EN_REPARTO, **reclamar)
+            return pedido_id
+
+    for _ in range(INTENTOS_RECLAMO):
+        candidatos = list(listos.values_list('id', flat=True)[:CANDIDATOS_POR_INTENTO])
+        if not candidatos:
+            return None
+        for pedido_id in candidatos:
+            try:
+                transicionar(pedido_id, EN_REPARTO, **reclamar)
+                return pedido_id
+            except (Pedido.DoesNotExist, TransicionInvalida):
+                continue
+    return None
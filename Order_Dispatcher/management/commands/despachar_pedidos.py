@@ -0,0 +1,32 @@
+#Order_Dispatcher/management/commands/despachar_pedidos.py
+from django.core.management.base import BaseCommand, CommandError
+from Order_Dispatcher.despacho import despachar_en_lote
+from Order_Dispatcher.viajes import despachar_viajes
+
+
+class Command(BaseCommand):
+    help = "Asigna en lote los pedidos en Listo a los repartidores online."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacidad', type=int, default=None,
+                            help="Máximo de pedidos en reparto por repartidor (por defecto DISPATCH_DRIVER_CAPACITY).")
+        parser.add_argument('--viajes', action='store_true',
+                            help="Agrupa los pedidos listos cercanos en viajes en lugar de asignarlos uno por uno.")
+
+    def handle(self, *args, **options):
+        capacidad = options['capacidad']
+        if capacidad is not None and capacidad < 1:
+            raise CommandError("La capacidad debe ser mayor o igual a 1.")
+
+        if options['viajes']:
+            viajes, sin_asignar = despachar_viajes(capacidad)
+            for viaje in viajes:
+                paradas = ", ".join(str(pedido_id) for pedido_id in viaje['pedidos'])
+                self.stdout.write(f"Viaje {viaje['viaje_id']} -> repartidor {viaje['delivery_person_id']}: {paradas}")
+            self.stdout.write(self.style.SUCCESS(f"Se crearon {len(viajes)} viajes; {sin_asignar} pedidos quedaron sin asignar."))
+            return
+
+        asignaciones, sin_asignar = despachar_en_lote(capacidad)
+        for pedido_id, repartidor_id in asignaciones.items():
+            self.stdout.write(f"Pedido {pedido_id} -> repartidor {repartidor_id}")
+        self.stdout.write(self.style.SUCCESS(f"Se asignaron {len(asignaciones)} pedidos; {sin_asignar} quedaron sin asignar."))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Delivery_Person', '0003_delivery_person_active_orders'),
+        ('Order_Dispatcher', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Viaje',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivery_person', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='viajes', to='Delivery_Person.delivery_person')),
+            ],
+        ),
+    ]
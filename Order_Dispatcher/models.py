@@ -2,6 +2,7 @@
 from django.db import models
 from RestauranteData.models import Restaurante
 from Authentication.models import BaseUser
+from Delivery_Person.models import Delivery_Person
 
 # Create your models here.
 class Order_Dispatcher(models.Model):
@@ -9,4 +10,13 @@ class Order_Dispatcher(models.Model):
     restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE)
     
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+
+class Viaje(models.Model):
+    """Grupo de pedidos cercanos que un repartidor entrega en una sola salida (Pedido.orden_parada)."""
+    delivery_person = models.ForeignKey(Delivery_Person, null=True, on_delete=models.SET_NULL, related_name='viajes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Viaje {self.id}"
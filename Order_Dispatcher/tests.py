@@ -1,3 +1,60 @@
+from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Authentication.models import BaseUser
+from Pedidos.models import Pedido
+from Pedidos.estados import PENDIENTE
+from .viajes import agrupar_en_viajes
 
 # Create your tests here.
+class ActualizarEstadoDispatcherTests(TestCase):
+
+    def setUp(self):
+        user = BaseUser.objects.create_user(username='dispatcher', email='dispatcher@example.com', password='clave')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def en_reparto(self, pedido_id):
+        return self.client.post(f'/order_dispatcher/updateStatus/{pedido_id}/', {'status': 'InDelivery'}, format='json')
+
+    def test_pedido_inexistente_da_404_aunque_no_haya_repartidores(self):
+        response = self.en_reparto(999)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['message'], 'El pedido no existe.')
+
+    def test_estado_que_no_puede_pasar_a_reparto_da_el_error_de_la_transicion(self):
+        pedido = Pedido.objects.create(address='Calle 1', description='Pedido', status=PENDIENTE)
+        response = self.en_reparto(pedido.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'El pedido en Pendiente solo puede cambiar a Cancelado o Cocina.')
+
+
+class AgruparEnViajesTests(TestCase):
+
+    def pedido(self, pedido_id, lat, lon, segundos):
+        return {'id': pedido_id, 'address': f'Calle {pedido_id}', 'lat': lat, 'lon': lon,
+                'listo': self.inicio + timedelta(seconds=segundos)}
+
+    def setUp(self):
+        self.inicio = timezone.now()
+
+    def ids(self, viajes):
+        return [[pedido['id'] for pedido in viaje] for viaje in viajes]
+
+    def test_misma_celda_fuera_de_la_ventana_son_viajes_distintos(self):
+        pedidos = [self.pedido(1, 0.001, 0.001, 0), self.pedido(2, 0.002, 0.002, 700)]
+        self.assertEqual(self.ids(agrupar_en_viajes(pedidos, ventana=600, max_paradas=4)), [[1], [2]])
+
+    def test_misma_celda_dentro_de_la_ventana_van_juntos_y_otra_celda_aparte(self):
+        pedidos = [
+            self.pedido(1, 0.001, 0.001, 0),
+            self.pedido(2, 0.5, 0.5, 10),
+            self.pedido(3, 0.002, 0.002, 300),
+        ]
+        self.assertEqual(self.ids(agrupar_en_viajes(pedidos, ventana=600, max_paradas=4)), [[1, 3], [2]])
+
+    def test_el_maximo_de_paradas_corta_el_viaje(self):
+        pedidos = [self.pedido(n, 0.001, 0.001, n) for n in range(1, 4)]
+        self.assertEqual(self.ids(agrupar_en_viajes(pedidos, ventana=600, max_paradas=2)), [[1, 2], [3]])
+
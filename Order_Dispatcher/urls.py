@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import ActualizarEstadoPedidoDispatcherAPIView
+from .views import ActualizarEstadoPedidoDispatcherAPIView, DespachoEnLoteAPIView, DespachoPorViajesAPIView
 
 urlpatterns = [
-    path('updateStatus/<int:pedido_id>/',ActualizarEstadoPedidoDispatcherAPIView.as_view(),name='updatestatus')
-]
+    path('updateStatus/<int:pedido_id>/',ActualizarEstadoPedidoDispatcherAPIView.as_view(),name='updatestatus'),
+    path('batchDispatch/',DespachoEnLoteAPIView.as_view(),name='batchdispatch'),
+    path('dispatchTrips/',DespachoPorViajesAPIView.as_view(),name='dispatchtrips')
+]
\ No newline at end of file
@@ -0,0 +1,187 @@
+#Order_Dispatcher/viajes.py
+import heapq
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from Delivery_Person.models import Delivery_Person
+from Delivery_Person.presencia import repartidores_por_carga
+from Delivery_Person.geo import celda, distancia_km, grilla_actual
+from Pedidos.models import Pedido
+from Pedidos.direcciones import normalizar_direccion
+from Pedidos.estados import transicionar_en_lote, LISTO, EN_REPARTO
+from .models import Viaje
+
+# Vueltas del despacho si otro actor cambia algún pedido entre la lectura y el UPDATE
+INTENTOS_DESPACHO = 3
+
+
+def _zona(pedido):
+    # Pedidos con coordenadas se agrupan por celda; los demás, por dirección exacta
+    if pedido['lat'] is not None and pedido['lon'] is not None:
+        return celda(pedido['lat'], pedido['lon'], settings.DISPATCH_TRIP_CELL_DEGREES)
+    return normalizar_direccion(pedido['address'])
+
+
+def _ordenar_paradas(pedidos):
+    """Empieza por el pedido listo hace más tiempo y sigue siempre por la parada más cercana."""
+    if any(pedido['lat'] is None for pedido in pedidos):
+        return pedidos
+    ruta = [pedidos[0]]
+    pendientes = pedidos[1:]
+    while pendientes:
+        actual = ruta[-1]
+        siguiente = min(pendientes, key=lambda p: distancia_km(actual['lat'], actual['lon'], p['lat'], p['lon']))
+        pendientes.remove(siguiente)
+        ruta.append(siguiente)
+    return ruta
+
+
+def agrupar_en_viajes(pedidos, ventana=None, max_paradas=None):
+    """
+    Agrupa pedidos listos en viajes: misma zona y listos con menos de `ventana` segundos
+    de diferencia, hasta max_paradas por viaje. Cada viaje sale con las paradas ya ordenadas.
+
+    pedidos: dicts con id, address, lat, lon y listo (datetime). Devuelve una lista de viajes
+    (listas de esos dicts), primero los que tienen el pedido listo hace más tiempo.
+    """
+    ventana = settings.DISPATCH_TRIP_WINDOW_SECONDS if ventana is None else ventana
+    max_paradas = max_paradas or settings.DISPATCH_TRIP_MAX_STOPS
+
+    zonas = {}
+    for pedido in sorted(pedidos, key=lambda p: (p['listo'], p['id'])):
+        zonas.setdefault(_zona(pedido), []).append(pedido)
+
+    viajes = []
+    for grupo in zonas.values():
+        actual = []
+        for pedido in grupo:
+            if actual and (len(actual) == max_paradas or (pedido['listo'] - actual[0]['listo']).total_seconds() > ventana):
+                viajes.append(actual)
+                actual = []
+            actual.append(pedido)
+        viajes.append(actual)
+
+    viajes.sort(key=lambda viaje: (viaje[0]['listo'], viaje[0]['id']))
+    return [_ordenar_paradas(viaje) for viaje in viajes]
+
+
+def _cargas_candidatas(viajes, grilla, capacidad):
+    """
+    {repartidor_id: active_orders} de los únicos repartidores que el despacho puede elegir:
+    los len(viajes) menos cargados (recorriendo el índice de carga) y los DISPATCH_NEAREST_K
+    más cercanos a la primera parada de cada viaje. No depende de cuántos haya online.
+    """
+    cargas = dict(repartidores_por_carga(len(viajes), capacidad))
+    cercanos = {
+        repartidor_id
+        for viaje in viajes if viaje[0]['lat'] is not None
+        for _, repartidor_id in grilla.mas_cercanos(viaje[0]['lat'], viaje[0]['lon'], settings.DISPATCH_NEAREST_K)
+    } - set(cargas)
+    if cercanos:
+        # La grilla puede tener unos segundos de atraso: se confirma con la fila
+        cargas.update(Delivery_Person.objects.filter(id__in=cercanos, is_online=True).values_list('id', 'active_orders'))
+    return cargas
+
+
+def _asignar_repartidores(viajes, cargas, capacidad, grilla):
+    """
+    Elige un repartidor por viaje: el más cercano a la primera parada que tenga lugar para
+    todo el viaje o, si no hay, el menos cargado. Devuelve [(viaje, repartidor_id)].
+    """
+    heap = [(carga, repartidor_id) for repartidor_id, carga in cargas.items()]
+    heapq.heapify(heap)
+
+    def cabe(repartidor_id, paradas):
+        return capacidad is None or cargas[repartidor_id] + paradas <= capacidad
+
+    asignados = []
+    for viaje in viajes:
+        elegido = None
+        primera = viaje[0]
+        if primera['lat'] is not None:
+            for _, repartidor_id in grilla.mas_cercanos(primera['lat'], primera['lon'], settings.DISPATCH_NEAREST_K):
+                if repartidor_id in cargas and cabe(repartidor_id, len(viaje)):
+                    elegido = repartidor_id
+                    break
+
+        if elegido is None:
+            # Las entradas del heap con una carga vieja se descartan al salir
+            while heap and heap[0][0] != cargas[heap[0][1]]:
+                heapq.heappop(heap)
+            if heap and cabe(heap[0][1], len(viaje)):
+                elegido = heap[0][1]
+
+        if elegido is None:
+            continue
+        cargas[elegido] += len(viaje)
+        heapq.heappush(heap, (cargas[elegido], elegido))
+        asignados.append((viaje, elegido))
+    return asignados
+
+
+def despachar_viajes(capacidad=None):
+    """
+    Agrupa los pedidos Listo sin repartidor en viajes y asigna cada viaje a un repartidor
+    presente, pasando sus pedidos a InDelivery con su orden de parada. Todo en una transacción
+    con transicionar_en_lote: un UPDATE de pedidos que vuelve a exigir status = Listo, uno de
+    cargas y un INSERT de eventos. Si otro actor cambió algún pedido entre la lectura y el
+    UPDATE, la vuelta (viajes incluidos) se revierte y se repite.
+
+    Devuelve (viajes creados, cantidad de pedidos que quedaron sin asignar).
+    """
+    if capacidad is None:
+        capacidad = settings.DISPATCH_DRIVER_CAPACITY
+
+    for _ in range(INTENTOS_DESPACHO):
+        with transaction.atomic():
+            listos = Pedido.objects.filter(status=LISTO, delivery_person__isnull=True)
+            if connection.features.has_select_for_update_skip_locked:
+                listos = listos.select_for_update(skip_locked=True)
+            else:
+                listos = listos.select_for_update()
+            pedidos = [
+                {**pedido, 'listo': pedido['listo_at'] or pedido['created_at']}
+                for pedido in listos.values('id', 'address', 'lat', 'lon', 'listo_at', 'created_at')
+            ]
+            if not pedidos:
+                return [], 0
+
+            grupos = agrupar_en_viajes(pedidos)
+            grilla = grilla_actual()
+            cargas = _cargas_candidatas(grupos, grilla, capacidad)
+            asignados = _asignar_repartidores(grupos, cargas, capacidad, grilla)
+            if not asignados:
+                return [], len(pedidos)
+
+            viajes = Viaje.objects.bulk_create([Viaje(delivery_person_id=repartidor_id) for _, repartidor_id in asignados])
+
+            repartidor_de, viaje_de, parada_de = {}, {}, {}
+            for viaje, (paradas, repartidor_id) in zip(viajes, asignados):
+                for orden, pedido in enumerate(paradas, start=1):
+                    repartidor_de[pedido['id']] = repartidor_id
+                    viaje_de[pedido['id']] = viaje.id
+                    parada_de[pedido['id']] = orden
+
+            def por_pedido(valores):
+                return Case(
+                    *[When(id=pedido_id, then=Value(valor)) for pedido_id, valor in valores.items()],
+                    output_field=IntegerField(),
+                )
+
+            asignado = transicionar_en_lote(
+                repartidor_de, EN_REPARTO, desde=[LISTO], filtros={'delivery_person__isnull': True},
+                delivery_person_id=por_pedido(repartidor_de),
+                viaje_id=por_pedido(viaje_de),
+                orden_parada=por_pedido(parada_de),
+            )
+            if not asignado:
+                # Los viajes creados en esta vuelta se descartan con ella
+                transaction.set_rollback(True)
+                continue
+
+            resultado = [
+                {'viaje_id': viaje.id, 'delivery_person_id': repartidor_id, 'pedidos': [pedido['id'] for pedido in paradas]}
+                for viaje, (paradas, repartidor_id) in zip(viajes, asignados)
+            ]
+            return resultado, len(pedidos) - len(repartidor_de)
+    return [], len(pedidos)
@@ -1,18 +1,19 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from Pedidos.models import Pedido
-from Delivery_Person.models import Delivery_Person
+from Pedidos.models import Pedido, EstadoPedido
+from Pedidos.estados import transicionar, TransicionInvalida, COCINA, LISTO, EN_REPARTO
+from .despacho import despachar_en_lote, elegir_repartidor
+from .viajes import despachar_viajes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.db.models import Count
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 class ActualizarEstadoPedidoDispatcherAPIView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
-    ESTADOS_VALIDOS = ['Listo', 'InDelivery', 'Cocina']
+    ESTADOS_VALIDOS = [LISTO, EN_REPARTO, COCINA]
 
     @swagger_auto_schema(
         operation_description="Actualizar el estado de un pedido por el dispatcher.",
@@ -37,7 +38,7 @@ class ActualizarEstadoPedidoDispatcherAPIView(APIView):
                 description="Error: El estado del pedido es inválido o no se puede cambiar.",
                 examples={
                     "application/json": {
-                        "message": "El pedido solo puede cambiar de Pendiente a Cocina."
+                        "message": "El pedido en Pendiente solo puede cambiar a Cancelado o Cocina."
                     }
                 }
             ),
@@ -54,44 +55,147 @@ class ActualizarEstadoPedidoDispatcherAPIView(APIView):
 
 
     def post(self, request, pedido_id, *args, **kwargs):
+        # Obtener el nuevo estado desde el cuerpo de la solicitud
+        nuevo_estado = EstadoPedido.desde_texto(request.data.get('status', None))
+
+        # Validar que el nuevo estado sea uno de los estados válidos
+        if nuevo_estado not in self.ESTADOS_VALIDOS:
+            return Response({'message': f'Estado inválido. Los estados válidos son: {", ".join(estado.label for estado in self.ESTADOS_VALIDOS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cambios = {}
+        delivery_person = None
         try:
-            # Obtener el pedido por el ID
-            pedido = Pedido.objects.get(id=pedido_id)
+            # Si el nuevo estado es InDelivery, asignar un repartidor en el mismo UPDATE
+            if nuevo_estado == EN_REPARTO:
+                # Valida el pedido y busca el repartidor más cercano con lugar, o el menos cargado si no tiene coordenadas
+                delivery_person = elegir_repartidor(pedido_id)
 
-            # Obtener el nuevo estado desde el cuerpo de la solicitud
-            nuevo_estado = request.data.get('status', None)
+                if not delivery_person:
+                    return Response({'message': 'No hay repartidores disponibles en línea.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Validar que el nuevo estado sea uno de los estados válidos
-            if nuevo_estado not in self.ESTADOS_VALIDOS:
-                return Response({'message': f'Estado inválido. Los estados válidos son: {", ".join(self.ESTADOS_VALIDOS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+                cambios['delivery_person'] = delivery_person
 
-            # Validar el cambio de estado según las reglas especificadas
-            if pedido.status == 'Pendiente' and nuevo_estado != 'Cocina':
-                return Response({'message': 'El pedido solo puede cambiar de Pendiente a Cocina.'}, status=status.HTTP_400_BAD_REQUEST)
-            if pedido.status == 'Cocina' and nuevo_estado not in ['Listo', 'InDelivery']:
-                return Response({'message': 'El pedido en Cocina solo puede cambiar a Listo o InDelivery.'}, status=status.HTTP_400_BAD_REQUEST)
+            # Cambiar el estado del pedido solo si su estado actual lo permite
+            transicionar(pedido_id, nuevo_estado, **cambios)
+        except Pedido.DoesNotExist:
+            return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        except TransicionInvalida as e:
+            return Response({'message': e.mensaje}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Si el nuevo estado es InDelivery y el estado actual es Cocina, asignar un repartidor
-            if pedido.status == 'Cocina' and nuevo_estado == 'InDelivery':
-                # Buscar un repartidor online con menos pedidos asignados
-                delivery_person = Delivery_Person.objects.filter(is_online=True)\
-                                        .annotate(num_pedidos=Count('pedido'))\
-                                        .order_by('num_pedidos').first()
+        message = f'Estado del pedido {pedido_id} actualizado a {nuevo_estado.label} con éxito.'
+        if delivery_person:
+            message += f' Asignado al repartidor {delivery_person.user.username}.'
 
-                if not delivery_person:
-                    return Response({'message': 'No hay repartidores disponibles en línea.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': message}, status=status.HTTP_200_OK)
 
-                pedido.delivery_person = delivery_person
 
-            # Cambiar el estado del pedido
-            pedido.status = nuevo_estado
-            pedido.save()
+class DespachoEnLoteAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
 
-            message = f'Estado del pedido {pedido_id} actualizado a {nuevo_estado} con éxito.'
-            if nuevo_estado == 'InDelivery':
-                message += f' Asignado al repartidor {pedido.delivery_person.user.username}.'
+    @swagger_auto_schema(
+        operation_description="Asigna en una sola pasada todos los pedidos en Listo a los repartidores online, balanceando la carga.",
+        operation_summary="Despacho en lote de pedidos. Requiere TOKEN",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'capacidad': openapi.Schema(type=openapi.TYPE_INTEGER, description="Máximo de pedidos en reparto por repartidor (opcional).")
+            }
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Asignaciones realizadas.",
+                examples={
+                    "application/json": {
+                        "message": "Se asignaron 2 pedidos.",
+                        "asignaciones": [{"pedido_id": 1, "delivery_person_id": 3}, {"pedido_id": 2, "delivery_person_id": 4}],
+                        "sin_asignar": 0
+                    }
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Error: La capacidad es inválida.",
+                examples={
+                    "application/json": {
+                        "message": "La capacidad debe ser un número entero mayor o igual a 1."
+                    }
+                }
+            )
+        }
+    )
 
-            return Response({'message': message}, status=status.HTTP_200_OK)
+    def post(self, request, *args, **kwargs):
+        capacidad = request.data.get('capacidad', None)
+        if capacidad is not None:
+            try:
+                capacidad = int(capacidad)
+            except (TypeError, ValueError):
+                capacidad = 0
+            if capacidad < 1:
+                return Response({'message': 'La capacidad debe ser un número entero mayor o igual a 1.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        except Pedido.DoesNotExist:
-            return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        asignaciones, sin_asignar = despachar_en_lote(capacidad)
+
+        return Response({
+            'message': f'Se asignaron {len(asignaciones)} pedidos.',
+            'asignaciones': [
+                {'pedido_id': pedido_id, 'delivery_person_id': repartidor_id}
+                for pedido_id, repartidor_id in asignaciones.items()
+            ],
+            'sin_asignar': sin_asignar
+        }, status=status.HTTP_200_OK)
+
+
+class DespachoPorViajesAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Agrupa los pedidos listos cercanos (por zona y hora en que quedaron listos) en viajes y asigna cada viaje a un repartidor con el orden de sus paradas.",
+        operation_summary="Despacho de pedidos listos agrupados en viajes. Requiere TOKEN",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'capacidad': openapi.Schema(type=openapi.TYPE_INTEGER, description="Máximo de pedidos en reparto por repartidor (opcional).")
+            }
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="Viajes creados.",
+                examples={
+                    "application/json": {
+                        "message": "Se crearon 1 viajes con 3 pedidos.",
+                        "viajes": [{"viaje_id": 1, "delivery_person_id": 3, "pedidos": [4, 7, 5]}],
+                        "sin_asignar": 0
+                    }
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Error: La capacidad es inválida.",
+                examples={
+                    "application/json": {
+                        "message": "La capacidad debe ser un número entero mayor o igual a 1."
+                    }
+                }
+            )
+        }
+    )
+
+    def post(self, request, *args, **kwargs):
+        capacidad = request.data.get('capacidad', None)
+        if capacidad is not None:
+            try:
+                capacidad = int(capacidad)
+            except (TypeError, ValueError):
+                capacidad = 0
+            if capacidad < 1:
+                return Response({'message': 'La capacidad debe ser un número entero mayor o igual a 1.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        viajes, sin_asignar = despachar_viajes(capacidad)
+        pedidos = sum(len(viaje['pedidos']) for viaje in viajes)
+
+        return Response({
+            'message': f'Se crearon {len(viajes)} viajes con {pedidos} pedidos.',
+            'viajes': viajes,
+            'sin_asignar': sin_asignar
+        }, status=status.HTTP_200_OK)
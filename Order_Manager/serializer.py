@@ -1,6 +1,12 @@
 from rest_framework import serializers
 from Pedidos.models import Pedido, PedidoFoodItem
 from RestauranteData.models import FoodItem
+from RestauranteData.stock import reservar_stock, StockInsuficiente
+from django.db import transaction
+from Pedidos.admision import ocupar_cocina
+from Pedidos.estados import PENDIENTE, registrar_eventos
+from Pedidos.produccion import ajustar_produccion
+from Pedidos.direcciones import resolver_coordenadas
 
 class PedidoSerializer(serializers.ModelSerializer):
     food_items = serializers.ListField(
@@ -10,52 +16,70 @@ class PedidoSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Pedido
-        fields = ['customer_name', 'customer_email', 'customer_phone', 'address', 'description', 'food_items']
+        fields = ['customer_name', 'customer_email', 'customer_phone', 'address', 'description', 'lat', 'lon', 'food_items']
+
+    def validate(self, data):
+        if (data.get('lat') is None) != (data.get('lon') is None):
+            raise serializers.ValidationError("Se deben enviar lat y lon juntos.")
+        return data
     
     def create(self, validated_data):
         food_items_data = validated_data.pop('food_items')
         
         # Validar que todos los food_item_id existan
         food_item_ids = [item['food_item_id'] for item in food_items_data]
-        existing_food_items = FoodItem.objects.filter(id__in=food_item_ids)
-        if existing_food_items.count() != len(food_item_ids):
+        existing_food_items = {food_item.id: food_item for food_item in FoodItem.objects.filter(id__in=food_item_ids)}
+        if len(existing_food_items) != len(set(food_item_ids)):
             raise serializers.ValidationError("Uno o más food_item_id no son válidos. Verifica los datos enviados.")
+        if any(item_data['quantity'] < 1 for item_data in food_items_data):
+            raise serializers.ValidationError("La cantidad de cada artículo debe ser al menos 1.")
         
         # Configurar estado automáticamente en "Pendiente"
-        validated_data['status'] = 'Pendiente'
-        
-        # Crear el pedido
-        pedido = Pedido.objects.create(**validated_data)
+        validated_data['status'] = PENDIENTE
         
-        # Crear los food_items asociados al pedido y reducir el stock
-        total_price = 0
-        for item_data in food_items_data:
-            food_item = existing_food_items.get(id=item_data['food_item_id'])
-            quantity = item_data['quantity']
-            
-            # Verificar que hay suficiente stock
-            if food_item.stockRestaurant < quantity:
-                raise serializers.ValidationError(f"No hay suficiente stock para el artículo {food_item.name}.")
-            
-            # Reducir el stock
-            food_item.stockRestaurant -= quantity
-            food_item.save()
-            
-            # Calcular el precio total
-            total_price += food_item.unitPrice * quantity
-            
-            PedidoFoodItem.objects.create(
-                pedido=pedido,
-                food_item_name=food_item.name,
-                food_item_price=food_item.unitPrice,
-                quantity=quantity,
-                food_item_description=food_item.description,
-                food_item_image=food_item.image
-            )
-        
-        # Actualizar el total del pedido
-        pedido.Total = total_price
-        pedido.save()
+        try:
+            with transaction.atomic():
+                # Reducir el stock de todas las líneas de una vez; si alguna no alcanza no se crea nada
+                reservar_stock((item_data['food_item_id'], item_data['quantity']) for item_data in food_items_data)
+
+                # Crear el pedido con coordenadas enviadas o buscadas por dirección
+                validated_data['lat'], validated_data['lon'] = resolver_coordenadas(
+                    validated_data['address'], validated_data.get('lat'), validated_data.get('lon')
+                )
+                pedido = Pedido.objects.create(**validated_data)
+                registrar_eventos([pedido.id], PENDIENTE)
+                
+                # Crear los food_items asociados al pedido
+                total_price = 0
+                for item_data in food_items_data:
+                    food_item = existing_food_items[item_data['food_item_id']]
+                    quantity = item_data['quantity']
+                    
+                    # Calcular el precio total
+                    total_price += food_item.unitPrice * quantity
+                    
+                    PedidoFoodItem.objects.create(
+                        pedido=pedido,
+                        food_item_name=food_item.name,
+                        food_item_price=food_item.unitPrice,
+                        quantity=quantity,
+                        food_item_description=food_item.description,
+                        food_item_image=food_item.image
+                    )
+                
+                # Actualizar el total del pedido
+                pedido.Total = total_price
+                pedido.save()
+                ajustar_produccion([pedido.id], 1)
+                # No pasa por la admisión, pero ocupa la cocina igual que los del checkout
+                ocupar_cocina(sum(item_data['quantity'] for item_data in food_items_data))
+        except StockInsuficiente as e:
+            raise serializers.ValidationError({
+                "food_items": [
+                    f"No hay suficiente stock para el artículo {faltante['name']}. Disponibles: {faltante['available']}."
+                    for faltante in e.faltantes
+                ]
+            })
         
         return pedido
 
@@ -66,13 +90,15 @@ class PedidoFoodItemSerializer(serializers.ModelSerializer):
 
 class PedidoSerializerPersonalizado(serializers.ModelSerializer):
     food_items = PedidoFoodItemSerializer(source='pedidofooditem_set', many=True)
+    # En la base el estado es un entero; la API sigue usando el nombre
+    status = serializers.CharField(source='get_status_display', read_only=True)
     
     class Meta:
         model = Pedido
         fields = ['id', 'created_at', 'description', 'address', 'status', 
                   'customer_name', 'customer_email', 'customer_phone', 
                   'order_manager', 'order_dispatcher', 'delivery_person', 
-                  'Total', 'food_items']
+                  'Total', 'viaje', 'orden_parada', 'food_items']
 
     def to_representation(self, instance):
         # Convertir el pedido en una representación JSON
@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import CreatePedidoAPIView,ListarPedidosAPIView,CancelarPedidoAPIView,VerPedidoDetalladoAPIView,BorrarPedidoAPIView,ListarPedidosPorEstadoAPIView
-from .views import ListarRepartidoresAPIView,ListarRepartidoresPaginationAPIView,AsociarRepartidorAPedidoAPIView
+from .views import ListarRepartidoresAPIView,ListarRepartidoresPaginationAPIView,AsociarRepartidorAPedidoAPIView,KitchenFeedView,ProduccionCocinaAPIView
 
 urlpatterns = [
     path('createOrder/',CreatePedidoAPIView.as_view(),name='createorder'),
@@ -11,5 +11,7 @@ urlpatterns = [
     path('viewOrdersForStatus/',ListarPedidosPorEstadoAPIView.as_view(),name='viewordersforstatus'),
     path('viewAllDeliverysForStatus/',ListarRepartidoresAPIView.as_view(),name='viewAllDeliverys'),
     path('viewAllDeliverysPagination/',ListarRepartidoresPaginationAPIView.as_view(),name='viewDeliverypagination'),
-    path('linkDeliveryToOrder/',AsociarRepartidorAPedidoAPIView.as_view(),name='linkdeliverytoorder')
+    path('linkDeliveryToOrder/',AsociarRepartidorAPedidoAPIView.as_view(),name='linkdeliverytoorder'),
+    path('kitchenFeed/',KitchenFeedView.as_view(),name='kitchenfeed'),
+    path('kitchenProduction/',ProduccionCocinaAPIView.as_view(),name='kitchenproduction')
 ]
@@ -2,20 +2,29 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from Pedidos.models import Pedido
+from Pedidos.models import Pedido, EstadoPedido, ProduccionCocina
+from Pedidos.stream import CursorEventos, canal_actual, cursor_actual, cursor_actual_sync, leer_eventos, TODOS
+from django.http import JsonResponse
+from django.views import View
+from asgiref.sync import sync_to_async
+import asyncio
 from .serializer import PedidoSerializer,PedidoSerializerPersonalizado
 from Delivery_Person.models import Delivery_Person
+from Delivery_Person.presencia import repartidores_online
 from Delivery_Person.serializers import DeliveryPersonSerializer
 from RestauranteAPI.customPagination import CustomPageNumberPagination
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework import serializers
+from Pedidos.estados import transicionar, TransicionInvalida, PENDIENTE, COCINA, LISTO, EN_REPARTO, CANCELADO
+from Pedidos.idempotencia import con_idempotencia, PARAMETRO_IDEMPOTENCY_KEY
 
 class CreatePedidoAPIView(APIView):
 
     @swagger_auto_schema(
         operation_description="Crear un nuevo pedido en el sistema. pasa una lista de ids de fooditems",
         request_body=PedidoSerializer,
+        manual_parameters=[PARAMETRO_IDEMPOTENCY_KEY],
         responses={
             201: openapi.Response(
                 description="Pedido creado con éxito",
@@ -33,6 +42,7 @@ class CreatePedidoAPIView(APIView):
         }
     )
 
+    @con_idempotencia('order_manager.createOrder')
     def post(self, request, *args, **kwargs):
         serializer = PedidoSerializer(data=request.data)
         if serializer.is_valid():
@@ -119,18 +129,16 @@ class CancelarPedidoAPIView(APIView):
 
     def post(self, request, pedido_id, *args, **kwargs):
         try:
-            # Obtener el pedido
-            pedido = Pedido.objects.get(id=pedido_id)
-            
-            # Verificar si ya está cancelado
-            if pedido.status == 'Cancelado':
-                return Response({'message': 'El pedido ya está cancelado.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Cambiar el estado a "Cancelado"
-            pedido.status = 'Cancelado'
-            pedido.save()
+            # Cambiar el estado a "Cancelado" si todavía se puede
+            transicionar(pedido_id, CANCELADO)
             return Response({'message': 'Pedido cancelado con éxito.'}, status=status.HTTP_200_OK)
         
+        except TransicionInvalida as e:
+            # Verificar si ya está cancelado
+            if e.pedido['status'] == CANCELADO:
+                return Response({'message': 'El pedido ya está cancelado.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'message': e.mensaje}, status=status.HTTP_400_BAD_REQUEST)
+
         except Pedido.DoesNotExist:
             return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -178,7 +186,7 @@ class BorrarPedidoAPIView(APIView):
             pedido = Pedido.objects.get(id=pedido_id)
             
             # Verificar si está cancelado
-            if pedido.status != 'Cancelado':
+            if pedido.status != CANCELADO:
                 return Response({'message': 'No se puede borrar el pedido. Primero debe ser cancelado.'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Eliminar el pedido
@@ -264,8 +272,9 @@ class ListarPedidosPorEstadoAPIView(APIView):
         if not estado:
             return Response({'message': 'Debe proporcionar un estado.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Filtrar los pedidos por el estado proporcionado
-        pedidos = Pedido.objects.filter(status=estado)
+        # Filtrar los pedidos por el estado proporcionado, del más antiguo al más nuevo
+        codigo = EstadoPedido.desde_texto(estado)
+        pedidos = Pedido.objects.filter(status=codigo).order_by('created_at', 'id') if codigo else Pedido.objects.none()
         
         if not pedidos.exists():
             return Response({'message': f'No hay pedidos con el estado: {estado}.'}, status=status.HTTP_404_NOT_FOUND)
@@ -280,12 +289,40 @@ class ListarPedidosPorEstadoAPIView(APIView):
         # Devolver los resultados paginados
         return paginator.get_paginated_response(serializer.data)
 
+class ProduccionCocinaAPIView(APIView):
+
+    @swagger_auto_schema(
+        operation_description="Unidades a cocinar de cada plato sumando todos los pedidos en Pendiente y Cocina, de mayor a menor.",
+        responses={
+            200: openapi.Response(
+                description="Totales por plato.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'food_item_name': openapi.Schema(type=openapi.TYPE_STRING, description='Nombre del plato'),
+                            'cantidad': openapi.Schema(type=openapi.TYPE_INTEGER, description='Unidades pendientes de cocinar')
+                        }
+                    )
+                )
+            )
+        }
+    )
+
+    def get(self, request, *args, **kwargs):
+        # Los totales se mantienen en cada cambio de estado, así que leerlos es un SELECT chico
+        produccion = ProduccionCocina.objects.filter(cantidad__gt=0)\
+                                             .order_by('-cantidad', 'food_item_name')\
+                                             .values('food_item_name', 'cantidad')
+        return Response(list(produccion), status=status.HTTP_200_OK)
+
 class ListarRepartidoresAPIView(APIView):
 
     @swagger_auto_schema(
-        operation_description="Obtiene la lista de repartidores filtrada por su estado online.",
+        operation_description="Obtiene la lista de repartidores filtrada por su estado online, paginada (page y page_size) para no devolver la flota completa.",
         responses={
-            200: openapi.Response('Lista de repartidores', DeliveryPersonSerializer),
+            200: openapi.Response('Lista paginada de repartidores', DeliveryPersonSerializer),
             400: 'Debe proporcionar el estado is_online (True o False).',
             500: 'Error al obtener los repartidores.'
         },
@@ -306,13 +343,15 @@ class ListarRepartidoresAPIView(APIView):
         except ValueError:
             return Response({'message': 'El parámetro is_online debe ser 1 (True) o 0 (False).'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Filtrar los repartidores por el estado is_online
-        repartidores = Delivery_Person.objects.filter(is_online=is_online)
-        
-        # Serializar los datos de los repartidores
-        serializer = DeliveryPersonSerializer(repartidores, many=True)
-        
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Filtrar los repartidores según tengan un latido vigente
+        presentes = repartidores_online()
+        repartidores = Delivery_Person.objects.filter(id__in=presentes) if is_online else Delivery_Person.objects.exclude(id__in=presentes)
+
+        # Paginado igual que viewAllDeliverysPagination: la flota puede ser grande
+        paginator = CustomPageNumberPagination()
+        pagina = paginator.paginate_queryset(repartidores.order_by('id'), request)
+        serializer = DeliveryPersonSerializer(pagina, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
 class ListarRepartidoresPaginationAPIView(APIView):
 
@@ -340,12 +379,13 @@ class ListarRepartidoresPaginationAPIView(APIView):
         except ValueError:
             return Response({'message': 'El parámetro is_online debe ser 1 (True) o 0 (False).'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Filtrar los repartidores por el estado is_online
-        repartidores = Delivery_Person.objects.filter(is_online=is_online)
+        # Filtrar los repartidores según tengan un latido vigente
+        presentes = repartidores_online()
+        repartidores = Delivery_Person.objects.filter(id__in=presentes) if is_online else Delivery_Person.objects.exclude(id__in=presentes)
         
         # Aplicar paginación
         paginator = CustomPageNumberPagination()
-        paginated_repartidores = paginator.paginate_queryset(repartidores, request)
+        paginated_repartidores = paginator.paginate_queryset(repartidores.order_by('id'), request)
         
         # Serializar los datos de los repartidores
         serializer = DeliveryPersonSerializer(paginated_repartidores, many=True)
@@ -388,27 +428,27 @@ class AsociarRepartidorAPedidoAPIView(APIView):
             return Response({'message': 'Debe proporcionar tanto el ID del pedido como el del repartidor.'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # Obtener el pedido y el repartidor
-            pedido = Pedido.objects.get(id=pedido_id)
-            repartidor = Delivery_Person.objects.get(id=delivery_person_id)
+            # Obtener el repartidor
+            repartidor = Delivery_Person.objects.select_related('user').get(id=delivery_person_id)
 
-            # Verificar si el pedido ya tiene un repartidor asignado
-            if pedido.delivery_person is not None:
-                return Response({'message': f'El pedido {pedido_id} ya tiene un repartidor asignado.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Verificar si el pedido está en estado "Listo" y no en estado "Cancelado"
-            if pedido.status != 'Listo':
-                return Response({'message': 'El pedido no está listo para entrega.'}, status=status.HTTP_400_BAD_REQUEST)
-            if pedido.status == 'Cancelado':
-                return Response({'message': 'El pedido está cancelado y no puede ser asignado a un repartidor.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Asociar el repartidor al pedido y actualizar el estado del pedido a "InDelivery"
-            pedido.delivery_person = repartidor
-            pedido.status = 'InDelivery'
-            pedido.save()
+            # Asociar el repartidor y pasar a "InDelivery" solo si el pedido está "Listo" y sin repartidor
+            transicionar(
+                pedido_id, EN_REPARTO,
+                desde=[LISTO],
+                filtros={'delivery_person__isnull': True},
+                delivery_person=repartidor
+            )
             
             return Response({'message': f'Pedido {pedido_id} asociado con éxito al repartidor {repartidor.user.username}.'}, status=status.HTTP_200_OK)
         
+        except TransicionInvalida as e:
+            # Verificar si el pedido ya tiene un repartidor asignado
+            if e.pedido['delivery_person_id'] is not None:
+                return Response({'message': f'El pedido {pedido_id} ya tiene un repartidor asignado.'}, status=status.HTTP_400_BAD_REQUEST)
+            if e.pedido['status'] == CANCELADO:
+                return Response({'message': 'El pedido está cancelado y no puede ser asignado a un repartidor.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'message': 'El pedido no está listo para entrega.'}, status=status.HTTP_400_BAD_REQUEST)
+
         except Pedido.DoesNotExist:
             return Response({'message': 'El pedido no existe.'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -420,3 +460,78 @@ class AsociarRepartidorAPedidoAPIView(APIView):
 
 
 
+
+
+#http://127.0.0.1:8000/order_manager/kitchenFeed/?cursor=120.118&status=Pendiente,Cocina&timeout=25
+class KitchenFeedView(View):
+    """
+    Feed incremental para las tablets de cocina. Sin cursor devuelve el tablero completo de los
+    estados pedidos; con cursor, solo los pedidos que cambiaron desde ese cursor. El cursor es
+    opaco (el último OrderStatusEvent visto más los ids que todavía pueden confirmarse, ver
+    CursorEventos): se envía tal cual lo devolvió la respuesta anterior. Si no hubo cambios la solicitud espera hasta `timeout` segundos a
+    que llegue alguno antes de responder vacía (long-polling).
+
+    Respuesta: {"cursor", "orders": pedidos nuevos o cambiados en esos estados,
+    "removed": ids de pedidos que salieron de esos estados}.
+    """
+    ESTADOS_POR_DEFECTO = [PENDIENTE, COCINA]
+    MAX_TIMEOUT = 30
+    MAX_CAMBIOS = 500
+
+    async def get(self, request, *args, **kwargs):
+        estados = [EstadoPedido.desde_texto(nombre) for nombre in request.GET.get('status', '').split(',') if nombre.strip()]
+        if None in estados:
+            return JsonResponse({'message': 'Estado inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+        estados = estados or self.ESTADOS_POR_DEFECTO
+
+        try:
+            cursor = request.GET.get('cursor')
+            cursor = CursorEventos.desde_texto(cursor) if cursor not in (None, '') else None
+            timeout = min(float(request.GET.get('timeout', 25)), self.MAX_TIMEOUT)
+        except ValueError:
+            return JsonResponse({'message': 'cursor inválido o timeout no es un número.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if cursor is None:
+            return JsonResponse(await sync_to_async(self.tablero)(estados))
+
+        # Se suscribe antes de consultar para no perder un cambio que llegue entre la consulta y la espera
+        canal = canal_actual()
+        cola = canal.suscribir(TODOS, await cursor_actual())
+        try:
+            respuesta = await sync_to_async(self.cambios)(estados, cursor)
+            # Se espera según haya o no cambios, no según el cursor: el cursor también cambia
+            # cuando vencen sus huecos, sin que haya nada nuevo que mostrar
+            if not respuesta['orders'] and not respuesta['removed'] and timeout > 0:
+                try:
+                    await asyncio.wait_for(cola.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    return JsonResponse(respuesta)
+                respuesta = await sync_to_async(self.cambios)(estados, CursorEventos.desde_texto(respuesta['cursor']))
+        finally:
+            canal.desuscribir(TODOS, cola)
+        return JsonResponse(respuesta)
+
+    def serializar(self, pedidos):
+        pedidos = pedidos.select_related('customer__user').prefetch_related('pedidofooditem_set').order_by('created_at', 'id')
+        return PedidoSerializerPersonalizado(pedidos, many=True).data
+
+    def tablero(self, estados):
+        # El cursor se toma antes de leer los pedidos: un cambio entre las dos consultas se repite, no se pierde
+        cursor = cursor_actual_sync()
+        return {'cursor': str(cursor), 'orders': self.serializar(Pedido.objects.filter(status__in=estados)), 'removed': []}
+
+    def cambios(self, estados, cursor):
+        # Incluye los eventos de transacciones que confirmaron después de que se armó el cursor
+        eventos, cursor = leer_eventos(cursor, self.MAX_CAMBIOS)
+        if not eventos:
+            return {'cursor': str(cursor), 'orders': [], 'removed': []}
+
+        ids = {evento['pedido_id'] for evento in eventos}
+        pedidos = self.serializar(Pedido.objects.filter(id__in=ids, status__in=estados))
+        vigentes = {pedido['id'] for pedido in pedidos}
+        return {
+            'cursor': str(cursor),
+            'orders': pedidos,
+            # Pasaron a otro estado o se borraron
+            'removed': sorted(ids - vigentes),
+        }
@@ -0,0 +1,129 @@
+#Pedidos/admision.py
+import math
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from .models import Pedido
+from .produccion import ESTADOS_COCINA
+
+# Contadores de los pedidos abiertos (Pendiente o Cocina): cocina:abiertos:pedidos|unidades.
+# Tienen que estar en una cache compartida (REDIS_URL): con LocMemCache cada worker cuenta
+# solo sus propios pedidos y el límite queda multiplicado por la cantidad de workers.
+ABIERTOS_KEY = 'cocina:abiertos:{}'
+# Cada cuánto se vuelven a contar desde la base, para corregir desvíos (un decremento que se
+# perdió porque el proceso se cayó antes del commit, un pedido borrado a mano)
+RECUENTO_SEGUNDOS = 300
+
+Admision = namedtuple('Admision', ['unidades', 'eta_minutes'])
+
+
+class CocinaSaturada(Exception):
+    """La cocina ya tiene el máximo de pedidos o unidades abiertos. No se reservó nada."""
+
+    def __init__(self, retry_after):
+        # Segundos estimados hasta que la cocina libere el lugar que falta
+        self.retry_after = retry_after
+        super().__init__(f'La cocina está al máximo de su capacidad. Reintentar en {retry_after} segundos.')
+
+
+def _contar_abiertos():
+    # Solo cuando el contador no está en la cache: un COUNT y un SUM sobre los pedidos en cocina
+    return Pedido.objects.filter(status__in=ESTADOS_COCINA).aggregate(
+        pedidos=Count('id', distinct=True),
+        unidades=Coalesce(Sum('pedidofooditem__quantity'), 0),
+    )
+
+
+def _sumar(contador, cantidad):
+    key = ABIERTOS_KEY.format(contador)
+    try:
+        return cache.incr(key, cantidad)
+    except ValueError:
+        # Sin contador (primer pedido, venció el recuento o se reinició la cache): se cuentan
+        # los dos en la base; add no pisa los que otro proceso ya haya creado
+        for nombre, total in _contar_abiertos().items():
+            cache.add(ABIERTOS_KEY.format(nombre), total, timeout=RECUENTO_SEGUNDOS)
+        return cache.incr(key, cantidad)
+
+
+def _restar(contador, cantidad):
+    key = ABIERTOS_KEY.format(contador)
+    try:
+        if cache.decr(key, cantidad) < 0:
+            # Se restó algo que el contador no tenía: se vuelve a contar en la base
+            cache.delete(key)
+    except ValueError:
+        # Sin contador: el próximo pedido lo cuenta en la base con este ya descontado
+        pass
+
+
+def _segundos_para_liberar(exceso, maximo):
+    # La cocina despacha una carga completa (el máximo) en KITCHEN_CLEAR_SECONDS
+    return exceso / maximo * settings.KITCHEN_CLEAR_SECONDS
+
+
+def admitir_pedido(unidades):
+    """
+    Reserva lugar en la cocina para un pedido de `unidades` platos y devuelve la Admision
+    con el tiempo estimado. Cuesta dos INCR en la cache sin importar la carga.
+
+    La capacidad es sobre los pedidos abiertos: el lugar se devuelve cuando el pedido sale
+    de Pendiente/Cocina (liberar_cocina, desde aplicar_efectos). Si supera
+    KITCHEN_MAX_OPEN_ORDERS o KITCHEN_MAX_OPEN_UNITS se deshace la reserva y se lanza
+    CocinaSaturada. Si el pedido no llega a crearse hay que llamar a liberar_admision.
+    """
+    pedidos = _sumar('pedidos', 1)
+    total_unidades = _sumar('unidades', unidades)
+
+    max_pedidos = settings.KITCHEN_MAX_OPEN_ORDERS
+    max_unidades = settings.KITCHEN_MAX_OPEN_UNITS
+    if (max_pedidos and pedidos > max_pedidos) or (max_unidades and total_unidades > max_unidades):
+        liberar_admision(Admision(unidades, None))
+        espera = max(
+            _segundos_para_liberar(pedidos - max_pedidos, max_pedidos) if max_pedidos else 0,
+            _segundos_para_liberar(total_unidades - max_unidades, max_unidades) if max_unidades else 0,
+        )
+        raise CocinaSaturada(max(1, math.ceil(espera)))
+
+    # La ocupación (0 a 1) indica qué parte de una carga completa falta cocinar antes de este pedido
+    ocupacion = max(
+        pedidos / max_pedidos if max_pedidos else 0,
+        total_unidades / max_unidades if max_unidades else 0,
+    )
+    eta = settings.KITCHEN_PREP_MINUTES + ocupacion * settings.KITCHEN_CLEAR_SECONDS / 60
+    return Admision(unidades, math.ceil(eta))
+
+
+def liberar_admision(admision):
+    """Devuelve el lugar de un pedido admitido que finalmente no se creó."""
+    _restar('pedidos', 1)
+    _restar('unidades', admision.unidades)
+
+
+def ocupar_cocina(unidades):
+    """Suma a los abiertos un pedido creado sin pasar por admitir_pedido (pedidos cargados por el personal)."""
+    def sumar():
+        for contador, cantidad in (('pedidos', 1), ('unidades', unidades)):
+            try:
+                cache.incr(ABIERTOS_KEY.format(contador), cantidad)
+            except ValueError:
+                # Sin contador: el recuento en la base ya incluye este pedido
+                pass
+    transaction.on_commit(sumar)
+
+
+def liberar_cocina(pedido_ids):
+    """
+    Descuenta de los abiertos los pedidos que acaban de salir de Pendiente/Cocina
+    (status_anterior en cocina). Usar en la transacción del cambio de estado; los
+    contadores se actualizan cuando confirma.
+    """
+    salieron = Pedido.objects.filter(id__in=pedido_ids, status_anterior__in=ESTADOS_COCINA).aggregate(
+        pedidos=Count('id', distinct=True),
+        unidades=Coalesce(Sum('pedidofooditem__quantity'), 0),
+    )
+    if salieron['pedidos']:
+        transaction.on_commit(lambda: (_restar('pedidos', salieron['pedidos']), _restar('unidades', salieron['unidades'])))
@@ -0,0 +1,46 @@
+#Pedidos/direcciones.py
+from .models import CoordenadaDireccion
+
+
+def normalizar_direccion(address):
+    return ' '.join(address.lower().split())
+
+
+def leer_coordenadas(lat, lon):
+    """
+    Valida lat/lon recibidos en una solicitud. Devuelve (lat, lon) como float, o (None, None)
+    si no se enviaron. Lanza ValueError si falta uno de los dos o están fuera de rango.
+    """
+    if lat in (None, '') and lon in (None, ''):
+        return None, None
+    if lat in (None, '') or lon in (None, ''):
+        raise ValueError("Se deben enviar lat y lon juntos.")
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("lat y lon deben ser números.")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat debe estar entre -90 y 90 y lon entre -180 y 180.")
+    return lat, lon
+
+
+def coordenadas_de(address):
+    """Coordenadas guardadas para la dirección, o (None, None) si no está en la tabla."""
+    return CoordenadaDireccion.objects.filter(address=normalizar_direccion(address))\
+                                      .values_list('lat', 'lon').first() or (None, None)
+
+
+def recordar_coordenadas(address, lat, lon):
+    """Guarda las coordenadas que mandó un cliente para reutilizarlas con la misma dirección."""
+    CoordenadaDireccion.objects.bulk_create(
+        [CoordenadaDireccion(address=normalizar_direccion(address)[:255], lat=lat, lon=lon)],
+        ignore_conflicts=True
+    )
+
+
+def resolver_coordenadas(address, lat=None, lon=None):
+    """Usa las coordenadas enviadas (y las recuerda) o las busca en la tabla por dirección."""
+    if lat is not None:
+        recordar_coordenadas(address, lat, lon)
+        return lat, lon
+    return coordenadas_de(address)
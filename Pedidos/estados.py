@@ -0,0 +1,156 @@
+#Pedidos/estados.py
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from Delivery_Person.models import Delivery_Person
+from .admision import liberar_cocina
+from .models import EstadoPedido, OrderStatusEvent, Pedido
+from .produccion import ESTADOS_COCINA, ajustar_produccion
+
+PENDIENTE = EstadoPedido.PENDIENTE
+COCINA = EstadoPedido.COCINA
+LISTO = EstadoPedido.LISTO
+EN_REPARTO = EstadoPedido.EN_REPARTO
+ENTREGADO = EstadoPedido.ENTREGADO
+CANCELADO = EstadoPedido.CANCELADO
+
+# Grafo de estados legales: estado actual -> estados a los que puede pasar
+TRANSICIONES = {
+    PENDIENTE: {COCINA, CANCELADO},
+    COCINA: {LISTO, EN_REPARTO, CANCELADO},
+    LISTO: {EN_REPARTO, CANCELADO},
+    EN_REPARTO: {ENTREGADO, CANCELADO},
+    ENTREGADO: set(),
+    CANCELADO: set(),
+}
+
+
+class TransicionInvalida(Exception):
+    """El pedido no estaba en un estado desde el que se pueda pasar al nuevo (o no cumplía los filtros)."""
+
+    def __init__(self, pedido, nuevo_estado):
+        # pedido: dict con id, status, customer_id y delivery_person_id tal como están en la base
+        self.pedido = pedido
+        self.nuevo_estado = nuevo_estado
+        super().__init__(self.mensaje)
+
+    @property
+    def mensaje(self):
+        actual = EstadoPedido(self.pedido['status'])
+        destinos = TRANSICIONES.get(actual)
+        if not destinos:
+            return f'El pedido está en estado {actual.label} y ya no puede cambiar.'
+        return f'El pedido en {actual.label} solo puede cambiar a {" o ".join(sorted(destino.label for destino in destinos))}.'
+
+
+def origenes(nuevo_estado):
+    """Estados desde los que es legal pasar a nuevo_estado."""
+    return [estado for estado, destinos in TRANSICIONES.items() if nuevo_estado in destinos]
+
+
+def registrar_eventos(pedido_ids, estado):
+    """Agrega al historial (OrderStatusEvent) la entrada de los pedidos al estado, en un solo INSERT."""
+    ahora = timezone.now()
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(pedido_id=pedido_id, status=estado, created_at=ahora) for pedido_id in pedido_ids
+    ])
+
+
+def _ajustar_carga(pedido_ids, signo, **filtros):
+    # Un UPDATE para todos los repartidores de los pedidos: a cada uno se le suma o resta la
+    # cantidad de esos pedidos que tiene asignados (subconsulta)
+    pedidos = Pedido.objects.filter(id__in=pedido_ids, **filtros)
+    cantidad = pedidos.filter(delivery_person=OuterRef('pk')).order_by()\
+                      .values('delivery_person').annotate(total=Count('id')).values('total')
+    Delivery_Person.objects.filter(id__in=pedidos.values('delivery_person')).update(
+        active_orders=Greatest(F('active_orders') + signo * Subquery(cantidad, output_field=IntegerField()), 0)
+    )
+
+
+def aplicar_efectos(pedido_ids, permitidos, nuevo_estado):
+    """
+    Efectos de un cambio de estado ya escrito con status_anterior: mantiene
+    Delivery_Person.active_orders (suma al entrar a InDelivery y resta al salir), descuenta los
+    pedidos de ProduccionCocina y de los abiertos de la admisión cuando salen de cocina y
+    registra los OrderStatusEvent.
+    Cada ajuste filtra por status_anterior en la base, así no hace falta leer de dónde venía
+    cada pedido; los que no pueden aplicar según `permitidos` ni se consultan.
+    """
+    if EN_REPARTO in permitidos:
+        _ajustar_carga(pedido_ids, -1, status_anterior=EN_REPARTO)
+    if nuevo_estado == EN_REPARTO:
+        _ajustar_carga(pedido_ids, 1)
+    if nuevo_estado not in ESTADOS_COCINA and any(estado in ESTADOS_COCINA for estado in permitidos):
+        ajustar_produccion(pedido_ids, -1, pedido__status_anterior__in=ESTADOS_COCINA)
+        liberar_cocina(pedido_ids)
+    registrar_eventos(pedido_ids, nuevo_estado)
+
+
+def transicionar(pedido_id, nuevo_estado, desde=None, filtros=None, **cambios):
+    """
+    Cambia el estado de un pedido con un solo UPDATE condicional sobre Pedido
+    (UPDATE ... SET status_anterior = status, status = ? WHERE id = ? AND status IN (...)),
+    así dos actores concurrentes no se pisan. En la misma transacción aplica los efectos de
+    aplicar_efectos: según el destino son hasta dos UPDATE de cargas, el ajuste de
+    ProduccionCocina y el INSERT del evento.
+
+    desde: limita los estados de origen (por defecto, todos los legales según TRANSICIONES).
+    filtros: condiciones extra del WHERE, por ejemplo delivery_person=repartidor.
+    cambios: otros campos a escribir en el mismo UPDATE.
+
+    Lanza Pedido.DoesNotExist si el pedido no existe y TransicionInvalida si no se aplicó.
+    """
+    permitidos = [estado for estado in (desde or origenes(nuevo_estado)) if nuevo_estado in TRANSICIONES.get(estado, ())]
+    filtros = filtros or {}
+    if nuevo_estado == LISTO:
+        # Desde cuándo está listo, para agrupar pedidos en viajes
+        cambios.setdefault('listo_at', timezone.now())
+
+    with transaction.atomic():
+        # status_anterior va primero: en MySQL las asignaciones del SET se evalúan en orden
+        aplicado = permitidos and Pedido.objects.filter(id=pedido_id, status__in=permitidos, **filtros).update(
+            status_anterior=F('status'), status=nuevo_estado, **cambios
+        )
+        if aplicado:
+            aplicar_efectos([pedido_id], permitidos, nuevo_estado)
+
+    if aplicado:
+        return
+
+    # Solo en el camino de error se vuelve a leer el pedido para explicar el rechazo
+    pedido = Pedido.objects.filter(id=pedido_id).values('id', 'status', 'customer_id', 'delivery_person_id').first()
+    if pedido is None:
+        raise Pedido.DoesNotExist(f'El pedido {pedido_id} no existe.')
+    raise TransicionInvalida(pedido, nuevo_estado)
+
+
+def transicionar_en_lote(pedido_ids, nuevo_estado, desde=None, filtros=None, **cambios):
+    """
+    Pasa varios pedidos al mismo estado con un solo UPDATE condicional
+    (WHERE id IN (...) AND status IN (...)) y aplica los efectos de aplicar_efectos a todos
+    juntos, sin importar cuántos sean.
+
+    Todo o nada: si alguno ya no estaba en un estado permitido (otro actor lo cambió después
+    de que el llamador lo leyó) no se cambia ninguno y se devuelve False para que el llamador
+    vuelva a leer. desde y filtros como en transicionar; cambios: campos a escribir, que
+    pueden ser expresiones Case por pedido.
+    """
+    pedido_ids = list(pedido_ids)
+    permitidos = [estado for estado in (desde or origenes(nuevo_estado)) if nuevo_estado in TRANSICIONES.get(estado, ())]
+    if not pedido_ids:
+        return True
+    if not permitidos:
+        return False
+    if nuevo_estado == LISTO:
+        cambios.setdefault('listo_at', timezone.now())
+
+    with transaction.atomic():
+        aplicados = Pedido.objects.filter(id__in=pedido_ids, status__in=permitidos, **(filtros or {})).update(
+            status_anterior=F('status'), status=nuevo_estado, **cambios
+        )
+        if aplicados != len(pedido_ids):
+            transaction.set_rollback(True)
+            return False
+        aplicar_efectos(pedido_ids, permitidos, nuevo_estado)
+    return True
@@ -0,0 +1,92 @@
+#Pedidos/idempotencia.py
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+PARAMETRO_IDEMPOTENCY_KEY = openapi.Parameter(
+    'Idempotency-Key',
+    openapi.IN_HEADER,
+    description="Clave única del intento. Los reintentos con la misma clave devuelven la primera respuesta.",
+    type=openapi.TYPE_STRING,
+    required=False
+)
+
+
+def _huella(request):
+    return hashlib.sha256(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _respuesta_guardada(registro):
+    response = Response(registro.response_body, status=registro.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def con_idempotencia(endpoint):
+    """
+    Decorador para el post de un APIView. Si la solicitud trae Idempotency-Key, la primera
+    respuesta exitosa (2xx) se guarda y los reintentos la reciben sin volver a ejecutar la
+    vista. Las claves vencidas las borra `limpiar_expirados`.
+
+    La fila de la clave se inserta en la misma transacción que el trabajo de la vista: un
+    duplicado concurrente queda esperando en el índice único hasta que la primera solicitud
+    confirma (y entonces recibe su respuesta) o se revierte (y entonces la procesa él).
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltura(self, request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return metodo(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"error": "La Idempotency-Key no puede superar 255 caracteres."}, status=status.HTTP_400_BAD_REQUEST)
+
+            user_id = request.user.id if request.user.is_authenticated else 0
+            huella = _huella(request)
+
+            with transaction.atomic():
+                for _ in range(2):
+                    try:
+                        with transaction.atomic():
+                            registro = IdempotencyKey.objects.create(
+                                key=key,
+                                endpoint=endpoint,
+                                user_id=user_id,
+                                request_hash=huella,
+                                expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+                            )
+                        break
+                    except IntegrityError:
+                        registro = IdempotencyKey.objects.get(key=key, endpoint=endpoint, user_id=user_id)
+                        if registro.expires_at <= timezone.now():
+                            # La clave venció: se descarta y se procesa como nueva
+                            registro.delete()
+                            continue
+                        if registro.request_hash != huella:
+                            return Response(
+                                {"error": "La Idempotency-Key ya se usó con otros datos."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                            )
+                        return _respuesta_guardada(registro)
+
+                response = metodo(self, request, *args, **kwargs)
+
+                if not status.is_success(response.status_code):
+                    # Los errores no se guardan: un reintento después de reponer stock o de
+                    # corregir los datos vuelve a procesarse
+                    transaction.set_rollback(True)
+                    return response
+
+                registro.status_code = response.status_code
+                registro.response_body = response.data
+                registro.save(update_fields=['status_code', 'response_body'])
+                return response
+        return envoltura
+    return decorador
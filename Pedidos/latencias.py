@@ -0,0 +1,73 @@
+#Pedidos/latencias.py
+import math
+from datetime import timedelta
+from django.db import transaction
+from .models import LatenciaEtapa, OrderStatusEvent
+
+# Límites superiores (segundos) de los tramos del histograma; el último tramo es "más de 2 horas"
+LIMITES_HISTOGRAMA = [30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 7200]
+
+
+def inicio_de_hora(momento):
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def percentil(ordenados, p):
+    # Método del rango más cercano
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)) - 1, 0)]
+
+
+def histograma(duraciones):
+    tramos = {str(limite): 0 for limite in LIMITES_HISTOGRAMA}
+    tramos['+inf'] = 0
+    for duracion in duraciones:
+        limite = next((limite for limite in LIMITES_HISTOGRAMA if duracion <= limite), None)
+        tramos[str(limite) if limite else '+inf'] += 1
+    return tramos
+
+
+def duraciones_por_hora(desde, hasta):
+    """
+    {(hora, etapa): [segundos]} de las etapas que terminaron entre desde y hasta. Una etapa
+    dura desde el evento que entra al estado hasta el siguiente evento del mismo pedido.
+    """
+    terminados = OrderStatusEvent.objects.filter(created_at__gte=desde, created_at__lt=hasta).values('pedido_id')
+    eventos = OrderStatusEvent.objects.filter(pedido_id__in=terminados, created_at__lt=hasta)\
+                                      .order_by('pedido_id', 'created_at', 'id')\
+                                      .values_list('pedido_id', 'status', 'created_at')
+
+    duraciones = {}
+    anterior = None
+    for evento in eventos.iterator(chunk_size=2000):
+        pedido_id, _, momento = evento
+        if anterior and anterior[0] == pedido_id and momento >= desde:
+            clave = (inicio_de_hora(momento), anterior[1])
+            duraciones.setdefault(clave, []).append((momento - anterior[2]).total_seconds())
+        anterior = evento
+    return duraciones
+
+
+def resumir_latencias(desde, hasta):
+    """Recalcula las filas de LatenciaEtapa de las horas completas o parciales entre desde y hasta."""
+    desde = inicio_de_hora(desde)
+    if hasta > inicio_de_hora(hasta):
+        hasta = inicio_de_hora(hasta) + timedelta(hours=1)
+
+    filas = []
+    for (hora, etapa), duraciones in duraciones_por_hora(desde, hasta).items():
+        duraciones.sort()
+        filas.append(LatenciaEtapa(
+            hora=hora,
+            etapa=etapa,
+            cantidad=len(duraciones),
+            p50=percentil(duraciones, 50),
+            p90=percentil(duraciones, 90),
+            p99=percentil(duraciones, 99),
+            histograma=histograma(duraciones),
+        ))
+
+    # Las horas recalculadas se reemplazan completas, así el comando se puede correr las veces que haga falta
+    with transaction.atomic():
+        LatenciaEtapa.objects.filter(hora__gte=desde, hora__lt=hasta).delete()
+        LatenciaEtapa.objects.bulk_create(filas)
+    return filas
@@ -0,0 +1,13 @@
+#Pedidos/management/commands/recalcular_produccion.py
+from django.core.management.base import BaseCommand
+from Pedidos.produccion import recalcular_produccion
+
+
+class Command(BaseCommand):
+    help = "Reconstruye los totales de ProduccionCocina a partir de los pedidos en Pendiente y Cocina."
+
+    def handle(self, *args, **options):
+        totales = recalcular_produccion()
+        for nombre, cantidad in sorted(totales.items(), key=lambda fila: -fila[1]):
+            self.stdout.write(f"{cantidad} x {nombre}")
+        self.stdout.write(self.style.SUCCESS(f"Se recalcularon {len(totales)} platos."))
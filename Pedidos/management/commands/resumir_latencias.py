@@ -0,0 +1,24 @@
+#Pedidos/management/commands/resumir_latencias.py
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from Pedidos.latencias import resumir_latencias
+
+
+class Command(BaseCommand):
+    help = "Recalcula los percentiles p50/p90/p99 por hora del tiempo que los pedidos pasan en cada estado. Pensado para correr cada hora."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=2,
+                            help="Horas hacia atrás que se recalculan, incluida la hora actual (por defecto 2).")
+
+    def handle(self, *args, **options):
+        if options['horas'] < 1:
+            raise CommandError("--horas debe ser mayor o igual a 1.")
+
+        hasta = timezone.now()
+        desde = hasta - timedelta(hours=options['horas'] - 1)
+        filas = resumir_latencias(desde, hasta)
+        for fila in sorted(filas, key=lambda fila: (fila.hora, fila.etapa)):
+            self.stdout.write(str(fila))
+        self.stdout.write(self.style.SUCCESS(f"Se guardaron {len(filas)} resúmenes."))
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+ESTADOS = {
+    'pendiente': 1,
+    'cocina': 2,
+    'listo': 3,
+    'indelivery': 4,
+    'entregado': 5,
+    'delivered': 5,
+    'completed': 5,
+    'cancelado': 6,
+    'cancelled': 6,
+}
+NOMBRES = {1: 'Pendiente', 2: 'Cocina', 3: 'Listo', 4: 'InDelivery', 5: 'Entregado', 6: 'Cancelado'}
+
+
+def normalizar_estados(apps, schema_editor):
+    Pedido = apps.get_model('Pedidos', 'Pedido')
+    valores = list(Pedido.objects.values_list('status', flat=True).distinct())
+
+    # Un valor desconocido no se adivina: pasarlo a Pendiente lo mandaría a la cocina.
+    # La migración se detiene (y se revierte) listando los valores para corregirlos a mano.
+    desconocidos = [valor for valor in valores if (valor or '').strip().lower() not in ESTADOS]
+    if desconocidos:
+        cantidades = ", ".join(
+            f"{valor!r} ({Pedido.objects.filter(status=valor).count()} pedidos)" for valor in desconocidos
+        )
+        raise RuntimeError(
+            f"Pedido.status tiene valores que no corresponden a ningún estado: {cantidades}. "
+            f"Actualizarlos a uno de {', '.join(NOMBRES.values())} y volver a migrar."
+        )
+
+    for valor in valores:
+        Pedido.objects.filter(status=valor).update(status_code=ESTADOS[valor.strip().lower()])
+
+
+def restaurar_estados(apps, schema_editor):
+    Pedido = apps.get_model('Pedidos', 'Pedido')
+    for codigo, nombre in NOMBRES.items():
+        Pedido.objects.filter(status_code=codigo).update(status=nombre)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Customer', '0008_customer_customer_addres'),
+        ('Delivery_Person', '0002_delivery_person_is_online'),
+        ('Pedidos', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='status',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.RunPython(normalizar_estados, restaurar_estados),
+        migrations.RemoveField(
+            model_name='pedido',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='pedido',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pendiente'), (2, 'Cocina'), (3, 'Listo'), (4, 'InDelivery'), (5, 'Entregado'), (6, 'Cancelado')], default=1),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status', 'created_at'], name='pedido_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['customer', 'created_at'], name='pedido_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['delivery_person', 'status'], name='pedido_delivery_status_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:49
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pedidos', '0008_pedido_status_enum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoordenadaDireccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=255, unique=True)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='lat',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='lon',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Order_Dispatcher', '0002_viaje'),
+        ('Pedidos', '0009_pedido_coordenadas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='listo_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='orden_parada',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='viaje',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos', to='Order_Dispatcher.viaje'),
+        ),
+    ]
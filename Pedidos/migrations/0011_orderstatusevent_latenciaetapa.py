@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pedidos', '0010_pedido_viaje'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatenciaEtapa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('etapa', models.PositiveSmallIntegerField(choices=[(1, 'Pendiente'), (2, 'Cocina'), (3, 'Listo'), (4, 'InDelivery'), (5, 'Entregado'), (6, 'Cancelado')])),
+                ('cantidad', models.PositiveIntegerField()),
+                ('p50', models.FloatField()),
+                ('p90', models.FloatField()),
+                ('p99', models.FloatField()),
+                ('histograma', models.JSONField(default=dict)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hora', 'etapa'), name='latenciaetapa_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pedido_id', models.BigIntegerField()),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Pendiente'), (2, 'Cocina'), (3, 'Listo'), (4, 'InDelivery'), (5, 'Entregado'), (6, 'Cancelado')])),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pedido_id', 'created_at'], name='evento_pedido_idx'), models.Index(fields=['created_at'], name='evento_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:59
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcular_produccion(apps, schema_editor):
+    # Carga inicial con los pedidos que ya están en Pendiente (1) o Cocina (2)
+    PedidoFoodItem = apps.get_model('Pedidos', 'PedidoFoodItem')
+    ProduccionCocina = apps.get_model('Pedidos', 'ProduccionCocina')
+    totales = PedidoFoodItem.objects.filter(pedido__status__in=[1, 2], food_item_name__isnull=False)\
+                                    .values_list('food_item_name')\
+                                    .annotate(total=Sum('quantity'))
+    ProduccionCocina.objects.bulk_create([
+        ProduccionCocina(food_item_name=nombre, cantidad=total) for nombre, total in totales
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pedidos', '0011_orderstatusevent_latenciaetapa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduccionCocina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('food_item_name', models.CharField(max_length=255, unique=True)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(calcular_produccion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pedidos', '0012_produccioncocina'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='status_anterior',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'Pendiente'), (2, 'Cocina'), (3, 'Listo'), (4, 'InDelivery'), (5, 'Entregado'), (6, 'Cancelado')], null=True),
+        ),
+    ]
@@ -1,16 +1,46 @@
 #Pedidos/models.py
 from django.db import models
+from django.utils import timezone
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from RestauranteData.models import FoodItem
 from Customer.models import Customer
-from Order_Dispatcher.models import Order_Dispatcher
+from Order_Dispatcher.models import Order_Dispatcher, Viaje
 from Order_Manager.models import Order_Manager
 from Delivery_Person.models import Delivery_Person
 # Create your models here.
+class EstadoPedido(models.IntegerChoices):
+    PENDIENTE = 1, 'Pendiente'
+    COCINA = 2, 'Cocina'
+    LISTO = 3, 'Listo'
+    EN_REPARTO = 4, 'InDelivery'
+    ENTREGADO = 5, 'Entregado'
+    CANCELADO = 6, 'Cancelado'
+
+    @classmethod
+    def desde_texto(cls, valor):
+        """Convierte el nombre que usa la API (o un valor heredado) en el estado; None si no existe."""
+        if isinstance(valor, str):
+            return ESTADOS_POR_TEXTO.get(valor.strip().lower())
+        return None
+
+
+# Nombres que llegan desde la API, incluidos los valores en inglés que se guardaban antes
+ESTADOS_POR_TEXTO = {
+    **{estado.label.lower(): estado for estado in EstadoPedido},
+    'cancelled': EstadoPedido.CANCELADO,
+    'completed': EstadoPedido.ENTREGADO,
+    'delivered': EstadoPedido.ENTREGADO,
+}
+
+
 class Pedido (models.Model):
     created_at=models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
-    status = models.CharField(max_length=255)
+    status = models.PositiveSmallIntegerField(choices=EstadoPedido.choices, default=EstadoPedido.PENDIENTE)
+    # Estado del que venía en el último cambio; lo escribe el mismo UPDATE de Pedidos.estados
+    status_anterior = models.PositiveSmallIntegerField(choices=EstadoPedido.choices, null=True, blank=True)
     customer=models.ForeignKey(Customer,null=True,on_delete=models.SET_NULL,blank=True)
     order_manager=models.ForeignKey(Order_Manager,null=True,on_delete=models.SET_NULL,blank=True)
     order_dispatcher=models.ForeignKey(Order_Dispatcher,null=True,on_delete=models.SET_NULL,blank=True)
@@ -19,6 +49,23 @@ class Pedido (models.Model):
     customer_name = models.CharField(max_length=255,null=True,blank=True)
     customer_email = models.EmailField(max_length=255,null=True,blank=True)
     customer_phone = models.CharField(max_length=20,null=True,blank=True)
+    # Coordenadas de entrega: las envía el cliente o salen de CoordenadaDireccion
+    lat = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    lon = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Momento en que pasó a Listo; define la ventana con la que se agrupa en viajes
+    listo_at = models.DateTimeField(null=True, blank=True)
+    viaje = models.ForeignKey(Viaje, null=True, blank=True, on_delete=models.SET_NULL, related_name='pedidos')
+    orden_parada = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Listados por estado (cocina, dispatcher) ordenados por antigüedad
+            models.Index(fields=['status', 'created_at'], name='pedido_status_created_idx'),
+            # Historial de pedidos de un cliente
+            models.Index(fields=['customer', 'created_at'], name='pedido_customer_created_idx'),
+            # Pedidos de un repartidor por estado
+            models.Index(fields=['delivery_person', 'status'], name='pedido_delivery_status_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} - {self.description}"
@@ -33,4 +80,78 @@ class PedidoFoodItem(models.Model):
     food_item_description = models.CharField(max_length=255,null=True,blank=True)
 
     def __str__(self):
-        return f"{self.food_item_name} - {self.quantity}"
\ No newline at end of file
+        return f"{self.food_item_name} - {self.quantity}"
+
+#respuesta guardada de una solicitud con cabecera Idempotency-Key, para repetirla en los reintentos
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=50)
+    user_id = models.BigIntegerField(default=0)  # 0 para solicitudes anónimas
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null mientras se procesa
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['endpoint', 'user_id', 'key'], name='idempotencykey_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} - {self.key}"
+
+
+class CoordenadaDireccion(models.Model):
+    """Tabla local dirección -> coordenadas para los pedidos que llegan sin lat/lon."""
+    address = models.CharField(max_length=255, unique=True)  # Normalizada con Pedidos.direcciones.normalizar_direccion
+    lat = models.FloatField()
+    lon = models.FloatField()
+
+    def __str__(self):
+        return f"{self.address} ({self.lat}, {self.lon})"
+
+
+#registro de solo inserción: una fila por cada estado al que entra un pedido
+class OrderStatusEvent(models.Model):
+    # Sin ForeignKey para que borrar un pedido no borre su historial
+    pedido_id = models.BigIntegerField()
+    status = models.PositiveSmallIntegerField(choices=EstadoPedido.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pedido_id', 'created_at'], name='evento_pedido_idx'),
+            models.Index(fields=['created_at'], name='evento_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id} -> {self.get_status_display()}"
+
+
+#resumen por hora del tiempo que los pedidos pasaron en cada estado (lo arma resumir_latencias)
+class LatenciaEtapa(models.Model):
+    hora = models.DateTimeField()  # Hora en la que los pedidos salieron de la etapa
+    etapa = models.PositiveSmallIntegerField(choices=EstadoPedido.choices)
+    cantidad = models.PositiveIntegerField()
+    p50 = models.FloatField()  # Segundos
+    p90 = models.FloatField()
+    p99 = models.FloatField()
+    histograma = models.JSONField(default=dict)  # {límite superior en segundos: cantidad}
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hora', 'etapa'], name='latenciaetapa_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H:00} {self.get_etapa_display()}: p50 {self.p50:.0f}s"
+
+
+#unidades a cocinar de cada plato sumando los pedidos en Pendiente y Cocina (ver Pedidos.produccion)
+class ProduccionCocina(models.Model):
+    food_item_name = models.CharField(max_length=255, unique=True)
+    cantidad = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.food_item_name}"
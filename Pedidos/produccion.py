@@ -0,0 +1,48 @@
+#Pedidos/produccion.py
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from .models import EstadoPedido, PedidoFoodItem, ProduccionCocina
+
+ESTADOS_COCINA = (EstadoPedido.PENDIENTE, EstadoPedido.COCINA)
+
+
+def _totales(pedido_items):
+    # Un solo GROUP BY sobre las líneas de los pedidos
+    return dict(pedido_items.exclude(food_item_name__isnull=True)
+                            .values_list('food_item_name')
+                            .annotate(total=Sum('quantity')))
+
+
+def ajustar_produccion(pedido_ids, signo, **filtros):
+    """
+    Suma (signo=1, el pedido entra a cocina) o resta (signo=-1, sale) las líneas de los
+    pedidos en ProduccionCocina. Debe llamarse en la misma transacción que el cambio de estado.
+
+    filtros: condiciones extra sobre las líneas, por ejemplo pedido__status_anterior__in=...
+    """
+    totales = _totales(PedidoFoodItem.objects.filter(pedido_id__in=pedido_ids, **filtros))
+    if not totales:
+        return
+
+    # Las filas que falten se crean en 0 y todas se ajustan con un UPDATE atómico
+    ProduccionCocina.objects.bulk_create(
+        [ProduccionCocina(food_item_name=nombre, cantidad=0) for nombre in totales],
+        ignore_conflicts=True
+    )
+    ProduccionCocina.objects.filter(food_item_name__in=totales).update(
+        cantidad=F('cantidad') + Case(
+            *[When(food_item_name=nombre, then=Value(signo * total)) for nombre, total in totales.items()],
+            output_field=IntegerField(),
+        )
+    )
+
+
+def recalcular_produccion():
+    """Reconstruye ProduccionCocina desde cero con un GROUP BY sobre los pedidos en cocina."""
+    totales = _totales(PedidoFoodItem.objects.filter(pedido__status__in=ESTADOS_COCINA))
+    with transaction.atomic():
+        ProduccionCocina.objects.all().delete()
+        ProduccionCocina.objects.bulk_create([
+            ProduccionCocina(food_item_name=nombre, cantidad=total) for nombre, total in totales.items()
+        ])
+    return totales
@@ -0,0 +1,209 @@
+#Pedidos/stream.py
+import asyncio
+import logging
+import weakref
+from collections import namedtuple
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import EstadoPedido, OrderStatusEvent, Pedido
+
+logger = logging.getLogger(__name__)
+
+# Eventos por cliente que se guardan mientras una conexión lenta no los lee
+MAX_PENDIENTES = 100
+MAX_EVENTOS_POR_SONDEO = 1000
+# Tiempo que se espera a que se confirme un id de evento que falta entre dos leídos
+MARGEN_HUECOS = timedelta(seconds=5)
+# Huecos que se recuerdan como máximo por cursor
+MAX_HUECOS = 100
+# Clave de suscripción que recibe los eventos de todos los pedidos (tablero de cocina)
+TODOS = '*'
+
+
+def _formatear(evento):
+    return {
+        'event_id': evento['id'],
+        'order_id': evento['pedido_id'],
+        'status': EstadoPedido(evento['status']).label,
+        'at': evento['created_at'].isoformat(),
+    }
+
+
+class CursorEventos(namedtuple('CursorEventos', ['ultimo', 'huecos'])):
+    """
+    Posición de lectura en OrderStatusEvent. Los eventos se insertan dentro de transacciones
+    largas (checkout, cambios de estado), así que un id puede confirmarse después de ids
+    mayores que ya se leyeron. Por eso además del id más alto leído (ultimo) se guardan los ids
+    menores que todavía no aparecieron (huecos), y cada lectura los vuelve a pedir.
+
+    Un hueco se descarta cuando un evento posterior a él tiene más de MARGEN_HUECOS: a esa
+    altura su transacción ya se revirtió (o el id se saltó).
+    """
+
+    def __str__(self):
+        return '.'.join(str(evento_id) for evento_id in (self.ultimo, *self.huecos))
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Lee un cursor devuelto por __str__ (un entero solo también sirve). Lanza ValueError si no lo es."""
+        ids = [int(parte) for parte in texto.split('.')]
+        return cls(ids[0], tuple(ids[1:MAX_HUECOS + 1]))
+
+
+def _huecos_entre(desde, hasta):
+    # Ids que faltan entre dos leídos, limitados a los MAX_HUECOS más cercanos al último
+    return range(max(desde + 1, hasta - MAX_HUECOS), hasta)
+
+
+def _huecos_vigentes(huecos):
+    if not huecos:
+        return ()
+    # Un hueco sigue esperando mientras no haya ningún evento posterior más viejo que el margen
+    viejo = OrderStatusEvent.objects.filter(
+        id__gt=min(huecos), created_at__lt=timezone.now() - MARGEN_HUECOS
+    ).aggregate(ultimo=Max('id'))['ultimo'] or 0
+    return tuple(hueco for hueco in huecos if hueco > viejo)[-MAX_HUECOS:]
+
+
+def cursor_actual_sync():
+    """Cursor al final de la tabla, con los huecos de transacciones que todavía pueden confirmar."""
+    viejo = OrderStatusEvent.objects.filter(
+        created_at__lt=timezone.now() - MARGEN_HUECOS
+    ).aggregate(ultimo=Max('id'))['ultimo'] or 0
+    recientes = list(OrderStatusEvent.objects.filter(id__gt=viejo).order_by('id').values_list('id', flat=True))
+
+    ultimo, huecos = viejo, []
+    for evento_id in recientes:
+        huecos.extend(_huecos_entre(ultimo, evento_id))
+        ultimo = evento_id
+    return CursorEventos(ultimo, tuple(huecos[-MAX_HUECOS:]))
+
+
+cursor_actual = sync_to_async(cursor_actual_sync)
+
+
+def leer_eventos(cursor, limite=MAX_EVENTOS_POR_SONDEO):
+    """
+    Eventos nuevos desde el cursor: los posteriores a cursor.ultimo y los huecos que ya se
+    confirmaron, en orden de id. Devuelve (eventos, cursor siguiente); eventos son dicts con
+    id, pedido_id, status y created_at.
+    """
+    eventos = list(
+        OrderStatusEvent.objects.filter(Q(id__gt=cursor.ultimo) | Q(id__in=cursor.huecos))
+                                .order_by('id')
+                                .values('id', 'pedido_id', 'status', 'created_at')[:limite]
+    )
+    leidos = {evento['id'] for evento in eventos}
+    huecos = [hueco for hueco in cursor.huecos if hueco not in leidos]
+    ultimo = cursor.ultimo
+    for evento in eventos:
+        if evento['id'] > ultimo:
+            huecos.extend(_huecos_entre(ultimo, evento['id']))
+            ultimo = evento['id']
+    return eventos, CursorEventos(ultimo, _huecos_vigentes(huecos))
+
+
+# La tarea del canal vive más que la solicitud que la creó, así que no puede usar el hilo de esa
+# solicitud (thread_sensitive); corre en el pool y mantiene su propia conexión.
+@sync_to_async(thread_sensitive=False)
+def _eventos_nuevos(cursor):
+    try:
+        eventos, cursor = leer_eventos(cursor)
+    except (InterfaceError, OperationalError):
+        # Conexión caída (reinicio de la base): se descarta y se reintenta en el próximo sondeo
+        connection.close()
+        return [], cursor
+    if not eventos:
+        return [], cursor
+    # Un solo SELECT por sondeo para saber de qué cliente es cada pedido, sin importar cuántas conexiones haya
+    clientes = dict(Pedido.objects.filter(id__in={evento['pedido_id'] for evento in eventos}).values_list('id', 'customer_id'))
+    return [(clientes.get(evento['pedido_id']), _formatear(evento)) for evento in eventos], cursor
+
+
+@sync_to_async
+def eventos_de_cliente(customer_id, desde_id):
+    """
+    Eventos de los pedidos del cliente que pudo perder al desconectarse después de desde_id
+    (para reanudar con Last-Event-ID): los posteriores y, como un id menor puede confirmarse
+    más tarde, los creados hasta MARGEN_HUECOS antes del último que recibió. Puede repetir
+    alguno de ese margen; el event_id permite descartarlo.
+    """
+    visto = OrderStatusEvent.objects.filter(id=desde_id).values_list('created_at', flat=True).first()
+    nuevos = Q(id__gt=desde_id)
+    if visto is not None:
+        nuevos |= Q(id__lt=desde_id, created_at__gte=visto - MARGEN_HUECOS)
+    eventos = OrderStatusEvent.objects.filter(
+        nuevos,
+        pedido_id__in=Pedido.objects.filter(customer_id=customer_id).values('id')
+    ).order_by('id').values('id', 'pedido_id', 'status', 'created_at')[:MAX_EVENTOS_POR_SONDEO]
+    return [_formatear(evento) for evento in eventos]
+
+
+@sync_to_async
+def estado_actual(customer_id):
+    """Estado actual de los pedidos del cliente que todavía pueden cambiar."""
+    pedidos = Pedido.objects.filter(customer_id=customer_id)\
+                            .exclude(status__in=[EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO])\
+                            .values_list('id', 'status')
+    return [{'order_id': pedido_id, 'status': EstadoPedido(estado).label} for pedido_id, estado in pedidos]
+
+
+class CanalPedidos:
+    """
+    Pub/sub en el proceso: una sola tarea lee OrderStatusEvent cada ORDER_STREAM_POLL_SECONDS
+    y reparte los eventos nuevos a las colas de las conexiones abiertas de cada cliente.
+    Como la fuente es la tabla, los cambios hechos en cualquier worker llegan a todos.
+    """
+
+    def __init__(self):
+        self.suscriptores = {}
+        self.tarea = None
+
+    def suscribir(self, customer_id, cursor):
+        # customer_id=TODOS recibe los eventos de todos los pedidos; cursor (CursorEventos) es
+        # desde dónde empieza a leer la tarea si todavía no estaba corriendo
+        cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+        self.suscriptores.setdefault(customer_id, set()).add(cola)
+        if self.tarea is None or self.tarea.done():
+            self.tarea = asyncio.create_task(self._sondear(cursor))
+        return cola
+
+    def desuscribir(self, customer_id, cola):
+        colas = self.suscriptores.get(customer_id)
+        if colas:
+            colas.discard(cola)
+            if not colas:
+                del self.suscriptores[customer_id]
+
+    async def _sondear(self, cursor):
+        # La tarea termina sola cuando no queda ninguna conexión
+        while self.suscriptores:
+            await asyncio.sleep(settings.ORDER_STREAM_POLL_SECONDS)
+            try:
+                eventos, cursor = await _eventos_nuevos(cursor)
+            except Exception:
+                # Un error inesperado no puede dejar a las conexiones abiertas recibiendo solo
+                # pings: se registra y se vuelve a intentar en el próximo sondeo desde el mismo cursor
+                logger.exception("Error leyendo los eventos de pedidos")
+                continue
+            for customer_id, evento in eventos:
+                for cola in [*self.suscriptores.get(customer_id, ()), *self.suscriptores.get(TODOS, ())]:
+                    if cola.full():
+                        # La conexión no da abasto: se descarta el evento más viejo
+                        cola.get_nowait()
+                    cola.put_nowait(evento)
+
+
+# Un canal por event loop (uvicorn usa uno por worker; runserver crea uno por solicitud)
+_canales = weakref.WeakKeyDictionary()
+
+
+def canal_actual():
+    loop = asyncio.get_running_loop()
+    if loop not in _canales:
+        _canales[loop] = CanalPedidos()
+    return _canales[loop]
@@ -1,3 +1,283 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Authentication.models import BaseUser
+from Customer.carrito import CarritoDB
+from Customer.models import Customer, Cart, CartItem
+from Delivery_Person.models import Delivery_Person
+from Pedidos.estados import TransicionInvalida, transicionar, transicionar_en_lote, PENDIENTE, COCINA, LISTO, EN_REPARTO, ENTREGADO, CANCELADO
+from Pedidos.models import OrderStatusEvent, Pedido, PedidoFoodItem, ProduccionCocina
+from Pedidos.produccion import ajustar_produccion
+from Pedidos.stream import CursorEventos, leer_eventos
+from RestauranteData.models import FoodItem, Restaurante
+from RestauranteData.stock import items_con_shards
 
 # Create your tests here.
+class ClienteConCarritoMixin:
+
+    def setUp(self):
+        cache.clear()
+        items_con_shards()  # El mapa de items con stock repartido vive en cache
+        self.restaurante = Restaurante.objects.first()
+
+    def crear_cliente_con_carrito(self, username, lineas, stock=5):
+        user = BaseUser.objects.create_user(username=username, email=f'{username}@example.com', password='clave')
+        customer = Customer.objects.create(user=user, restaurante=self.restaurante, phone=12345678, customer_addres='Calle 1')
+        cart = Cart.objects.create(customer=customer)
+        food_items = FoodItem.objects.bulk_create([
+            FoodItem(name=f'{username}-pizza-{n}', description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=stock)
+            for n in range(lineas)
+        ])
+        CartItem.objects.bulk_create([CartItem(cart=cart, food_item=food_item, quantity=2) for food_item in food_items])
+
+        client = APIClient()
+        client.force_authenticate(user)
+        return client, customer
+
+
+class ProcesarPedidoConsultasTests(ClienteConCarritoMixin, TestCase):
+
+    def consultas_checkout(self, username, lineas):
+        client, customer = self.crear_cliente_con_carrito(username, lineas)
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.post('/pedidos/userCartToOrder/', {}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        pedido = Pedido.objects.get(id=response.data['order_id'])
+        self.assertEqual(PedidoFoodItem.objects.filter(pedido=pedido).count(), lineas)
+        self.assertFalse(CartItem.objects.filter(cart__customer=customer).exists())
+        self.assertEqual(
+            list(FoodItem.objects.filter(name__startswith=f'{username}-').values_list('stockRestaurant', flat=True).distinct()),
+            [3]
+        )
+        return len(consultas)
+
+    def test_checkout_usa_las_mismas_consultas_con_1_y_50_lineas(self):
+        # El primer checkout cuenta los pedidos abiertos en la base para la admisión
+        self.consultas_checkout('primero', 1)
+        self.assertEqual(self.consultas_checkout('uno', 1), self.consultas_checkout('cincuenta', 50))
+
+    def test_vaciar_deja_lo_agregado_despues_de_leer_el_carrito(self):
+        _, customer = self.crear_cliente_con_carrito('tarde', 2)
+        carrito = CarritoDB(customer)
+        lineas = carrito.lineas()
+        primera, segunda = (linea.food_item for linea in lineas)
+        nueva = FoodItem.objects.create(name='tarde-postre', description='Flan', category='Postres', unitPrice=4, stockRestaurant=5)
+
+        # Cambios que llegan mientras se procesa el checkout
+        carrito.agregar(segunda.id, 1)
+        carrito.agregar(nueva.id, 3)
+        with transaction.atomic():
+            carrito.vaciar(lineas)
+
+        self.assertEqual(carrito.cantidades(), {segunda.id: 1, nueva.id: 3})
+        self.assertNotIn(primera.id, carrito.cantidades())
+
+
+class IdempotenciaTests(ClienteConCarritoMixin, TestCase):
+
+    def checkout(self, client, key, data=None):
+        return client.post('/pedidos/userCartToOrder/', data or {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_reintento_devuelve_la_primera_respuesta_sin_repetir_el_pedido(self):
+        client, customer = self.crear_cliente_con_carrito('reintento', 2)
+
+        primera = self.checkout(client, 'clave-1')
+        segunda = self.checkout(client, 'clave-1')
+
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda.data['order_id'], primera.data['order_id'])
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pedido.objects.filter(customer=customer).count(), 1)
+
+    def test_la_misma_clave_con_otros_datos_se_rechaza(self):
+        client, _ = self.crear_cliente_con_carrito('otros-datos', 1)
+
+        self.assertEqual(self.checkout(client, 'clave-1').status_code, 201)
+        self.assertEqual(self.checkout(client, 'clave-1', {'address': 'Calle 2'}).status_code, 422)
+
+    def test_un_error_no_se_guarda_y_el_reintento_se_procesa(self):
+        client, customer = self.crear_cliente_con_carrito('sin-stock', 1, stock=1)
+
+        self.assertEqual(self.checkout(client, 'clave-1').status_code, 400)
+        FoodItem.objects.filter(name__startswith='sin-stock-').update(stockRestaurant=5)
+        response = self.checkout(client, 'clave-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Pedido.objects.filter(customer=customer).count(), 1)
+
+
+class AdmisionTests(ClienteConCarritoMixin, TestCase):
+
+    def checkout(self, client):
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post('/pedidos/userCartToOrder/', {}, format='json')
+
+    @override_settings(KITCHEN_MAX_OPEN_ORDERS=1)
+    def test_un_pedido_que_sale_de_cocina_libera_su_lugar(self):
+        primero, _ = self.crear_cliente_con_carrito('primero', 1)
+        segundo, _ = self.crear_cliente_con_carrito('segundo', 1)
+
+        pedido_id = self.checkout(primero).data['order_id']
+        rechazo = self.checkout(segundo)
+        self.assertEqual(rechazo.status_code, 503)
+        self.assertGreaterEqual(int(rechazo['Retry-After']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transicionar(pedido_id, CANCELADO)
+        self.assertEqual(self.checkout(segundo).status_code, 201)
+
+    @override_settings(KITCHEN_MAX_OPEN_UNITS=3)
+    def test_sin_contador_en_cache_cuenta_los_abiertos_en_la_base(self):
+        primero, _ = self.crear_cliente_con_carrito('primero', 1)
+        segundo, _ = self.crear_cliente_con_carrito('segundo', 1)
+        self.assertEqual(self.checkout(primero).status_code, 201)
+
+        # Otro worker, o la cache reiniciada: el pedido abierto se cuenta desde la base
+        cache.clear()
+        self.assertEqual(self.checkout(segundo).status_code, 503)
+
+
+class TransicionesTests(TestCase):
+
+    def setUp(self):
+        user = BaseUser.objects.create_user(username='repartidor', email='repartidor@example.com', password='clave', role='delivery_person')
+        self.repartidor = Delivery_Person.objects.create(user=user, is_online=True)
+
+    def crear_pedido(self):
+        pedido = Pedido.objects.create(description='Pedido', address='Calle 1', status=PENDIENTE)
+        PedidoFoodItem.objects.create(pedido=pedido, food_item_name='muzza', food_item_price=10, quantity=2)
+        ajustar_produccion([pedido.id], 1)
+        return pedido
+
+    def estado(self, pedido):
+        return Pedido.objects.values_list('status', flat=True).get(id=pedido.id)
+
+    def carga(self):
+        return Delivery_Person.objects.values_list('active_orders', flat=True).get(id=self.repartidor.id)
+
+    def en_produccion(self):
+        return ProduccionCocina.objects.values_list('cantidad', flat=True).get(food_item_name='muzza')
+
+    def test_recorrido_completo_mantiene_carga_produccion_y_eventos(self):
+        pedido = self.crear_pedido()
+
+        transicionar(pedido.id, COCINA)
+        self.assertEqual(self.en_produccion(), 2)
+        transicionar(pedido.id, LISTO)
+        self.assertEqual(self.en_produccion(), 0)
+        transicionar(pedido.id, EN_REPARTO, delivery_person=self.repartidor)
+        self.assertEqual(self.carga(), 1)
+        transicionar(pedido.id, ENTREGADO, filtros={'delivery_person': self.repartidor})
+
+        self.assertEqual(self.estado(pedido), ENTREGADO)
+        self.assertEqual(self.carga(), 0)
+        self.assertEqual(self.en_produccion(), 0)
+        self.assertEqual(
+            list(OrderStatusEvent.objects.filter(pedido_id=pedido.id).order_by('id').values_list('status', flat=True)),
+            [COCINA, LISTO, EN_REPARTO, ENTREGADO]
+        )
+
+    def test_cancelar_desde_cocina_descuenta_la_produccion(self):
+        pedido = self.crear_pedido()
+        transicionar(pedido.id, COCINA)
+
+        transicionar(pedido.id, CANCELADO)
+
+        self.assertEqual(self.estado(pedido), CANCELADO)
+        self.assertEqual(self.en_produccion(), 0)
+        self.assertEqual(self.carga(), 0)
+
+    def test_transicion_ilegal_no_cambia_nada(self):
+        pedido = self.crear_pedido()
+
+        with self.assertRaises(TransicionInvalida) as error:
+            transicionar(pedido.id, ENTREGADO)
+
+        self.assertEqual(error.exception.pedido['status'], PENDIENTE)
+        self.assertEqual(self.estado(pedido), PENDIENTE)
+        self.assertFalse(OrderStatusEvent.objects.filter(pedido_id=pedido.id).exists())
+
+    def test_filtros_que_no_coinciden_rechazan_la_transicion(self):
+        pedido = self.crear_pedido()
+        transicionar(pedido.id, COCINA)
+        transicionar(pedido.id, EN_REPARTO, delivery_person=self.repartidor)
+        otro = Delivery_Person.objects.create(user=BaseUser.objects.create_user(username='otro', email='otro@example.com', password='clave'))
+
+        with self.assertRaises(TransicionInvalida):
+            transicionar(pedido.id, ENTREGADO, filtros={'delivery_person': otro})
+        self.assertEqual(self.estado(pedido), EN_REPARTO)
+
+    def test_pedido_inexistente(self):
+        with self.assertRaises(Pedido.DoesNotExist):
+            transicionar(999999, CANCELADO)
+
+    def test_un_solo_update_sobre_el_pedido(self):
+        pedido = self.crear_pedido()
+        transicionar(pedido.id, COCINA)
+        transicionar(pedido.id, EN_REPARTO, delivery_person=self.repartidor)
+
+        # Cancelado es legal desde cuatro estados; aun así el pedido se actualiza una sola vez
+        with CaptureQueriesContext(connection) as consultas:
+            transicionar(pedido.id, CANCELADO)
+
+        updates = [consulta['sql'] for consulta in consultas if consulta['sql'].startswith(f'UPDATE "{Pedido._meta.db_table}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.carga(), 0)
+
+    def test_en_lote_es_todo_o_nada(self):
+        listo, otro_listo, en_cocina = (self.crear_pedido() for _ in range(3))
+        for pedido in (listo, otro_listo):
+            transicionar(pedido.id, COCINA)
+            transicionar(pedido.id, LISTO)
+        transicionar(en_cocina.id, COCINA)
+
+        # Uno de los pedidos ya no está en Listo: no se cambia ninguno
+        self.assertFalse(transicionar_en_lote([listo.id, en_cocina.id], EN_REPARTO, desde=[LISTO], delivery_person=self.repartidor))
+        self.assertEqual(self.estado(listo), LISTO)
+        self.assertEqual(self.estado(en_cocina), COCINA)
+
+        self.assertTrue(transicionar_en_lote([listo.id, otro_listo.id], EN_REPARTO, desde=[LISTO], delivery_person=self.repartidor))
+        self.assertEqual(self.estado(listo), EN_REPARTO)
+        self.assertEqual(self.carga(), 2)
+        self.assertEqual(OrderStatusEvent.objects.filter(status=EN_REPARTO).count(), 2)
+
+
+class CursorEventosTests(TestCase):
+
+    def crear_evento(self, evento_id, hace=0):
+        return OrderStatusEvent.objects.create(
+            id=evento_id, pedido_id=1, status=PENDIENTE, created_at=timezone.now() - timedelta(seconds=hace)
+        )
+
+    def test_un_evento_que_confirma_tarde_no_se_pierde(self):
+        self.crear_evento(1)
+        self.crear_evento(2)
+        self.crear_evento(4)
+
+        eventos, cursor = leer_eventos(CursorEventos(0, ()))
+        self.assertEqual([evento['id'] for evento in eventos], [1, 2, 4])
+        self.assertEqual(cursor, CursorEventos(4, (3,)))
+        self.assertEqual(CursorEventos.desde_texto(str(cursor)), cursor)
+
+        # La transacción que tenía el id 3 confirma después
+        self.crear_evento(3)
+        eventos, cursor = leer_eventos(cursor)
+        self.assertEqual([evento['id'] for evento in eventos], [3])
+        self.assertEqual(cursor, CursorEventos(4, ()))
+
+    def test_un_hueco_viejo_se_descarta(self):
+        self.crear_evento(1, hace=60)
+        # El id 2 nunca se confirma y ya pasó el margen desde el evento siguiente
+        self.crear_evento(3, hace=60)
+        self.crear_evento(5)
+
+        _, cursor = leer_eventos(CursorEventos(0, ()))
+        self.assertEqual(cursor, CursorEventos(5, (4,)))
+
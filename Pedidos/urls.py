@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ProcesarPedidoAPIView,VerPedidoAPIView,ListUserOrdersView,CancelOrderView,DeleteOrderView
+from .views import ProcesarPedidoAPIView,VerPedidoAPIView,ListUserOrdersView,CancelOrderView,DeleteOrderView,StreamOrdersUserView
 
 urlpatterns = [
     path('userCartToOrder/',ProcesarPedidoAPIView.as_view(),name='usercartorder'),
@@ -7,5 +7,6 @@ urlpatterns = [
     path('listUserOrders/',ListUserOrdersView.as_view(),name='listuserorders'),
     path('cancelOrderUser/<int:order_id>/',CancelOrderView.as_view(),name='cancelorderuser'),
     path('deleteOrderUser/<int:order_id>/',DeleteOrderView.as_view(),name='deleteorderuser'),
+    path('streamOrdersUser/',StreamOrdersUserView.as_view(),name='streamordersuser'),
 
 ]
@@ -5,14 +5,31 @@ from Customer.models import Customer,Cart,CartItem,Coupon,LoyaltyPoint
 from Pedidos.models import Pedido,PedidoFoodItem
 from RestauranteData import Food_Item
 from RestauranteData.models import FoodItem
-from decimal import Decimal
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
 from Authentication.models import BaseUser
-from django.db.models import Sum
+from django.db.models import Sum, F
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from RestauranteData.stock import reservar_stock, StockInsuficiente
+from .idempotencia import con_idempotencia, PARAMETRO_IDEMPOTENCY_KEY
+from .direcciones import leer_coordenadas, resolver_coordenadas
+from .estados import transicionar, registrar_eventos, TransicionInvalida, PENDIENTE, CANCELADO, ENTREGADO
+from .produccion import ajustar_produccion
+from .admision import admitir_pedido, liberar_admision, CocinaSaturada
+from Customer.carrito import carrito_de
+from Customer.puntos import canjear_puntos, PuntosInsuficientes
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .stream import canal_actual, cursor_actual, eventos_de_cliente, estado_actual
+import asyncio
+import json
 
 class ProcesarPedidoAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -20,10 +37,13 @@ class ProcesarPedidoAPIView(APIView):
     @swagger_auto_schema(
         operation_description="Procesa un pedido realizado por un cliente, con la opción de usar puntos de lealtad y cupones.",
         operation_id="procesar_pedido",
+        manual_parameters=[PARAMETRO_IDEMPOTENCY_KEY],
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'address': openapi.Schema(type=openapi.TYPE_STRING, description="Dirección del cliente."),
+                'lat': openapi.Schema(type=openapi.TYPE_NUMBER, description="Latitud de la entrega (opcional, junto con lon)."),
+                'lon': openapi.Schema(type=openapi.TYPE_NUMBER, description="Longitud de la entrega (opcional, junto con lat)."),
                 'points_to_use': openapi.Schema(type=openapi.TYPE_INTEGER, description="Puntos de lealtad a usar (opcional)."),
                 'coupon_id': openapi.Schema(type=openapi.TYPE_INTEGER, description="ID del cupón (opcional).")
             },
@@ -32,27 +52,35 @@ class ProcesarPedidoAPIView(APIView):
             201: openapi.Response('Pedido procesado exitosamente', openapi.Schema(type=openapi.TYPE_OBJECT, properties={
                 'message': openapi.Schema(type=openapi.TYPE_STRING),
                 'order_id': openapi.Schema(type=openapi.TYPE_INTEGER),
-                'total_price': openapi.Schema(type=openapi.TYPE_NUMBER, format=openapi.FORMAT_FLOAT)
+                'total_price': openapi.Schema(type=openapi.TYPE_NUMBER, format=openapi.FORMAT_FLOAT),
+                'eta_minutes': openapi.Schema(type=openapi.TYPE_INTEGER, description="Minutos estimados según la carga de la cocina.")
             })),
             400: openapi.Response('Error en el procesamiento del pedido', openapi.Schema(type=openapi.TYPE_OBJECT, properties={
                 'error': openapi.Schema(type=openapi.TYPE_STRING)
             })),
+            503: openapi.Response('La cocina está al máximo de su capacidad; reintentar después del header Retry-After', openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING),
+                'retry_after': openapi.Schema(type=openapi.TYPE_INTEGER, description="Segundos estimados hasta que la cocina vuelva a aceptar pedidos.")
+            })),
         },
         security=[{'Bearer': []}]  # Indica que se necesita un token Bearer
     )
 
+    @con_idempotencia('pedidos.userCartToOrder')
     def post(self, request, *args, **kwargs):
-        customer = get_object_or_404(Customer, user=request.user)
+        # La cantidad de consultas no depende del tamaño del carrito: una lectura de las
+        # líneas con sus FoodItems, un UPDATE de stock, un bulk_create y un DELETE.
+        customer = get_object_or_404(Customer.objects.select_related('user'), user=request.user)
 
         # Validar número de teléfono
         if not customer.phone:
             return Response({"error": "El cliente debe tener un número de teléfono registrado."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Obtener el carrito
-        carrito = get_object_or_404(Cart, customer=customer)
-        cart_items = CartItem.objects.filter(cart=carrito)
+        # Obtener el carrito (de la base o de la cache según CART_BACKEND)
+        carrito = carrito_de(customer)
+        cart_items = carrito.lineas()
 
-        if not cart_items.exists():
+        if not cart_items:
             return Response({"error": "El carrito está vacío."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validar dirección
@@ -60,32 +88,36 @@ class ProcesarPedidoAPIView(APIView):
         if not address:
             return Response({"error": "No hay dirección asociada al pedido."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Validar coordenadas (opcionales); si no vienen se buscan por dirección
+        try:
+            lat, lon = leer_coordenadas(request.data.get("lat"), request.data.get("lon"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         # Obtener puntos de lealtad y cupón
-        loyalty_points = LoyaltyPoint.objects.filter(customer=customer).first()
-        puntos_usar = int(request.data.get("points_to_use", 0))
+        try:
+            puntos_usar = int(request.data.get("points_to_use", 0))
+        except (TypeError, ValueError):
+            puntos_usar = -1
+        if puntos_usar < 0:
+            return Response({"error": "Los puntos a usar deben ser un entero positivo."}, status=status.HTTP_400_BAD_REQUEST)
         coupon_id = request.data.get("coupon_id")
 
-        # Calcular total del carrito
-        total = sum(Decimal(item.food_item.unitPrice) * item.quantity for item in cart_items)
+        # Total del carrito, calculado en Decimal por el backend del carrito
+        total = cart_items[0].total_carrito
 
-        # Verificar stock antes de procesar
-        for item in cart_items:
-            if item.food_item.stockRestaurant < item.quantity:
-                return Response(
-                    {"error": f"Stock insuficiente para {item.food_item.name}. Disponibles: {item.food_item.stockRestaurant}."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        if any(item.quantity < 1 for item in cart_items):
+            return Response({"error": "La cantidad de cada item del carrito debe ser al menos 1."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Calcular descuentos pero no aplicarlos aún
-        descuento_puntos = 0
-        if loyalty_points:
-            if puntos_usar > loyalty_points.points:
-                return Response({"error": "No tienes suficientes puntos de lealtad."}, status=status.HTTP_400_BAD_REQUEST)
-            descuento_puntos = (puntos_usar // 10) * 5  # 10 puntos = 5 dólares
+        # El saldo está materializado en el cliente; el canje lo vuelve a verificar al descontar
+        if puntos_usar > customer.loyalty_balance:
+            return Response({"error": "No tienes suficientes puntos de lealtad."}, status=status.HTTP_400_BAD_REQUEST)
+        descuento_puntos = (puntos_usar // 10) * 5  # 10 puntos = 5 dólares
 
         descuento_cupon = 0
         if coupon_id:
-            coupon = get_object_or_404(Coupon, id=coupon_id)
+            coupon = get_object_or_404(Coupon, id=coupon_id, customer=customer)
             if coupon.is_expired():
                 return Response({"error": "El cupón ha expirado."}, status=status.HTTP_400_BAD_REQUEST)
             descuento_cupon = coupon.discount_amount
@@ -97,44 +129,76 @@ class ProcesarPedidoAPIView(APIView):
                 "error": "El precio mínimo de compra es de $5. Ajusta los puntos o no uses el cupón."
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Aplicar descuentos definitivos
-        if loyalty_points:
-            loyalty_points.points -= puntos_usar
-            loyalty_points.save()
-
-        if coupon_id:
-            coupon.delete()
-
-        # Crear el pedido
-        with transaction.atomic():
-            pedido = Pedido.objects.create(
-                description=f"Pedido de {customer.user.username}",
-                address=address,
-                status="Pendiente",
-                customer=customer,
-                Total=total_final
-            )
-
-            # Crear elementos del pedido y actualizar stock
-            for item in cart_items:
-                PedidoFoodItem.objects.create(
-                    pedido=pedido,
-                    food_item_name=item.food_item.name,
-                    food_item_price=item.food_item.unitPrice,
-                    quantity=item.quantity,
-                    food_item_image=item.food_item.image,
-                    food_item_description=item.food_item.description
+        # Control de admisión: si la cocina ya tiene su máximo de pedidos abiertos se rechaza
+        # antes de tocar la base, con dos INCR en la cache
+        try:
+            admision = admitir_pedido(sum(item.quantity for item in cart_items))
+        except CocinaSaturada as e:
+            response = Response({"error": str(e), "retry_after": e.retry_after}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+        try:
+            with transaction.atomic():
+                # Descontar el stock de todas las líneas en un solo UPDATE condicional;
+                # si alguna no alcanza se revierte todo y no se tocan puntos ni cupón
+                reservar_stock((item.food_item_id, item.quantity) for item in cart_items)
+
+                # Aplicar descuentos definitivos
+                canjear_puntos(customer.id, puntos_usar)
+
+                if coupon_id:
+                    coupon.delete()
+
+                # Crear el pedido
+                lat, lon = resolver_coordenadas(address, lat, lon)
+                pedido = Pedido.objects.create(
+                    description=f"Pedido de {customer.user.username}",
+                    address=address,
+                    status=PENDIENTE,
+                    customer=customer,
+                    Total=total_final,
+                    lat=lat,
+                    lon=lon
                 )
-                item.food_item.stockRestaurant -= item.quantity
-                item.food_item.save()
-
-            # Vaciar el carrito
-            cart_items.delete()
+                registrar_eventos([pedido.id], PENDIENTE)
+
+                # Crear elementos del pedido
+                PedidoFoodItem.objects.bulk_create([
+                    PedidoFoodItem(
+                        pedido=pedido,
+                        food_item_name=item.food_item.name,
+                        food_item_price=item.food_item.unitPrice,
+                        quantity=item.quantity,
+                        food_item_image=item.food_item.image,
+                        food_item_description=item.food_item.description
+                    )
+                    for item in cart_items
+                ])
+                ajustar_produccion([pedido.id], 1)
+
+                # Sacar del carrito lo que se compró; lo agregado después de leerlo queda
+                carrito.vaciar(cart_items)
+        except PuntosInsuficientes:
+            liberar_admision(admision)
+            return Response({"error": "No tienes suficientes puntos de lealtad."}, status=status.HTTP_400_BAD_REQUEST)
+        except StockInsuficiente as e:
+            liberar_admision(admision)
+            faltante = e.faltantes[0]
+            return Response({
+                "error": f"Stock insuficiente para {faltante['name']}. Disponibles: {faltante['available']}.",
+                "insufficient_stock": e.faltantes
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            # El pedido no se creó: se devuelve el lugar reservado en la cocina
+            liberar_admision(admision)
+            raise
 
         return Response({
             "message": "Pedido procesado exitosamente",
             "order_id": pedido.id,
-            "total_price": float(total_final)
+            "total_price": float(total_final),
+            "eta_minutes": admision.eta_minutes
         }, status=status.HTTP_201_CREATED)
 
 #http://127.0.0.1:8000/pedidos/viewOrderUser/id/
@@ -222,7 +286,7 @@ class VerPedidoAPIView(APIView):
             "address": pedido.address,
             "total_price": str(pedido.Total),  # Aseguramos que el total se pase como string
             "food_items": food_items_details,
-            "status": pedido.status
+            "status": pedido.get_status_display()
         }
 
         return Response(response_data, status=status.HTTP_200_OK)
@@ -273,7 +337,7 @@ class ListUserOrdersView(APIView):
         customer = get_object_or_404(Customer, user=request.user)
 
         # Obtener todos los pedidos del cliente
-        pedidos = Pedido.objects.filter(customer=customer)
+        pedidos = Pedido.objects.filter(customer=customer).order_by('created_at')
 
         # Crear la respuesta con la información relevante de los pedidos
         pedidos_data = [
@@ -287,7 +351,7 @@ class ListUserOrdersView(APIView):
                 "phone": customer.phone,
                 "address": pedido.address,
                 "total_price": str(pedido.Total),  # Aseguramos que el total se pase como string
-                "status": pedido.status
+                "status": pedido.get_status_display()
             }
             for pedido in pedidos
         ]
@@ -333,26 +397,27 @@ class CancelOrderView(APIView):
         # Obtener el ID del pedido desde la URL o los parámetros de la solicitud
         order_id = kwargs.get("order_id")
 
-        # Obtener el pedido, asegurándose de que pertenezca al cliente autenticado
-        pedido = get_object_or_404(Pedido, id=order_id, customer=customer)
+        try:
+            # Cambiar el estado a "Cancelado" solo si el pedido es del cliente y todavía se puede cancelar
+            transicionar(order_id, CANCELADO, filtros={'customer': customer})
+        except Pedido.DoesNotExist:
+            raise Http404
+        except TransicionInvalida as e:
+            if e.pedido['customer_id'] != customer.id:
+                raise Http404
 
-        # Verificar si el pedido ya está cancelado o si su estado no permite cancelación
-        if pedido.status == "cancelled":
-            return Response({"detail": "El pedido ya ha sido cancelado."}, status=status.HTTP_400_BAD_REQUEST)
+            # Verificar si el pedido ya está cancelado o si su estado no permite cancelación
+            if e.pedido['status'] == CANCELADO:
+                return Response({"detail": "El pedido ya ha sido cancelado."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if pedido.status == "completed":
             return Response({"detail": "El pedido ya ha sido completado y no puede ser cancelado."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Cambiar el estado del pedido a "cancelado"
-        pedido.status = "cancelled"
-        pedido.save()
-
         # Responder con el pedido actualizado
         response_data = {
-            "order_id": pedido.id,
+            "order_id": order_id,
             "customer_id": customer.id,
             "username": customer.user.username,
-            "status": pedido.status,
+            "status": CANCELADO.label,
         }
 
         return Response(response_data, status=status.HTTP_200_OK)
@@ -391,7 +456,7 @@ class DeleteOrderView(APIView):
         pedido = get_object_or_404(Pedido, id=order_id, customer=customer)
 
         # Verificar si el pedido está en un estado que permita su eliminación
-        if pedido.status not in ["cancelled", "delivered"]:
+        if pedido.status not in [CANCELADO, ENTREGADO]:
             return Response(
                 {"detail": "Primero cancela el pedido o espera que se te entregue."},
                 status=status.HTTP_400_BAD_REQUEST
@@ -401,4 +466,87 @@ class DeleteOrderView(APIView):
         pedido.delete()
 
         # Responder con un mensaje de éxito
-        return Response({"detail": "El pedido ha sido eliminado."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response({"detail": "El pedido ha sido eliminado."}, status=status.HTTP_204_NO_CONTENT)
+
+#http://127.0.0.1:8000/pedidos/streamOrdersUser/?token=<access token>
+class StreamOrdersUserView(View):
+    """
+    Server-Sent Events con los cambios de estado de los pedidos del cliente. Reemplaza el
+    sondeo de viewOrderUser: una conexión abierta recibe cada cambio en cuanto ocurre.
+
+    EventSource no permite cabeceras, así que el token JWT se acepta también en ?token=.
+    Al reconectar, el navegador envía Last-Event-ID y se reenvían los eventos perdidos
+    (alguno del margen anterior puede repetirse; se distinguen por event_id).
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user = await _usuario_del_token(request)
+        if user is None:
+            return JsonResponse({"detail": "Token inválido o ausente."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        customer = await Customer.objects.filter(user=user).afirst()
+        if customer is None:
+            return JsonResponse({"detail": "No encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            ultimo_visto = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            ultimo_visto = None
+
+        canal = canal_actual()
+        cola = canal.suscribir(customer.id, await cursor_actual())
+
+        async def eventos():
+            # Los eventos pueden llegar con ids fuera de orden (transacciones que confirman tarde),
+            # así que el id de cada mensaje es el mayor enviado hasta ahora: al reconectar,
+            # eventos_de_cliente vuelve a leer un margen por detrás de él
+            mayor = ultimo_visto or 0
+            reenviados = set()
+            try:
+                if ultimo_visto is not None:
+                    pendientes = await eventos_de_cliente(customer.id, ultimo_visto)
+                    for evento in pendientes:
+                        reenviados.add(evento['event_id'])
+                        mayor = max(mayor, evento['event_id'])
+                        yield _mensaje_sse(evento, 'status', mayor)
+                else:
+                    yield _mensaje_sse(await estado_actual(customer.id), 'snapshot')
+
+                while True:
+                    try:
+                        evento = await asyncio.wait_for(cola.get(), timeout=settings.ORDER_STREAM_PING_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ': ping\n\n'
+                        continue
+                    # Un evento puede llegar por la reanudación y también por el canal
+                    if evento['event_id'] in reenviados:
+                        continue
+                    mayor = max(mayor, evento['event_id'])
+                    yield _mensaje_sse(evento, 'status', mayor)
+            finally:
+                canal.desuscribir(customer.id, cola)
+
+        response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Que nginx no acumule la respuesta
+        return response
+
+
+def _mensaje_sse(datos, evento, evento_id=None):
+    mensaje = f"event: {evento}\n"
+    if evento_id is not None:
+        mensaje += f"id: {evento_id}\n"
+    return mensaje + f"data: {json.dumps(datos)}\n\n"
+
+
+@sync_to_async
+def _usuario_del_token(request):
+    autenticacion = JWTAuthentication()
+    token = request.GET.get('token')
+    try:
+        if token:
+            return autenticacion.get_user(autenticacion.get_validated_token(token))
+        resultado = autenticacion.authenticate(request)
+        return resultado[0] if resultado else None
+    except (InvalidToken, AuthenticationFailed):
+        return None
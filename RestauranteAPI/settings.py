@@ -101,6 +101,30 @@ DATABASES = {
 #DATABASES = { 'default': { 'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'), } }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# LocMemCache es por proceso; con varios workers de gunicorn se debe definir REDIS_URL
+# para que todos compartan la misma versión del menú, los mismos datos cacheados y los
+# contadores de pedidos abiertos de la admisión de la cocina. Sin REDIS_URL cada worker
+# tiene su propio menu:version y invalidar_menu solo llega al worker que hizo el cambio.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'restaurante-api',
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+MENU_CACHE_TIMEOUT = 60 * 60 * 24  # Los snapshots se invalidan por versión, no por tiempo
+MENU_STOCK_TIMEOUT = 5  # Vida del stock que se superpone al snapshot del menú; cada pedido lo borra en su worker
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -177,3 +201,24 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 CSRF_TRUSTED_ORIGINS = [
     'http://*','https://web-production-3c69.up.railway.app'
 ]
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)  # Tiempo que se guarda la respuesta de una Idempotency-Key
+
+DISPATCH_DRIVER_CAPACITY = None  # Máximo de pedidos en reparto por repartidor en el despacho en lote (None = sin límite)
+DRIVER_HEARTBEAT_TTL = 45  # Segundos sin latido tras los que un repartidor deja de estar online
+DRIVER_GRID_CELL_DEGREES = 0.01  # Lado de cada celda de la grilla de repartidores (~1 km)
+DRIVER_GRID_REFRESH = 5  # Segundos que cada proceso reutiliza su grilla antes de reconstruirla
+DISPATCH_NEAREST_K = 5  # Repartidores cercanos que se consideran al asignar un pedido con coordenadas
+DISPATCH_TRIP_CELL_DEGREES = 0.02  # Zona (~2 km) dentro de la cual los pedidos listos se agrupan en un viaje
+DISPATCH_TRIP_WINDOW_SECONDS = 600  # Diferencia máxima entre los pedidos listos de un mismo viaje
+DISPATCH_TRIP_MAX_STOPS = 4  # Paradas máximas por viaje
+ORDER_STREAM_POLL_SECONDS = 1  # Cada cuánto el canal de cada worker lee los eventos nuevos para las conexiones SSE
+ORDER_STREAM_PING_SECONDS = 15  # Comentario SSE que mantiene viva la conexión a través de proxies
+KITCHEN_MAX_OPEN_ORDERS = None  # Pedidos abiertos (Pendiente o Cocina) que admite la cocina en el checkout (None = sin límite); requiere REDIS_URL con varios workers
+KITCHEN_MAX_OPEN_UNITS = None  # Unidades de platos abiertas que admite la cocina (None = sin límite)
+KITCHEN_CLEAR_SECONDS = 900  # Tiempo que tarda la cocina en despachar una carga completa; escala el ETA y el Retry-After
+KITCHEN_PREP_MINUTES = 20  # Tiempo base de preparación que se suma a la demora por carga en el ETA cotizado
+CART_BACKEND = os.getenv('CART_BACKEND', 'db')  # 'db' escribe cada cambio en CartItem; 'cache' guarda el carrito vivo en la cache (requiere REDIS_URL con varios workers)
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # Vida de un carrito en la cache; `guardar_carritos` lo persiste antes de que venza
+CART_ITEM_TTL = timedelta(days=30)  # Items de carrito sin cambios durante este tiempo se consideran abandonados
+MENU_TOMBSTONE_TTL = timedelta(days=30)  # Borrados de FoodItem que se guardan para menu_manager/changes/; un cursor más viejo recibe 410
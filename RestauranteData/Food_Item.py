@@ -9,6 +9,39 @@ class FoodItem(models.Model):
     stockRestaurant = models.IntegerField(default=0);
     image = models.ImageField(upload_to='food_items/',null=True,blank=True)
     isActive = models.BooleanField(default=True)
+    stockShards = models.PositiveSmallIntegerField(default=0)  # >0: el stock vive en FoodItemStockShard
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Cursor de menu_manager/changes/
+
+    class Meta:
+        constraints = [
+            # Respaldo en la base de datos del UPDATE condicional de RestauranteData/stock.py
+            models.CheckConstraint(condition=models.Q(stockRestaurant__gte=0), name='fooditem_stock_no_negativo'),
+        ]
 
     def _str_(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+#registro de los items borrados para que los clientes que sincronizan por cambios se enteren
+class FoodItemTombstone(models.Model):
+    food_item_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"FoodItem {self.food_item_id} borrado"
+
+#parte del stock de un item muy pedido; el stock disponible es la suma de sus shards
+class FoodItemStockShard(models.Model):
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Los descuentos lo fijan a mano: el feed de cambios lo usa
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['food_item', 'shard'], name='fooditemstockshard_unico'),
+            models.CheckConstraint(condition=models.Q(stock__gte=0), name='fooditemstockshard_stock_no_negativo'),
+        ]
+
+    def __str__(self):
+        return f"{self.food_item_id}#{self.shard} - {self.stock}"
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+def corregir_stock_negativo(apps, schema_editor):
+    # El descuento anterior (leer, restar y guardar) pudo dejar stock negativo
+    FoodItem = apps.get_model('RestauranteData', 'FoodItem')
+    FoodItem.objects.filter(stockRestaurant__lt=0).update(stockRestaurant=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RestauranteData', '0008_fooditem_change_tracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(corregir_stock_negativo, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fooditem',
+            constraint=models.CheckConstraint(condition=models.Q(('stockRestaurant__gte', 0)), name='fooditem_stock_no_negativo'),
+        ),
+    ]
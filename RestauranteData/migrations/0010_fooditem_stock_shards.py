@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RestauranteData', '0009_fooditem_stock_no_negativo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='stockShards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FoodItemStockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField(default=0)),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='RestauranteData.fooditem')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('food_item', 'shard'), name='fooditemstockshard_unico'), models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='fooditemstockshard_stock_no_negativo')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RestauranteData', '0010_fooditem_stock_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditemstockshard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -1,6 +1,6 @@
 #RestauranteData/models.py
 from django.db import models
-from .Food_Item import FoodItem
+from .Food_Item import FoodItem, FoodItemTombstone, FoodItemStockShard
 # Create your models here.
 #modelo para el restaurante en general
 class Restaurante(models.Model):
@@ -0,0 +1,275 @@
+#RestauranteData/stock.py
+import random
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+from Menu_Manager.menu_cache import invalidar_menu, invalidar_stock_menu
+from .Food_Item import FoodItem, FoodItemStockShard
+
+# {food_item_id: cantidad de shards} de los items que usan contadores repartidos. Con la
+# cache local de cada proceso el mapa puede estar viejo hasta SHARDS_TIMEOUT segundos, así
+# que reservar_stock solo lo usa para elegir por dónde empezar y confirma el modo con la base.
+SHARDS_KEY = 'stock:shards'
+SHARDS_TIMEOUT = 60
+# Total cacheado del stock repartido de un item; se borra en cada descuento
+TOTAL_KEY = 'stock:total:{}'
+TOTAL_TIMEOUT = 30
+MAX_SHARDS = 64
+# Vueltas de UPDATE + relectura si la relectura no encuentra la línea que faltó
+INTENTOS_RESERVA = 3
+
+
+class StockInsuficiente(Exception):
+    """Una o más líneas del pedido no tienen stock suficiente. Nada se descontó."""
+
+    def __init__(self, faltantes):
+        # Lista de {'food_item_id', 'name', 'requested', 'available'}
+        self.faltantes = faltantes
+        super().__init__(", ".join(f"{f['name']} ({f['available']}/{f['requested']})" for f in faltantes))
+
+
+def _agrupar(lineas):
+    cantidades = {}
+    for food_item_id, cantidad in lineas:
+        if cantidad < 1:
+            raise ValueError("La cantidad de cada línea debe ser al menos 1.")
+        cantidades[food_item_id] = cantidades.get(food_item_id, 0) + cantidad
+    return cantidades
+
+
+def items_con_shards():
+    """Devuelve {food_item_id: num_shards} de los items en modo repartido (cacheado)."""
+    shards = cache.get(SHARDS_KEY)
+    if shards is None:
+        shards = dict(FoodItem.objects.filter(stockShards__gt=0).values_list('id', 'stockShards'))
+        cache.set(SHARDS_KEY, shards, SHARDS_TIMEOUT)
+    return shards
+
+
+def _olvidar_totales(food_item_ids):
+    cache.delete_many([TOTAL_KEY.format(food_item_id) for food_item_id in food_item_ids])
+
+
+def stock_disponible(food_item_ids):
+    """Stock total de items repartidos, {food_item_id: stock}, leyendo primero los totales cacheados."""
+    keys = {TOTAL_KEY.format(food_item_id): food_item_id for food_item_id in food_item_ids}
+    totales = {keys[key]: total for key, total in cache.get_many(list(keys)).items()}
+
+    faltan = [food_item_id for food_item_id in food_item_ids if food_item_id not in totales]
+    if faltan:
+        sumas = dict(
+            FoodItemStockShard.objects.filter(food_item_id__in=faltan)
+                                      .values_list('food_item_id')
+                                      .annotate(total=Sum('stock'))
+        )
+        nuevos = {food_item_id: sumas.get(food_item_id, 0) for food_item_id in faltan}
+        cache.set_many({TOTAL_KEY.format(food_item_id): total for food_item_id, total in nuevos.items()}, TOTAL_TIMEOUT)
+        totales.update(nuevos)
+    return totales
+
+
+def completar_stock(items):
+    """Reemplaza stockRestaurant por el total de los shards en los items serializados que lo usan."""
+    # El modo se lee de la base y no del mapa cacheado: lo que se muestra no puede estar viejo
+    shards = set(FoodItem.objects.filter(stockShards__gt=0).values_list('id', flat=True))
+    ids = [item['id'] for item in items if item['id'] in shards]
+    if ids:
+        totales = stock_disponible(ids)
+        for item in items:
+            if item['id'] in totales:
+                item['stockRestaurant'] = totales[item['id']]
+    return items
+
+
+class _UpdateIncompleto(Exception):
+    """Alguna fila no cumplió stockRestaurant >= cantidad; revierte el savepoint del UPDATE."""
+
+
+# _reservar_en_shards lo devuelve cuando el item ya no tiene shards (el mapa estaba viejo)
+SIN_SHARDS = object()
+
+
+def _reservar_sin_shards(cantidades):
+    """
+    Descuenta de stockRestaurant con un UPDATE condicional. Devuelve (faltantes, a_shards):
+    a_shards son las líneas de items que la base dice que están en modo repartido y que el
+    llamador tiene que descontar de sus shards.
+    """
+    a_shards = {}
+    lineas = []
+    for _ in range(INTENTOS_RESERVA):
+        if not cantidades:
+            return [], a_shards
+        cantidad = Case(
+            *[When(id=food_item_id, then=Value(cantidad)) for food_item_id, cantidad in cantidades.items()],
+            output_field=IntegerField(),
+        )
+        try:
+            # Savepoint: si falta alguna línea se deshace lo descontado a las demás, así la
+            # relectura ve el stock que tenía cada item antes de este pedido
+            with transaction.atomic():
+                actualizados = FoodItem.objects.filter(
+                    id__in=cantidades, stockShards=0, stockRestaurant__gte=cantidad
+                ).update(
+                    stockRestaurant=F('stockRestaurant') - cantidad,
+                    updated_at=timezone.now(),
+                )
+                if actualizados != len(cantidades):
+                    raise _UpdateIncompleto
+            return [], a_shards
+        except _UpdateIncompleto:
+            pass
+
+        filas = {
+            item['id']: item
+            for item in FoodItem.objects.filter(id__in=cantidades).values('id', 'name', 'stockRestaurant', 'stockShards')
+        }
+        for food_item_id, fila in filas.items():
+            if fila['stockShards']:
+                a_shards[food_item_id] = cantidades[food_item_id]
+        cantidades = {food_item_id: cantidad for food_item_id, cantidad in cantidades.items() if food_item_id not in a_shards}
+
+        lineas = [
+            {
+                'food_item_id': food_item_id,
+                'name': filas[food_item_id]['name'] if food_item_id in filas else None,
+                'requested': cantidad,
+                'available': filas[food_item_id]['stockRestaurant'] if food_item_id in filas else 0,
+            }
+            for food_item_id, cantidad in cantidades.items()
+        ]
+        faltantes = [linea for linea in lineas if linea['available'] < linea['requested']]
+        if faltantes:
+            return faltantes, a_shards
+        # Se reintenta sin las líneas que pasaron a shards, o porque entre el UPDATE y la
+        # relectura otro pedido devolvió o repuso stock
+
+    # El stock sigue cambiando bajo el pedido; se rechaza completo sin descontar nada
+    return lineas, a_shards
+
+
+def _reservar_en_shards(food_item_id, cantidad):
+    shards = list(FoodItemStockShard.objects.filter(food_item_id=food_item_id).values_list('shard', 'stock'))
+    if not shards:
+        return SIN_SHARDS
+
+    # Caso común: se prueba al azar entre los shards que alcanzan solos; cada intento bloquea
+    # una sola fila y solo falla si otro pedido vació ese shard entre la lectura y el UPDATE
+    candidatos = [shard for shard, stock in shards if stock >= cantidad]
+    random.shuffle(candidatos)
+    for shard in candidatos[:INTENTOS_RESERVA]:
+        if FoodItemStockShard.objects.filter(food_item_id=food_item_id, shard=shard, stock__gte=cantidad)\
+                                     .update(stock=F('stock') - cantidad, updated_at=timezone.now()):
+            return None
+
+    # Ningún shard alcanza solo: se bloquean todos y se descuenta repartido
+    shards = list(FoodItemStockShard.objects.select_for_update().filter(food_item_id=food_item_id).order_by('shard'))
+    disponible = sum(fila.stock for fila in shards)
+    if disponible < cantidad:
+        return {
+            'food_item_id': food_item_id,
+            'name': FoodItem.objects.filter(id=food_item_id).values_list('name', flat=True).first(),
+            'requested': cantidad,
+            'available': disponible,
+        }
+
+    ahora = timezone.now()
+    restante = cantidad
+    for fila in shards:
+        descuento = min(fila.stock, restante)
+        fila.stock -= descuento
+        fila.updated_at = ahora
+        restante -= descuento
+    FoodItemStockShard.objects.bulk_update(shards, ['stock', 'updated_at'])
+    return None
+
+
+def reservar_stock(lineas):
+    """
+    Descuenta el stock de todas las líneas de un pedido. Los items normales se descuentan
+    con un solo UPDATE condicional (stockRestaurant >= cantidad por fila); los items en modo
+    repartido descuentan de un shard al azar de los que tienen lugar. Si alguna línea no
+    alcanza se lanza StockInsuficiente y la transacción del llamador se revierte completa.
+
+    lineas: iterable de (food_item_id, cantidad). Debe usarse dentro de transaction.atomic()
+    y capturar StockInsuficiente fuera del bloque atómico.
+    """
+    cantidades = _agrupar(lineas)
+    if not cantidades:
+        return
+
+    shards = items_con_shards()
+    normales = {food_item_id: cantidad for food_item_id, cantidad in cantidades.items() if food_item_id not in shards}
+    repartidos = {}
+
+    with transaction.atomic(savepoint=False):
+        faltantes = []
+        for food_item_id, cantidad in cantidades.items():
+            if food_item_id in normales:
+                continue
+            faltante = _reservar_en_shards(food_item_id, cantidad)
+            if faltante is SIN_SHARDS:
+                # El item dejó de estar repartido después de que se cacheó el mapa
+                normales[food_item_id] = cantidad
+            elif faltante:
+                faltantes.append(faltante)
+            else:
+                repartidos[food_item_id] = cantidad
+
+        if normales:
+            faltantes_normales, a_shards = _reservar_sin_shards(normales)
+            faltantes += faltantes_normales
+            for food_item_id, cantidad in a_shards.items():
+                # El item pasó a modo repartido después de que se cacheó el mapa
+                del normales[food_item_id]
+                faltante = _reservar_en_shards(food_item_id, cantidad)
+                if faltante is SIN_SHARDS:
+                    faltante = {'food_item_id': food_item_id, 'name': None, 'requested': cantidad, 'available': 0}
+                if faltante:
+                    faltantes.append(faltante)
+                else:
+                    repartidos[food_item_id] = cantidad
+            if a_shards:
+                transaction.on_commit(lambda: cache.delete(SHARDS_KEY))
+
+        if faltantes:
+            raise StockInsuficiente(faltantes)
+
+        if repartidos:
+            transaction.on_commit(lambda: _olvidar_totales(repartidos))
+        # El menú vuelve a leer el stock (una consulta) sin rearmar el snapshot
+        transaction.on_commit(invalidar_stock_menu)
+
+
+def repartir_stock(food_item_id, num_shards, total=None):
+    """
+    Activa (num_shards > 0), cambia o desactiva (num_shards = 0) el modo repartido de un item.
+    Si no se indica total se conserva el stock actual; si se indica, se reemplaza (reposición).
+    """
+    if not 0 <= num_shards <= MAX_SHARDS:
+        raise ValueError(f"La cantidad de shards debe estar entre 0 y {MAX_SHARDS}.")
+
+    with transaction.atomic():
+        food_item = FoodItem.objects.select_for_update().get(id=food_item_id)
+        shards = list(FoodItemStockShard.objects.select_for_update().filter(food_item=food_item))
+        if total is None:
+            total = sum(fila.stock for fila in shards) if food_item.stockShards else food_item.stockRestaurant
+
+        FoodItemStockShard.objects.filter(food_item=food_item).delete()
+        if num_shards:
+            base, resto = divmod(total, num_shards)
+            FoodItemStockShard.objects.bulk_create([
+                FoodItemStockShard(food_item=food_item, shard=shard, stock=base + (1 if shard < resto else 0))
+                for shard in range(num_shards)
+            ])
+
+        # En modo repartido la columna queda en 0 y el stock real está en los shards
+        food_item.stockShards = num_shards
+        food_item.stockRestaurant = 0 if num_shards else total
+        food_item.save(update_fields=['stockShards', 'stockRestaurant', 'updated_at'])
+
+        transaction.on_commit(lambda: cache.delete(SHARDS_KEY))
+        transaction.on_commit(lambda: _olvidar_totales([food_item_id]))
+        transaction.on_commit(invalidar_menu)
+    return total
@@ -1,3 +1,142 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+from .Food_Item import FoodItem, FoodItemStockShard, FoodItemTombstone
+from .stock import SHARDS_KEY, StockInsuficiente, repartir_stock, reservar_stock, stock_disponible
 
 # Create your tests here.
+class ReservarStockTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def crear_item(self, name, stock):
+        return FoodItem.objects.create(name=name, description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=stock)
+
+    def stock(self, food_item):
+        return FoodItem.objects.values_list('stockRestaurant', flat=True).get(id=food_item.id)
+
+    def test_descuenta_todas_las_lineas(self):
+        muzza = self.crear_item('muzza', 5)
+        fugazza = self.crear_item('fugazza', 3)
+
+        with transaction.atomic():
+            reservar_stock([(muzza.id, 2), (fugazza.id, 3), (muzza.id, 1)])
+
+        self.assertEqual(self.stock(muzza), 2)
+        self.assertEqual(self.stock(fugazza), 0)
+
+    def test_informa_solo_las_lineas_sin_stock_y_no_descuenta_nada(self):
+        muzza = self.crear_item('muzza', 5)
+        fugazza = self.crear_item('fugazza', 1)
+
+        with self.assertRaises(StockInsuficiente) as error:
+            with transaction.atomic():
+                reservar_stock([(muzza.id, 2), (fugazza.id, 3)])
+
+        self.assertEqual(error.exception.faltantes, [
+            {'food_item_id': fugazza.id, 'name': 'fugazza', 'requested': 3, 'available': 1},
+        ])
+        self.assertEqual(self.stock(muzza), 5)
+        self.assertEqual(self.stock(fugazza), 1)
+
+    def test_la_base_rechaza_stock_negativo(self):
+        muzza = self.crear_item('muzza', 1)
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                FoodItem.objects.filter(id=muzza.id).update(stockRestaurant=-1)
+
+    def test_stock_repartido_descuenta_de_los_shards(self):
+        muzza = self.crear_item('muzza', 10)
+        repartir_stock(muzza.id, 4)
+
+        with transaction.atomic():
+            reservar_stock([(muzza.id, 3)])
+        with transaction.atomic():
+            # Ningún shard tiene 6 solo: se descuenta repartido entre varios
+            reservar_stock([(muzza.id, 6)])
+
+        self.assertEqual(stock_disponible([muzza.id]), {muzza.id: 1})
+        self.assertEqual(self.stock(muzza), 0)
+
+        with self.assertRaises(StockInsuficiente) as error:
+            with transaction.atomic():
+                reservar_stock([(muzza.id, 2)])
+        self.assertEqual(error.exception.faltantes[0]['available'], 1)
+        self.assertEqual(sum(FoodItemStockShard.objects.filter(food_item=muzza).values_list('stock', flat=True)), 1)
+
+    def test_mapa_de_shards_viejo_no_rompe_la_reserva(self):
+        muzza = self.crear_item('muzza', 10)
+        repartir_stock(muzza.id, 3)
+        # Otro proceso todavía no sabe que el item está repartido
+        cache.set(SHARDS_KEY, {}, None)
+        with transaction.atomic():
+            reservar_stock([(muzza.id, 2)])
+        self.assertEqual(stock_disponible([muzza.id]), {muzza.id: 8})
+
+        repartir_stock(muzza.id, 0)
+        # Y otro todavía cree que lo está
+        cache.set(SHARDS_KEY, {muzza.id: 3}, None)
+        with transaction.atomic():
+            reservar_stock([(muzza.id, 2)])
+        self.assertEqual(self.stock(muzza), 6)
+
+
+class MenuChangesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ahora = timezone.now()
+
+    def crear_item(self, name, hace):
+        food_item = FoodItem.objects.create(name=name, description='Pizza', category='Pizzas', unitPrice=10, stockRestaurant=10)
+        # updated_at es auto_now: la fecha vieja se escribe con update
+        FoodItem.objects.filter(id=food_item.id).update(updated_at=self.ahora - hace)
+        return food_item
+
+    def cambios(self, desde):
+        return self.client.get('/menu_manager/changes/', {'since': str(int(desde.timestamp() * 1_000_000))})
+
+    def ids(self, response):
+        return sorted(item['id'] for item in response.data['updated'])
+
+    def test_el_margen_devuelve_los_cambios_de_los_segundos_previos_al_cursor(self):
+        dentro = self.crear_item('dentro', timedelta(seconds=3))
+        self.crear_item('fuera', timedelta(seconds=10))
+
+        response = self.cambios(self.ahora)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response), [dentro.id])
+
+    def test_cursor_mas_viejo_que_los_borrados_guardados(self):
+        self.assertEqual(self.cambios(self.ahora - settings.MENU_TOMBSTONE_TTL - timedelta(minutes=1)).status_code, 410)
+        self.assertEqual(self.client.get('/menu_manager/changes/', {'since': 'x'}).status_code, 400)
+
+    def test_los_borrados_se_informan(self):
+        borrado = self.crear_item('borrado', timedelta(days=1))
+        self.assertEqual(self.client.delete(f'/menu_manager/deleteFoodItem/{borrado.id}/').status_code, 204)
+        FoodItemTombstone.objects.create(food_item_id=999)
+        FoodItemTombstone.objects.filter(food_item_id=999).update(deleted_at=self.ahora - timedelta(days=1))
+
+        response = self.cambios(self.ahora)
+        self.assertEqual(response.data['deleted'], [borrado.id])
+        self.assertEqual(response.data['updated'], [])
+
+    def test_una_venta_de_un_item_repartido_lo_marca_como_cambiado(self):
+        repartido = self.crear_item('repartido', timedelta(days=1))
+        repartir_stock(repartido.id, 2)
+        FoodItem.objects.filter(id=repartido.id).update(updated_at=self.ahora - timedelta(days=1))
+        FoodItemStockShard.objects.update(updated_at=self.ahora - timedelta(days=1))
+        self.assertEqual(self.ids(self.cambios(self.ahora)), [])
+
+        with transaction.atomic():
+            reservar_stock([(repartido.id, 3)])
+
+        response = self.cambios(self.ahora)
+        self.assertEqual(self.ids(response), [repartido.id])
+        self.assertEqual(response.data['updated'][0]['stockRestaurant'], 7)
+